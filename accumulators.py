@@ -0,0 +1,247 @@
+"""
+--------------------------------------------------------------------------------
+Streaming accumulators for metrics over repeated trials.
+--------------------------------------------------------------------------------
+
+Description: Aggregates metric values as trials complete instead of keeping
+per-trial lists until the end of a run.  RunningStats keeps count, mean and
+variance (Welford's update, Chan's merge) plus min/max; QuantileSketch keeps
+a bounded set of weighted centroids for approximate quantiles.  Both can be
+merged (e.g. partial results of separate workers or runs) and converted to
+and from plain dicts for checkpointing.  Accumulators holds one of each per
+named quantity (e.g. 'magic/nmse') and formats a progress line with the
+confidence interval of every mean.
+
+Usage:
+	acc = accumulators.Accumulators()
+	acc.add('magic/nmse', 0.12)
+	print(acc.progress())
+	store.put(job, result, meta={'accumulators': acc.toDict()})
+
+Requirements: math, numpy, scipy
+
+File: accumulators.py
+--------------------------------------------------------------------------------
+"""
+
+import math
+
+import numpy as np
+
+
+# centroids kept by a quantile sketch (values are exact up to twice this many)
+SKETCH_SIZE				=		100
+
+# default confidence level for interval half-widths
+CONFIDENCE				=		0.95
+
+
+class RunningStats:
+	""" Count, mean, variance, min and max of a stream of values. """
+
+	def __init__(self):
+		self.count = 0
+		self.mean = 0.0
+		self.m2 = 0.0	# sum of squared deviations from the mean
+		self.min = math.inf
+		self.max = -math.inf
+
+	def update(self, x):
+		""" Adds one value or an array of values. """
+		x = np.asarray(x, dtype=float).reshape(-1)
+		if len(x) == 1:
+			self.count += 1
+			delta = x[0] - self.mean
+			self.mean += delta / self.count
+			self.m2 += delta * (x[0] - self.mean)
+			self.min = min(self.min, x[0])
+			self.max = max(self.max, x[0])
+		elif len(x) > 1:
+			batch = RunningStats()
+			batch.count = len(x)
+			batch.mean = float(np.mean(x))
+			batch.m2 = float(np.sum((x - batch.mean) ** 2))
+			batch.min = float(np.min(x))
+			batch.max = float(np.max(x))
+			self.merge(batch)
+		return self
+
+	def merge(self, other):
+		""" Adds the values summarized by another RunningStats. """
+		if other.count == 0:
+			return self
+		n = self.count + other.count
+		delta = other.mean - self.mean
+
+		self.mean += delta * other.count / n
+		self.m2 += other.m2 + delta*delta * self.count * other.count / n
+		self.count = n
+		self.min = min(self.min, other.min)
+		self.max = max(self.max, other.max)
+		return self
+
+	@property
+	def variance(self):
+		""" Population variance (as np.var). """
+		return self.m2 / self.count if self.count > 0 else math.nan
+
+	@property
+	def std(self):
+		""" Population standard deviation (as np.std). """
+		return math.sqrt(self.variance) if self.count > 0 else math.nan
+
+	def halfWidth(self, confidence=CONFIDENCE):
+		""" Half-width of the Student t confidence interval on the mean. """
+		if self.count < 2:
+			return math.inf
+		# scipy.stats is slow to import, so it is only loaded for intervals
+		from scipy.stats import t as student
+
+		s2 = self.m2 / (self.count - 1)
+		return float(student.ppf(0.5 + confidence/2, self.count - 1)) * math.sqrt(s2 / self.count)
+
+	def toDict(self):
+		return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max}
+
+	@classmethod
+	def fromDict(cls, d):
+		stats = cls()
+		stats.count = int(d['count'])
+		stats.mean = float(d['mean'])
+		stats.m2 = float(d['m2'])
+		stats.min = float(d['min'])
+		stats.max = float(d['max'])
+		return stats
+
+
+class QuantileSketch:
+	"""
+	Approximate quantiles from at most 2*size weighted centroids.  Exact while
+	no more than 2*size values have been added.
+	"""
+
+	def __init__(self, size=SKETCH_SIZE):
+		self.size = size
+		self.values = np.zeros(0)
+		self.weights = np.zeros(0)
+
+	def _compress(self):
+		""" Merges neighbouring centroids into size groups of equal weight. """
+		order = np.argsort(self.values, kind='stable')
+		v = self.values[order]
+		w = self.weights[order]
+
+		cum = np.cumsum(w)
+		groups = np.minimum(((cum - w/2) / cum[-1] * self.size).astype(int), self.size - 1)
+
+		weights = np.bincount(groups, weights=w, minlength=self.size)
+		values = np.bincount(groups, weights=w*v, minlength=self.size)
+		keep = weights > 0
+
+		self.weights = weights[keep]
+		self.values = values[keep] / self.weights
+
+	def update(self, x):
+		""" Adds one value or an array of values. """
+		x = np.asarray(x, dtype=float).reshape(-1)
+		self.values = np.concatenate([self.values, x])
+		self.weights = np.concatenate([self.weights, np.ones(len(x))])
+		if len(self.values) > 2*self.size:
+			self._compress()
+		return self
+
+	def merge(self, other):
+		self.values = np.concatenate([self.values, other.values])
+		self.weights = np.concatenate([self.weights, other.weights])
+		if len(self.values) > 2*self.size:
+			self._compress()
+		return self
+
+	def quantile(self, q):
+		""" Approximate q-quantile(s), q in [0, 1]. """
+		if len(self.values) == 0:
+			return math.nan
+		order = np.argsort(self.values, kind='stable')
+		v = self.values[order]
+		w = self.weights[order]
+
+		# each centroid sits at the middle of its share of the total weight
+		mid = (np.cumsum(w) - w/2) / np.sum(w)
+
+		return np.interp(q, mid, v)
+
+	def toDict(self):
+		return {'size': self.size, 'values': self.values.tolist(), 'weights': self.weights.tolist()}
+
+	@classmethod
+	def fromDict(cls, d):
+		sketch = cls(int(d['size']))
+		sketch.values = np.array(d['values'], dtype=float)
+		sketch.weights = np.array(d['weights'], dtype=float)
+		return sketch
+
+
+class Accumulators:
+	""" RunningStats and QuantileSketch per named quantity, in insertion order. """
+
+	def __init__(self):
+		self.stats = {}
+		self.sketches = {}
+
+	def add(self, name, x):
+		if name not in self.stats:
+			self.stats[name] = RunningStats()
+			self.sketches[name] = QuantileSketch()
+		self.stats[name].update(x)
+		self.sketches[name].update(x)
+
+	def addAll(self, values, prefix=''):
+		""" Adds every entry of a {name: value} dict. """
+		for (name, x) in values.items():
+			self.add(prefix + name, x)
+
+	def __contains__(self, name):
+		return name in self.stats
+
+	def __getitem__(self, name):
+		return self.stats[name]
+
+	def names(self):
+		return list(self.stats.keys())
+
+	def quantile(self, name, q):
+		return self.sketches[name].quantile(q)
+
+	def merge(self, other):
+		for name in other.stats:
+			if name not in self.stats:
+				self.stats[name] = RunningStats()
+				self.sketches[name] = QuantileSketch(other.sketches[name].size)
+			self.stats[name].merge(other.stats[name])
+			self.sketches[name].merge(other.sketches[name])
+		return self
+
+	def progress(self, names=None, confidence=CONFIDENCE):
+		""" One line per quantity: mean +/- CI half-width, median and count. """
+		if names is None:
+			names = self.names()
+
+		lines = []
+		for name in names:
+			s = self.stats[name]
+			lines.append('{:<20}{:.4f} +/- {:.4f}  (median {:.4f}, n={:d})'.format(name,
+				s.mean, s.halfWidth(confidence), float(self.quantile(name, 0.5)), s.count))
+
+		return '\n'.join(lines)
+
+	def toDict(self):
+		return {name: {'stats': self.stats[name].toDict(), 'sketch': self.sketches[name].toDict()}
+			for name in self.stats}
+
+	@classmethod
+	def fromDict(cls, d):
+		acc = cls()
+		for (name, entry) in d.items():
+			acc.stats[name] = RunningStats.fromDict(entry['stats'])
+			acc.sketches[name] = QuantileSketch.fromDict(entry['sketch'])
+		return acc
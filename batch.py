@@ -0,0 +1,285 @@
+"""
+--------------------------------------------------------------------------------
+Cross-patient batch runner for the driver scripts.
+--------------------------------------------------------------------------------
+
+usage: batch.py [-h] -s SCRIPT [-i IDX] [-j JOBS] [-g MEMORY] [-o OUTDIR] ...
+
+Runs one driver script (test.py, test_repeated.py, params.py, test_varied_m.py,
+test_precision.py) on several maps in one invocation.
+
+positional arguments:
+  ...                   Additional arguments passed to the script, after '--'
+                        (e.g. -- -r 20 -a 1)
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -s SCRIPT, --script SCRIPT
+                        Driver script to run for each map.
+  -i IDX, --idx IDX     Comma-separated data indices or map IDs, or 'all'.
+                        Default: all
+  -j JOBS, --jobs JOBS  Maximum number of maps processed concurrently.
+                        Default: number of CPUs
+  -g MEMORY, --memory MEMORY
+                        Memory budget in GB for concurrently running maps.
+                        Default: available physical memory
+  -o OUTDIR, --outdir OUTDIR
+                        Directory for per-map logs and the summary.
+                        Default: batch_results
+
+Example:
+	python batch.py -s test_repeated.py -i 4,5,6,7,8,9,11 -j 4 -- -r 20
+
+numpy and scipy are imported once by this process; each map then runs in a
+forked child that inherits them, so they are not reloaded per map.  Packages
+that are not safe to use after a fork (quLATi/JAX, vedo/VTK, OpenMP-backed
+libraries) are only imported by the children.  Scripts are found next to
+batch.py, whatever the working directory.  Maps are scheduled largest
+first, and a map is only started while the estimated memory of all running
+maps fits in the budget.  Each script writes its outputs to its usual
+directory; the console output of each map goes to OUTDIR/<script>_<idx>.log,
+and OUTDIR/<script>_summary.txt collects the status, runtime and result file
+of every map.
+
+Requirements: os, sys, argparse, time, runpy, multiprocessing, importlib
+
+File: batch.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import argparse
+import time
+import runpy
+import importlib
+import subprocess
+import multiprocessing as mp
+
+import datasets
+
+
+SCRIPTS					=		['test.py', 'test_repeated.py', 'params.py', 'test_varied_m.py', 'test_precision.py']
+
+# directory of the driver scripts
+SCRIPTDIR				=		os.path.dirname(os.path.abspath(__file__))
+
+# fork-safe packages imported once in the parent and inherited by every map
+PRELOAD					=		['numpy', 'scipy.sparse', 'scipy.sparse.linalg', 'scipy.spatial',
+								'scipy.interpolate']
+
+# memory model per map: dense N x N work arrays plus a fixed overhead (bytes)
+BYTES_PER_N2			=		3*8
+BASE_BYTES				=		500*2**20
+
+
+def estimateMemory(idx):
+	""" Estimated peak memory (bytes) for processing map idx (from the dataset registry). """
+	n = datasets.get(idx).numVertices or 0
+
+	return BASE_BYTES + BYTES_PER_N2*n*n
+
+
+def availableMemory():
+	""" Available physical memory in bytes (0 if unknown). """
+	try:
+		return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+	except (ValueError, OSError, AttributeError):
+		return 0
+
+
+def preload():
+	""" Imports the heavy packages once; missing optional packages are skipped. """
+	for name in PRELOAD:
+		try:
+			importlib.import_module(name)
+		except Exception:
+			pass
+
+
+def _runScript(script, argv, logFile):
+	""" Child process: runs the script as __main__ with its output sent to logFile. """
+	fd = os.open(logFile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+	os.dup2(fd, 1)
+	os.dup2(fd, 2)
+	sys.argv = [script] + argv
+
+	code = 0
+	try:
+		runpy.run_path(script, run_name='__main__')
+	except SystemExit as e:
+		code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+	except BaseException:
+		import traceback
+		traceback.print_exc()
+		code = 1
+
+	sys.stdout.flush()
+	sys.stderr.flush()
+	os._exit(code)
+
+
+class MapJob:
+
+	def __init__(self, script, idx, extraArgs, outDir):
+		self.script = script
+		self.scriptPath = os.path.join(SCRIPTDIR, script)
+		self.idx = idx
+		self.argv = ['-i', str(idx)] + extraArgs
+		self.logFile = os.path.join(outDir, '{}_{:g}.log'.format(script[0:-3], idx))
+		self.memory = estimateMemory(idx)
+		self.proc = None
+		self.start = None
+		self.elapsed = None
+		self.exitCode = None
+
+	def launch(self):
+		sys.stdout.flush()	# do not duplicate buffered output in the child
+		self.start = time.time()
+		if 'fork' in mp.get_all_start_methods():
+			self.proc = mp.get_context('fork').Process(target=_runScript, args=(self.scriptPath, self.argv, self.logFile))
+			self.proc.start()
+		else:
+			# no fork (e.g. Windows): separate interpreter per map
+			with open(self.logFile, 'w') as log:
+				self.proc = subprocess.Popen([sys.executable, self.scriptPath] + self.argv, stdout=log, stderr=subprocess.STDOUT)
+
+	def poll(self):
+		""" Returns True once the job has finished. """
+		if isinstance(self.proc, subprocess.Popen):
+			code = self.proc.poll()
+		else:
+			code = None if self.proc.is_alive() else self.proc.exitcode
+		if code is None:
+			return False
+		self.exitCode = code
+		self.elapsed = time.time() - self.start
+		return True
+
+	def resultFile(self):
+		""" Output file reported by the script ('Results saved to ...'), if any. """
+		res = None
+		if os.path.isfile(self.logFile):
+			with open(self.logFile, 'r') as fID:
+				for line in fID:
+					if line.startswith('Results saved to '):
+						res = line[len('Results saved to '):].strip()
+		return res
+
+
+def schedule(jobs, maxJobs, budget):
+	""" Runs the jobs, largest first, within the concurrency and memory limits. """
+	pending = sorted(jobs, key=lambda job: job.memory, reverse=True)
+	running = []
+
+	while pending or running:
+		inUse = sum(job.memory for job in running)
+
+		for job in list(pending):
+			if len(running) >= maxJobs:
+				break
+			# a map larger than the whole budget runs on its own
+			if (budget <= 0) or (inUse + job.memory <= budget) or (not running):
+				job.launch()
+				print('Started map {:g} ({:.1f} GB estimated).'.format(job.idx, job.memory/2**30))
+				running.append(job)
+				pending.remove(job)
+				inUse += job.memory
+
+		for job in list(running):
+			if job.poll():
+				running.remove(job)
+				status = 'ok' if job.exitCode == 0 else 'FAILED ({})'.format(job.exitCode)
+				print('Finished map {:g} in {:.1f} s: {}'.format(job.idx, job.elapsed, status))
+
+		time.sleep(0.5)
+
+
+def writeSummary(jobs, summaryFile):
+	""" Writes the per-map status table followed by each map's result file. """
+	with open(summaryFile, 'w') as fid:
+		fid.write('{:<8}{:<60}{:<12}{:<12}{:<12}\n\n'.format('idx', 'map', 'status', 'time (s)', 'mem (GB)'))
+		for job in jobs:
+			status = 'ok' if job.exitCode == 0 else 'failed'
+			fid.write('{:<8}{:<60}{:<12}{:<12.1f}{:<12.2f}\n'.format(job.idx,
+				datasets.get(job.idx).name, status, job.elapsed, job.memory/2**30))
+
+		for job in jobs:
+			res = job.resultFile()
+			if res is not None and os.path.isdir(res):
+				res = os.path.join(res, 'metrics.txt')	# test.py reports its output directory
+			fid.write('\n\n' + '-'*80 + '\n')
+			fid.write('{:<8}{}\n'.format(job.idx, datasets.get(job.idx).name))
+			fid.write('-'*80 + '\n')
+			if res is not None and os.path.isfile(res):
+				with open(res, 'r') as resID:
+					fid.write(resID.read())
+			else:
+				fid.write('see ' + job.logFile + '\n')
+
+
+if __name__ == '__main__':
+
+	""" Parse the input arguments. """
+	parser = argparse.ArgumentParser(
+	    description='Runs one driver script on several maps in one invocation.')
+
+	parser.add_argument('-s', '--script', required=True, choices=SCRIPTS,
+	                    help='Driver script to run for each map.')
+
+	parser.add_argument('-i', '--idx', required=False, default='all',
+	                    help='Comma-separated data indices or map IDs, or \'all\'. \
+	                    Default: all')
+
+	parser.add_argument('-j', '--jobs', required=False, default=os.cpu_count() or 1,
+	                    help='Maximum number of maps processed concurrently. \
+	                    Default: number of CPUs')
+
+	parser.add_argument('-g', '--memory', required=False, default=None,
+	                    help='Memory budget in GB for concurrently running maps. \
+	                    Default: available physical memory')
+
+	parser.add_argument('-o', '--outdir', required=False, default='batch_results',
+	                    help='Directory for per-map logs and the summary. \
+	                    Default: batch_results')
+
+	parser.add_argument('extra', nargs=argparse.REMAINDER,
+	                    help='Additional arguments passed to the script, after \'--\'')
+
+	args = parser.parse_args()
+
+	script = vars(args)['script']
+	maxJobs = int(vars(args)['jobs'])
+	outDir = vars(args)['outdir']
+
+	extraArgs = vars(args)['extra']
+	if extraArgs and extraArgs[0] == '--':
+		extraArgs = extraArgs[1:]
+
+	if vars(args)['idx'] == 'all':
+		# every map found in the data directory
+		indices = [info.idx for info in datasets.load() if info.numVertices is not None]
+	else:
+		indices = [datasets.index(i) for i in vars(args)['idx'].split(',')]
+
+	if vars(args)['memory'] is None:
+		budget = availableMemory()
+	else:
+		budget = float(vars(args)['memory']) * 2**30
+
+	if not os.path.isdir(outDir):
+		os.makedirs(outDir)
+
+	print('\nPreloading packages...')
+	preload()
+
+	jobs = [MapJob(script, idx, extraArgs, outDir) for idx in indices]
+
+	start = time.time()
+	schedule(jobs, maxJobs, budget)
+
+	summaryFile = os.path.join(outDir, script[0:-3] + '_summary.txt')
+	writeSummary(sorted(jobs, key=lambda job: job.idx), summaryFile)
+
+	print('\nAll maps done in {:.1f} s.'.format(time.time() - start))
+	print('Summary saved to ' + summaryFile + '\n')
@@ -0,0 +1,456 @@
+"""
+--------------------------------------------------------------------------------
+Scaling benchmarks on synthetic cardiac-like meshes.
+--------------------------------------------------------------------------------
+
+usage: benchmark.py [-h] [-n SIZES] [-b BENCHMARKS] [-r REPEAT] [-m SAMPLES]
+                    [-l SOLVER] [-o OUTPUT] [-c COMPARE] [-t TOLERANCE]
+
+Times the MAGIC-LAT pipeline on synthetic meshes of increasing size.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -n SIZES, --sizes SIZES
+                        Comma-separated mesh sizes (number of vertices).
+                        Default: 1000,10000,100000
+  -b BENCHMARKS, --benchmarks BENCHMARKS
+                        Comma-separated benchmarks to run (see BENCHMARKS).
+                        Default: all
+  -r REPEAT, --repeat REPEAT
+                        Number of timed repetitions (the median is kept).
+                        Default: 3
+  -m SAMPLES, --samples SAMPLES
+                        Number of LAT samples of each synthetic map (at most
+                        n/2). Default: 600
+  -l SOLVER, --solver SOLVER
+                        MAGIC-LAT solver backend. Default: direct
+  -o OUTPUT, --output OUTPUT
+                        Result file (JSON). Default:
+                        benchmark_results/benchmark.json
+  -c COMPARE, --compare COMPARE
+                        Baseline result file to compare against. Default:
+                        none
+  -t TOLERANCE, --tolerance TOLERANCE
+                        Slowdown ratio (median time / baseline median time)
+                        reported as a regression. Default: 1.25
+
+Description: Builds closed synthetic chamber surfaces (a deformed ellipsoid of
+roughly cardiac size in mm, triangulated from a Fibonacci point set) with n
+vertices, a synthetic activation field (distance from a pacing site with a
+line of conduction block, so that MAGIC-LAT removes faces as on real maps)
+and a noisy sample set.  The mesh and samples are written in the CARTO text
+formats, so the readers are benchmarked on the same kind of files as the
+patient data, which cannot be distributed.
+
+Benchmarks (BENCHMARKS):
+
+	readMesh, readLAT		CARTO file readers
+	mapSamps				mapping the samples to their nearest vertices
+	isAnomalous				anomalous sample screening
+	magic.setup				MagicLATModel mesh-level setup (ordering, KD-tree,
+							edges, Laplacian)
+	magic					MagicLATModel fit() and predict() on m = 100
+							samples, with the time of every stage (magic.nn,
+							magic.updateFaces, magic.laplacian, magic.assembly,
+							magic.solve, magic.overwrite; see profiling.py)
+	magicUnweighted			magicLATunweighted (dense, n <= MAX_DENSE_N)
+	metrics					NMSE, MAE and DeltaE of an estimate over every vertex
+
+The median (and minimum) wall time of each benchmark and stage per size is
+written to the result file, with the machine and package versions.  With -c,
+the medians are compared with a previous result file; the exit status is 1 if
+any benchmark is slower than the baseline by more than the tolerance.
+
+Example:
+	python benchmark.py -n 1000,10000 -o baseline.json
+	python benchmark.py -n 1000,10000 -c baseline.json
+	python benchmark.py -n 1000,10000,100000,1000000 -b readMesh,mapSamps,magic
+
+Synthetic meshes are kept in the on-disk cache (cache.py).
+
+Requirements: os, sys, json, shutil, tempfile, platform, argparse, timeit,
+	numpy, scipy, robust_laplacian
+
+File: benchmark.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import platform
+import argparse
+from timeit import default_timer as timer
+
+import numpy as np
+import scipy
+from scipy.spatial import ConvexHull
+
+from readMesh import readMesh
+from readLAT import readLAT
+from magicLAT import MagicLATModel
+from magicLATunweighted import magicLATunweighted
+
+import utils
+import metrics
+import cache
+import profiling
+
+
+RESULT_VERSION			=		1
+MESH_VERSION			=		1
+
+OUTDIR					=		'benchmark_results'
+
+NUM_TRAIN_SAMPS			=		100
+EDGE_THRESHOLD			=		50
+
+# largest mesh for the dense benchmarks (magicUnweighted, magic with solver 'inv')
+MAX_DENSE_N				=		2000
+
+# baseline medians below this (s) are too noisy to flag as regressions
+MIN_TIME				=		1e-3
+
+# chamber semi-axes (mm)
+AXES					=		(35.0, 25.0, 45.0)
+
+
+def chamberMesh(n, seed=0):
+	"""
+	Closed triangle mesh with n vertices: a Fibonacci point set on the unit
+	sphere, triangulated by its convex hull, outward oriented, then radially
+	deformed and scaled to AXES.  Cached on disk per (n, seed).
+	"""
+	def build():
+		rng = np.random.default_rng(seed)
+
+		i = np.arange(n) + 0.5
+		z = 1 - 2*i/n
+		phi = np.pi*(1 + 5**0.5)*i + rng.uniform(0, 2*np.pi)
+		r = np.sqrt(1 - z**2)
+		P = np.column_stack((r*np.cos(phi), r*np.sin(phi), z))
+
+		F = ConvexHull(P).simplices
+
+		# outward orientation
+		normals = np.cross(P[F[:, 1]] - P[F[:, 0]], P[F[:, 2]] - P[F[:, 0]])
+		flip = np.sum(normals*P[F[:, 0]], axis=1) < 0
+		F[flip] = F[flip][:, [0, 2, 1]]
+
+		# smooth radial deformation (star-shaped, so the triangulation stays valid)
+		theta = np.arccos(np.clip(P[:, 2], -1, 1))
+		azim = np.arctan2(P[:, 1], P[:, 0])
+		radius = 1 + 0.15*np.sin(2*theta)*np.cos(3*azim) + 0.1*np.cos(theta)
+
+		V = P*radius[:, None]*np.array(AXES)
+
+		return (V, F.astype(np.int64))
+
+	(V, F) = cache.diskCache('synthetic_mesh_v{:d}_n{:d}_s{:d}'.format(MESH_VERSION, n, seed), ['vertices', 'faces'], build)
+
+	return (np.array(V), np.array(F))
+
+
+def activation(V):
+	"""
+	Synthetic LAT field (ms): distance from a pacing site at 0.6 mm/ms, with a
+	line of block delaying one side of the chamber by 60 ms.
+	"""
+	site = V[np.argmin(V[:, 2])]
+	lat = np.linalg.norm(V - site, axis=1)/0.6
+
+	lat = lat + 60*((V[:, 0] > 0) & (V[:, 1] > 0))
+
+	return lat - np.mean(lat)
+
+
+class SyntheticMap:
+	"""
+	Synthetic mesh, activation field and sample set, with the mesh and LAT
+	files written in the CARTO formats in dirName.
+	"""
+
+	def __init__(self, n, numSamples, dirName, seed=0):
+		self.n = n
+		(self.V, self.F) = chamberMesh(n, seed)
+		self.lat = activation(self.V)
+
+		rng = np.random.default_rng(seed)
+		numSamples = min(numSamples, n//2)
+
+		self.sampIdx = rng.choice(n, numSamples, replace=False)
+		self.sampCoords = self.V[self.sampIdx] + rng.normal(scale=0.5, size=(numSamples, 3))
+		self.sampVals = list(self.lat[self.sampIdx] + rng.normal(scale=2.0, size=numSamples))
+
+		# training set (first samples of the random order)
+		self.trIdx = self.sampIdx[0:NUM_TRAIN_SAMPS]
+		self.trVal = [self.sampVals[i] for i in range(NUM_TRAIN_SAMPS)]
+
+		(self.MINLAT, self.MAXLAT) = (np.min(self.lat), np.max(self.lat))
+
+		self.meshFile = os.path.join(dirName, 'Synthetic_n{:d}.mesh'.format(n))
+		self.latFile = os.path.join(dirName, 'Synthetic_n{:d}_car.txt'.format(n))
+		writeMesh(self.meshFile, self.V, self.F)
+		writeLAT(self.latFile, self.sampCoords, self.sampVals)
+
+
+def writeMesh(fileName, V, F):
+	""" Writes the mesh in the CARTO .mesh text format (see readMesh.py). """
+	with open(fileName, 'w') as fid:
+		fid.write('#TriangulatedMeshVersion2.0\n; Synthetic mesh (benchmark.py)\n\n')
+		fid.write('[GeneralAttributes]\n')
+		fid.write('{:<23}= {:d}\n{:<23}= {:d}\n\n'.format('NumVertex', len(V), 'NumTriangle', len(F)))
+
+		fid.write('[VerticesSection]\n;{:>19}{:>14}{:>14}{:>10}{:>10}{:>10}{:>9}\n\n'.format('X', 'Y', 'Z', 'NormalX', 'NormalY', 'NormalZ', 'GroupID'))
+		fid.writelines('{:>8d} = {:>13.6f} {:>13.6f} {:>13.6f}  0.000000  0.000000  0.000000  0\n'.format(i, *v) for (i, v) in enumerate(V))
+
+		fid.write('\n[TrianglesSection]\n;{:>19}{:>9}{:>9}{:>12}{:>10}{:>10}{:>9}\n\n'.format('Vertex0', 'Vertex1', 'Vertex2', 'NormalX', 'NormalY', 'NormalZ', 'GroupID'))
+		fid.writelines('{:>8d} = {:>8d} {:>8d} {:>8d}  0.000000  0.000000  0.000000  0\n'.format(i, *t) for (i, t) in enumerate(F))
+
+		fid.write('\n[VerticesAttributesSection]\n')
+
+
+def writeLAT(fileName, coords, vals):
+	""" Writes the samples in the CARTO LATSpatialData text format (see readLAT.py). """
+	with open(fileName, 'w') as fid:
+		fid.write('Point Name,X,Y,Z,LAT\n')
+		fid.writelines('P{:d},{:g},{:g},{:g},{:g}\n'.format(i + 1, *c, v) for (i, (c, v)) in enumerate(zip(coords, vals)))
+
+
+""" Benchmarks: each takes the synthetic map and returns a function to time """
+
+def benchReadMesh(syn, opts):
+	return lambda: readMesh(syn.meshFile)
+
+
+def benchReadLAT(syn, opts):
+	return lambda: readLAT(syn.latFile)
+
+
+def benchMapSamps(syn, opts):
+	mapIdx = [i for i in range(syn.n)]
+	mapCoord = [syn.V[i] for i in mapIdx]
+
+	return lambda: utils.mapSamps(mapIdx, mapCoord, syn.sampCoords, syn.sampVals)
+
+
+def benchIsAnomalous(syn, opts):
+	coords = [syn.V[i] for i in syn.sampIdx]
+
+	return lambda: utils.isAnomalous(coords, syn.sampVals)
+
+
+def benchMagicSetup(syn, opts):
+	def run():
+		cache.clear()	# no memoized ordering
+		MagicLATModel(syn.V, syn.F, EDGE_THRESHOLD, solver=opts['solver'])
+
+	return run
+
+
+def benchMagic(syn, opts):
+	model = MagicLATModel(syn.V, syn.F, EDGE_THRESHOLD, solver=opts['solver'])
+	model.fit(syn.trIdx, syn.trVal).predict()	# warm-up (solver imports)
+
+	return lambda: model.fit(syn.trIdx, syn.trVal).predict()
+
+
+def benchMagicUnweighted(syn, opts):
+	trCoord = [syn.V[i] for i in syn.trIdx]
+
+	return lambda: magicLATunweighted(syn.V, syn.F, list(syn.trIdx), trCoord, syn.trVal, EDGE_THRESHOLD)
+
+
+def benchMetrics(syn, opts):
+	est = syn.lat + np.random.default_rng(0).normal(scale=5.0, size=syn.n)
+	metrics.deltaETable()	# built once per process
+
+	return lambda: metrics.evaluate(syn.lat, est, ['nmse', 'mae', 'de2000'], syn.MINLAT, syn.MAXLAT)
+
+
+# name: (benchmark, applicable(n, opts))
+BENCHMARKS = {
+	'readMesh': (benchReadMesh, lambda n, opts: True),
+	'readLAT': (benchReadLAT, lambda n, opts: True),
+	'mapSamps': (benchMapSamps, lambda n, opts: True),
+	'isAnomalous': (benchIsAnomalous, lambda n, opts: True),
+	'magic.setup': (benchMagicSetup, lambda n, opts: True),
+	'magic': (benchMagic, lambda n, opts: (opts['solver'] != 'inv') or (n <= MAX_DENSE_N)),
+	'magicUnweighted': (benchMagicUnweighted, lambda n, opts: n <= MAX_DENSE_N),
+	'metrics': (benchMetrics, lambda n, opts: True)
+}
+
+
+def timeRepeats(fn, repeat):
+	"""
+	Wall times (s) of repeat calls of fn, and the median time of every
+	profiled stage (profiling.py) run inside it.
+	"""
+	times = []
+	profiling.clear()
+	for r in range(repeat):
+		start = timer()
+		fn()
+		times.append(timer() - start)
+
+	stages = {}
+	for rec in profiling.drain():
+		stages.setdefault(rec['stage'], []).append(rec['wall'])
+
+	return times, stages
+
+
+def entry(times):
+	return {'median': float(np.median(times)), 'min': float(np.min(times)), 'repeats': len(times)}
+
+
+def machineInfo():
+	return {'platform': platform.platform(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+		'python': platform.python_version(), 'numpy': np.__version__, 'scipy': scipy.__version__}
+
+
+def compare(res, base, tolerance):
+	"""
+	Prints the median times against the baseline; returns the list of
+	(benchmark, n, ratio) regressions.
+	"""
+	print('\n{:<22}{:>10}{:>14}{:>14}{:>10}'.format('benchmark', 'n', 'baseline (s)', 'current (s)', 'ratio'))
+
+	regressions = []
+	for (name, sizes) in res.items():
+		for (n, cur) in sizes.items():
+			if (name not in base) or (n not in base[name]):
+				continue
+			ref = base[name][n]['median']
+			ratio = cur['median']/ref if ref > 0 else np.inf
+
+			flag = ''
+			if (ratio > tolerance) and (ref >= MIN_TIME):
+				flag = '  REGRESSION'
+				regressions.append((name, int(n), ratio))
+
+			print('{:<22}{:>10}{:>14.4f}{:>14.4f}{:>10.2f}{}'.format(name, n, ref, cur['median'], ratio, flag))
+
+	return regressions
+
+
+def main(argv=None):
+	""" Parse the input arguments. """
+	parser = argparse.ArgumentParser(
+	    description='Times the MAGIC-LAT pipeline on synthetic meshes of increasing size.')
+
+	parser.add_argument('-n', '--sizes', required=False, default='1000,10000,100000',
+	                    help='Comma-separated mesh sizes (number of vertices). \
+	                    Default: 1000,10000,100000')
+
+	parser.add_argument('-b', '--benchmarks', required=False, default='all',
+	                    help='Comma-separated benchmarks to run (see BENCHMARKS). \
+	                    Default: all')
+
+	parser.add_argument('-r', '--repeat', required=False, default=3,
+	                    help='Number of timed repetitions (the median is kept). \
+	                    Default: 3')
+
+	parser.add_argument('-m', '--samples', required=False, default=600,
+	                    help='Number of LAT samples of each synthetic map (at most n/2). \
+	                    Default: 600')
+
+	parser.add_argument('-l', '--solver', required=False, default='direct',
+	                    help='MAGIC-LAT solver backend. \
+	                    Default: direct')
+
+	parser.add_argument('-o', '--output', required=False, default=os.path.join(OUTDIR, 'benchmark.json'),
+	                    help='Result file (JSON). \
+	                    Default: benchmark_results/benchmark.json')
+
+	parser.add_argument('-c', '--compare', required=False, default=None,
+	                    help='Baseline result file to compare against. \
+	                    Default: none')
+
+	parser.add_argument('-t', '--tolerance', required=False, default=1.25,
+	                    help='Slowdown ratio (median time / baseline median time) reported as a regression. \
+	                    Default: 1.25')
+
+	args = parser.parse_args(argv)
+
+	SIZES					=		[int(n) for n in vars(args)['sizes'].split(',')]
+	NUM_REPEATS				=		int(vars(args)['repeat'])
+	NUM_SAMPLES				=		int(vars(args)['samples'])
+	TOLERANCE				=		float(vars(args)['tolerance'])
+	outFile					=		vars(args)['output']
+	opts					=		{'solver': vars(args)['solver']}
+
+	if vars(args)['benchmarks'] == 'all':
+		NAMES = list(BENCHMARKS.keys())
+	else:
+		NAMES = vars(args)['benchmarks'].split(',')
+		for name in NAMES:
+			if name not in BENCHMARKS:
+				parser.error('unknown benchmark \'{}\', choose from: {}'.format(name, ', '.join(BENCHMARKS.keys())))
+
+	# stage times only (tracemalloc would distort the timings)
+	profiling.enable(memory=False)
+
+	res = {}
+	tmpDir = tempfile.mkdtemp(prefix='magiclat_bench_')
+	try:
+		for n in SIZES:
+			print('\nn = {:d}: building synthetic map...'.format(n))
+			syn = SyntheticMap(n, NUM_SAMPLES, tmpDir)
+
+			for name in NAMES:
+				(bench, applicable) = BENCHMARKS[name]
+				if not applicable(n, opts):
+					continue
+
+				fn = bench(syn, opts)
+				profiling.clear()	# setup of the benchmark is not timed
+				(times, stages) = timeRepeats(fn, NUM_REPEATS)
+
+				res.setdefault(name, {})[str(n)] = entry(times)
+				print('\t{:<22}{:>12.4f} s'.format(name, np.median(times)))
+
+				# stage breakdown of the pipeline benchmarks
+				if name in ['magic']:
+					for (stage, stageTimes) in stages.items():
+						res.setdefault(stage, {})[str(n)] = entry(stageTimes)
+						print('\t  {:<20}{:>12.4f} s'.format(stage, np.median(stageTimes)))
+	finally:
+		shutil.rmtree(tmpDir, ignore_errors=True)
+
+	profiling.disable()
+
+	outDir = os.path.dirname(outFile)
+	if outDir != '' and not os.path.isdir(outDir):
+		os.makedirs(outDir)
+
+	with open(outFile, 'w') as fid:
+		json.dump({'version': RESULT_VERSION, 'machine': machineInfo(),
+			'settings': {'sizes': SIZES, 'repeat': NUM_REPEATS, 'samples': NUM_SAMPLES, 'solver': opts['solver'],
+				'm': NUM_TRAIN_SAMPS, 'edgeThreshold': EDGE_THRESHOLD},
+			'results': res}, fid, indent=1)
+
+	print('\nResults saved to ' + outFile)
+
+	if vars(args)['compare'] is not None:
+		with open(vars(args)['compare'], 'r') as fid:
+			base = json.load(fid)
+
+		if base.get('machine', {}).get('platform') != machineInfo()['platform']:
+			print('\nWarning: the baseline was recorded on another machine ({}).'.format(base.get('machine', {}).get('platform')))
+
+		regressions = compare(res, base['results'], TOLERANCE)
+
+		if regressions:
+			print('\n{:d} regression(s) beyond {:g}x the baseline.'.format(len(regressions), TOLERANCE))
+			return 1
+
+		print('\nNo regressions beyond {:g}x the baseline.'.format(TOLERANCE))
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,117 @@
+"""
+--------------------------------------------------------------------------------
+Mesh-level caching for MAGIC-LAT.
+--------------------------------------------------------------------------------
+
+Description: Helpers to key and memoize structures that depend only on the
+mesh (and a few fixed parameters), so that they are computed once per mesh and
+reused across trials and sample sets.  Cached values are shared by every
+caller, so they must not be modified; the cache itself may be used from
+several threads.
+
+Expensive arrays can also be kept on disk, in a content-addressed directory
+shared by all runs (MAGICLAT_CACHE, default ~/.cache/magiclat).  Each entry is
+written to a private temporary directory and renamed into place, so concurrent
+workers never see a partial entry; entries are loaded memory-mapped.
+
+Requirements: os, shutil, hashlib, threading, collections, numpy
+
+File: cache.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+# maximum number of entries kept in the in-memory cache
+MAX_ENTRIES				=		16
+
+# directory for the on-disk cache
+DISKDIR					=		os.environ.get('MAGICLAT_CACHE',
+									os.path.join(os.path.expanduser('~'), '.cache', 'magiclat'))
+
+_memCache = OrderedDict()
+_memLock = threading.Lock()
+
+
+def meshKey(V, F, *params):
+	"""
+	Returns a hex digest identifying the mesh content (vertex coordinates and
+	triangles) plus any additional parameters that the cached value depends on.
+	"""
+	h = hashlib.sha1()
+	h.update(np.ascontiguousarray(V, dtype=np.float64).tobytes())
+	h.update(np.ascontiguousarray(F, dtype=np.int64).tobytes())
+	h.update(repr(params).encode('utf-8'))
+
+	return h.hexdigest()
+
+
+def memoize(key, builder):
+	"""
+	Returns the cached value for key, calling builder() to compute and store
+	it if it is not already cached.  Least recently used entries are evicted
+	once MAX_ENTRIES is reached.  If two threads build the same key, both get
+	the value stored first.
+	"""
+	with _memLock:
+		if key in _memCache:
+			_memCache.move_to_end(key)
+			return _memCache[key]
+
+	val = builder()
+
+	with _memLock:
+		val = _memCache.setdefault(key, val)
+		_memCache.move_to_end(key)
+		if len(_memCache) > MAX_ENTRIES:
+			_memCache.popitem(last=False)
+
+	return val
+
+
+def clear():
+	""" Empties the in-memory cache. """
+	with _memLock:
+		_memCache.clear()
+
+
+
+def _loadArray(fileName):
+	try:
+		return np.load(fileName, mmap_mode='r')
+	except ValueError:	# object arrays cannot be memory-mapped
+		return np.load(fileName, allow_pickle=True)
+
+
+def diskCache(key, names, builder, dirName=None):
+	"""
+	Returns the arrays stored on disk under key as a tuple in the order of
+	names, calling builder() (which returns the arrays in that order) to
+	compute and store them if the entry does not exist yet.
+	"""
+	if dirName is None:
+		dirName = DISKDIR
+	entryDir = os.path.join(dirName, key)
+
+	if not os.path.isdir(entryDir):
+		arrays = builder()
+
+		tmpDir = '{}.{:d}.tmp'.format(entryDir, os.getpid())
+		os.makedirs(tmpDir, exist_ok=True)
+		for (name, arr) in zip(names, arrays):
+			with open(os.path.join(tmpDir, name + '.npy'), 'wb') as fid:
+				np.save(fid, arr)
+
+		try:
+			os.rename(tmpDir, entryDir)
+		except OSError:		# another process stored the entry first
+			shutil.rmtree(tmpDir, ignore_errors=True)
+
+	return tuple(_loadArray(os.path.join(entryDir, name + '.npy')) for name in names)
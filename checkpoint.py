@@ -0,0 +1,91 @@
+"""
+--------------------------------------------------------------------------------
+Durable checkpoint store for long-running evaluations.
+--------------------------------------------------------------------------------
+
+Description: Stores one result record per completed job (e.g. one
+(alpha, beta, trial) cell of the regularization grid search) in a SQLite
+database, committed as soon as the job finishes.  A restarted run skips every
+job already in the store.  Run-level settings that must not change between
+restarts (e.g. the master seed) and running aggregates that must stay
+consistent with the stored results (see accumulators.py) are kept alongside
+as metadata.
+
+Requirements: sqlite3, json
+
+File: checkpoint.py
+--------------------------------------------------------------------------------
+"""
+
+import json
+import sqlite3
+
+
+class CheckpointStore:
+	"""
+	Maps job keys (tuples of str/int/float) to result dictionaries.
+
+		store = CheckpointStore('run.sqlite')
+		if key not in store:
+			store.put(key, {'nmse': 0.12})
+	"""
+
+	def __init__(self, fileName):
+		self.fileName = fileName
+		self.conn = sqlite3.connect(fileName)
+		self.conn.execute('CREATE TABLE IF NOT EXISTS results (job TEXT PRIMARY KEY, result TEXT)')
+		self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)')
+		self.conn.commit()
+
+	@staticmethod
+	def _key(job):
+		return json.dumps(list(job))
+
+	def __contains__(self, job):
+		cur = self.conn.execute('SELECT 1 FROM results WHERE job = ?', (self._key(job),))
+		return cur.fetchone() is not None
+
+	def __len__(self):
+		return self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+	def put(self, job, result, meta=None):
+		"""
+		Records the result of a completed job (committed immediately), together
+		with any metadata updates given as a {name: value} dict, in a single
+		transaction.
+		"""
+		self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?)', (self._key(job), json.dumps(result)))
+		if meta is not None:
+			for (name, value) in meta.items():
+				self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (name, json.dumps(value)))
+		self.conn.commit()
+
+	def get(self, job, default=None):
+		cur = self.conn.execute('SELECT result FROM results WHERE job = ?', (self._key(job),))
+		row = cur.fetchone()
+		if row is None:
+			return default
+		return json.loads(row[0])
+
+	def items(self):
+		""" Returns all (job, result) pairs in the store. """
+		cur = self.conn.execute('SELECT job, result FROM results')
+		return [(tuple(json.loads(job)), json.loads(res)) for (job, res) in cur.fetchall()]
+
+	def meta(self, name, default=None):
+		"""
+		Returns the stored metadata value for name; if absent, stores and
+		returns default.
+		"""
+		row = self.conn.execute('SELECT value FROM meta WHERE name = ?', (name,)).fetchone()
+		if row is not None:
+			return json.loads(row[0])
+
+		if default is not None:
+			self.conn.execute('INSERT INTO meta VALUES (?, ?)', (name, json.dumps(default)))
+			self.conn.commit()
+
+		return default
+
+	def close(self):
+		self.conn.close()
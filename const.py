@@ -3,7 +3,13 @@
 Constant definitions for MAGIC-LAT.
 --------------------------------------------------------------------------------
 
-Description: Constants definition for paths to data directories/files..
+Description: Constants definition for paths to data directories/files.
+
+The working directory is taken from the MAGICLAT_WORKDIR environment variable,
+falling back to the known per-system location (if it exists) and then to the
+directory of this file; the data directory is MAGICLAT_DATA, or workDir/data.  DATAFILES
+lists the original maps in data index order; use datasets.py to look maps up
+by index or map ID together with their metadata.
 
 Requirements: os, platform
 
@@ -17,17 +23,17 @@ Email: jenniferhellar@gmail.com
 import os
 import platform
 
-mySys = platform.system()
+# default working directory per operating system
+WORKDIRS = {'Linux': '/home/jlh24/latInterpolation',
+	'Windows': 'D:\\jhell\\git-repos\\lat-interpolation'}
 
-if mySys == 'Linux':
-	workDir = '/home/jlh24/latInterpolation'
-elif mySys == 'Windows':
-	workDir = 'D:\jhell\git-repos\lat-interpolation'
-else:
-	print('\nERROR: unknown operating system. Must specify workDir and dataDir in const.py\n')
-	exit(1)
+workDir = os.environ.get('MAGICLAT_WORKDIR')
+if workDir is None:
+	workDir = WORKDIRS.get(platform.system(), '')
+	if not os.path.isdir(workDir):
+		workDir = os.path.dirname(os.path.abspath(__file__))
 
-DATADIR = os.path.join(workDir, 'data')
+DATADIR = os.environ.get('MAGICLAT_DATA', os.path.join(workDir, 'data'))
 
 DATAFILES = [('Patient031_I_MESHData4-SINUS-LVFAM.mesh', 'Patient031_I_LATSpatialData_4-SINUS-LVFAM_car.txt', ''),
 ('Patient032_I_MESHData1-LVFAM-LAT-HYB.mesh', 'Patient032_I_LATSpatialData_1-LVFAM-LAT-HYB_car.txt', 'Patient032_I_AblationData_1.txt'),
@@ -0,0 +1,301 @@
+"""
+--------------------------------------------------------------------------------
+Registry of the maps in the data directory.
+--------------------------------------------------------------------------------
+
+usage: datasets.py [-h] [-d DATADIR] [-u UPDATE]
+
+Lists the maps found in the data directory and their metadata.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -d DATADIR, --datadir DATADIR
+                        Data directory to scan. Default: const.DATADIR
+  -u UPDATE, --update UPDATE
+                        Rescan the data directory and rewrite the registry
+                        (disable: 0, enable: 1). Default: 0
+
+Description: Discovers the maps (CARTO mesh, LAT and ablation files, paired
+by patient and map name as in other/renameAndListFiles.py) in the data
+directory and keeps their metadata in a registry file (datasets.json) in that
+directory:
+
+	idx				data index (the position in const.DATAFILES for the
+					original maps, so existing indices keep working)
+	mapId			map ID, e.g. 'p037_9'
+	patient			patient number, e.g. '037'
+	name, latId		mesh file stem and LAT map name
+	meshFile, latFile, ablFile
+	numVertices, numFaces	from the mesh file header
+	numSamples		LAT samples in the LAT file
+	anomalies		manually identified anomalous samples (indices into the
+					mapped samples), or null to screen them automatically
+	view			plot view angles (elevation, azimuth, roll)
+
+Maps are looked up by data index or map ID (get(), index()).  The registry is
+rebuilt when a file in the data directory is newer than it; anomaly lists
+edited in the registry file are kept when it is rebuilt.  Batch schedulers can
+size jobs from numVertices without opening the mesh files.
+
+Requirements: os, re, json, argparse
+
+File: datasets.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import re
+import json
+import argparse
+
+from const import DATADIR, DATAFILES
+
+
+REGISTRY_FILE			=		'datasets.json'
+REGISTRY_VERSION		=		1
+
+# manually identified anomalous samples (indices into the mapped samples)
+ANOMALIES				=		{'p033_3': [25, 112, 159, 218, 240, 242, 264],
+								'p033_4': [119, 150, 166, 179, 188, 191, 209, 238],
+								'p034_4': [11, 12, 59, 63, 91, 120, 156],
+								'p034_5': [79, 98, 137, 205],
+								'p034_6': [10, 11, 51, 56, 85, 105, 125, 143, 156, 158, 169, 181, 210, 269, 284, 329, 336, 357, 365, 369, 400, 405],
+								'p035_8': [0, 48, 255, 322]}
+
+# plot view per patient (elevation, azimuth, roll)
+VIEWS					=		{'033': (0, 90, 0),
+								'034': (0, 120, -45),
+								'035': (0, 0, 0),
+								'037': (0, 160, 0)}
+
+FIELDS					=		['idx', 'mapId', 'patient', 'name', 'latId', 'meshFile', 'latFile', 'ablFile',
+									'numVertices', 'numFaces', 'numSamples', 'anomalies', 'view']
+
+_registries = {}
+
+
+class MapInfo:
+	""" Metadata of one map (see FIELDS); file paths are relative to the data directory. """
+
+	def __init__(self, **fields):
+		for name in FIELDS:
+			setattr(self, name, fields.get(name, None))
+
+	def toDict(self):
+		return {name: getattr(self, name) for name in FIELDS}
+
+	@classmethod
+	def fromDict(cls, d):
+		info = cls(**d)
+		if info.view is not None:
+			info.view = tuple(info.view)
+		return info
+
+
+def mapFiles(meshFile, latFile, ablFile=''):
+	""" Naming metadata of a (mesh, LAT, ablation) file triplet. """
+	name = meshFile[0:-5]
+	patient = re.match(r'Patient(\d+)_', latFile).group(1)
+	latId = latFile.split('_')[3]
+	mapId = 'p' + patient + '_' + latId.split('-')[0]
+
+	return MapInfo(mapId=mapId, patient=patient, name=name, latId=latId,
+		meshFile=meshFile, latFile=latFile, ablFile=ablFile,
+		anomalies=ANOMALIES.get(mapId, None), view=VIEWS.get(patient, (0, 0, 0)))
+
+
+def discover(dataDir=DATADIR):
+	""" (mesh, LAT, ablation) file triplets in the data directory. """
+	fileList = set(os.listdir(dataDir))
+
+	triplets = []
+	for latFile in sorted(f for f in fileList if f.endswith('_car.txt')):
+		parts = latFile.split('_')
+		meshFile = '_'.join(parts[0:2]) + '_MESHData' + parts[3] + '.mesh'
+		if meshFile not in fileList:
+			continue
+
+		ablFile = '_'.join(parts[0:2]) + '_AblationData_' + parts[3].split('-')[0] + '.txt'
+		if ablFile not in fileList:
+			ablFile = ''
+
+		triplets.append((meshFile, latFile, ablFile))
+
+	return triplets
+
+
+def meshHeader(meshFile):
+	""" Vertex and triangle counts from the .mesh header, without parsing the mesh. """
+	counts = {}
+	with open(meshFile, 'r') as fID:
+		for line in fID:
+			line = line.strip()
+			if line.startswith('NumVertex') or line.startswith('NumTriangle'):
+				counts[line.split('=')[0].strip()] = int(line.split('=')[1])
+			if line == '[VerticesSection]':
+				break
+
+	return (counts.get('NumVertex', 0), counts.get('NumTriangle', 0))
+
+
+def numLATSamples(latFile):
+	""" Number of valid LAT samples in the LAT file (as returned by readLAT). """
+	num = 0
+	with open(latFile, 'r') as fID:
+		for line in fID:
+			line = line.strip()
+			if (line[0:5] != 'Point') and (line != '') and (float(line.split(',')[-1]) != -10000):
+				num += 1
+
+	return num
+
+
+def scan(dataDir=DATADIR, previous=None):
+	"""
+	Builds the map list of the data directory.  The original maps keep their
+	const.DATAFILES index; other maps are numbered after them.  Anomaly lists
+	of maps in previous (an earlier registry) are kept.
+	"""
+	if os.path.isdir(dataDir):
+		triplets = discover(dataDir)
+	else:
+		triplets = []
+
+	known = [(meshFile, latFile) for (meshFile, latFile, ablFile) in DATAFILES]
+	previous = {} if previous is None else {info.mapId: info for info in previous}
+
+	maps = []
+	nextIdx = len(DATAFILES)
+	for (meshFile, latFile, ablFile) in triplets:
+		info = mapFiles(meshFile, latFile, ablFile)
+
+		if (meshFile, latFile) in known:
+			info.idx = known.index((meshFile, latFile))
+		else:
+			info.idx = nextIdx
+			nextIdx += 1
+
+		(info.numVertices, info.numFaces) = meshHeader(os.path.join(dataDir, meshFile))
+		info.numSamples = numLATSamples(os.path.join(dataDir, latFile))
+
+		if (info.mapId in previous) and (previous[info.mapId].anomalies is not None):
+			info.anomalies = previous[info.mapId].anomalies
+		maps.append(info)
+
+	# original maps missing from the data directory keep their index (no metadata)
+	found = set(info.idx for info in maps)
+	for (i, (meshFile, latFile, ablFile)) in enumerate(DATAFILES):
+		if i not in found:
+			info = mapFiles(meshFile, latFile, ablFile)
+			info.idx = i
+			maps.append(info)
+
+	return sorted(maps, key=lambda info: info.idx)
+
+
+def _registryFile(dataDir):
+	return os.path.join(dataDir, REGISTRY_FILE)
+
+
+def _upToDate(dataDir):
+	""" True if the registry file exists and no data file is newer than it. """
+	regFile = _registryFile(dataDir)
+	if not os.path.isfile(regFile):
+		return False
+	stamp = os.stat(regFile).st_mtime
+	newest = max([os.stat(os.path.join(dataDir, f)).st_mtime for f in os.listdir(dataDir) if f != REGISTRY_FILE] + [0])
+
+	return newest <= stamp
+
+
+def _read(dataDir):
+	try:
+		with open(_registryFile(dataDir), 'r') as fid:
+			reg = json.load(fid)
+	except (OSError, ValueError):
+		return None
+	if reg.get('version') != REGISTRY_VERSION:
+		return None
+
+	return [MapInfo.fromDict(d) for d in reg['maps']]
+
+
+def build(dataDir=DATADIR):
+	""" Rescans the data directory and rewrites the registry file (if writable). """
+	maps = scan(dataDir, _read(dataDir) if os.path.isdir(dataDir) else None)
+
+	if os.path.isdir(dataDir):
+		regFile = _registryFile(dataDir)
+		tmpFile = regFile + '.{:d}.tmp'.format(os.getpid())
+		try:
+			with open(tmpFile, 'w') as fid:
+				json.dump({'version': REGISTRY_VERSION, 'maps': [info.toDict() for info in maps]}, fid, indent=1)
+			os.replace(tmpFile, regFile)
+		except OSError:
+			pass	# read-only data directory: the registry is rebuilt per process
+
+	_registries[dataDir] = maps
+
+	return maps
+
+
+def load(dataDir=DATADIR):
+	""" Returns the list of maps (MapInfo) of the data directory, by data index. """
+	if dataDir not in _registries:
+		maps = None
+		if os.path.isdir(dataDir) and _upToDate(dataDir):
+			maps = _read(dataDir)
+		if maps is None:
+			maps = build(dataDir)
+		_registries[dataDir] = maps
+
+	return _registries[dataDir]
+
+
+def get(key, dataDir=DATADIR):
+	""" Returns the map for a data index (int or digit string) or map ID. """
+	maps = load(dataDir)
+
+	for info in maps:
+		if (str(key).isdigit() and info.idx == int(key)) or (info.mapId == key):
+			return info
+
+	raise KeyError('unknown map \'{}\', choose a data index or map ID: {}'.format(key,
+		', '.join('{:d} ({})'.format(info.idx, info.mapId) for info in maps)))
+
+
+def index(key, dataDir=DATADIR):
+	""" Data index for a data index or map ID. """
+	return get(key, dataDir).idx
+
+
+if __name__ == '__main__':
+
+	""" Parse the input arguments. """
+	parser = argparse.ArgumentParser(
+	    description='Lists the maps found in the data directory and their metadata.')
+
+	parser.add_argument('-d', '--datadir', required=False, default=DATADIR,
+	                    help='Data directory to scan. \
+	                    Default: const.DATADIR')
+
+	parser.add_argument('-u', '--update', required=False, default=0,
+	                    help='Rescan the data directory and rewrite the registry (disable: 0, enable: 1). \
+	                    Default: 0')
+
+	args = parser.parse_args()
+
+	dataDir = vars(args)['datadir']
+	if int(vars(args)['update']):
+		maps = build(dataDir)
+	else:
+		maps = load(dataDir)
+
+	if not os.path.isdir(dataDir):
+		print('\nData directory ' + dataDir + ' not found (set MAGICLAT_DATA).')
+
+	print('\n{:<6}{:<10}{:<50}{:<10}{:<10}{:<10}{:<10}'.format('idx', 'map', 'name', 'n', 'faces', 'samples', 'anomalous'))
+	for info in maps:
+		anom = 'auto' if info.anomalies is None else str(len(info.anomalies))
+		counts = ['-' if c is None else str(c) for c in [info.numVertices, info.numFaces, info.numSamples]]
+		print('{:<6}{:<10}{:<50}{:<10}{:<10}{:<10}{:<10}'.format(info.idx, info.mapId, info.name, *counts, anom))
@@ -0,0 +1,192 @@
+"""
+--------------------------------------------------------------------------------
+Sparse (inducing point) Gaussian process regression baseline.
+--------------------------------------------------------------------------------
+
+Description: Drop-in replacement for sklearn's GaussianProcessRegressor in the
+comparison drivers (fit(X, y), predict(X)) that scales to thousands of
+observations and large meshes:
+
+	- the predictive mean uses the subset of regressors approximation with
+	  NUM_INDUCING inducing points, chosen among the training points by
+	  farthest point sampling, so a fit costs O(n m^2) instead of O(n^3);
+	- the kernel hyperparameters are optimized by sklearn on the inducing
+	  points, either once per map by calibrate() (then reused by every fit)
+	  or, if the model is not calibrated, on each fit's own sample set, so a
+	  fit never depends on which fits the process ran before;
+	- predictions are computed in batches of PREDICT_BATCH vertices, so the
+	  cross-covariance never exceeds PREDICT_BATCH x NUM_INDUCING.
+
+predict(X, return_std=True) also returns the predictive standard deviation
+of the latent function (the SoR variance, which is O(m^2) per vertex).  With
+at most NUM_INDUCING observations the exact posterior is used.
+
+Requirements: numpy, scipy, scikit-learn
+
+File: gprHelper.py
+--------------------------------------------------------------------------------
+"""
+
+import numpy as np
+
+from scipy.linalg import solve_triangular, cho_solve
+
+
+NUM_INDUCING			=		500
+PREDICT_BATCH			=		10000
+
+# relative jitter added to the inducing point covariance
+JITTER					=		1e-8
+
+GPR_MODES				=		['exact', 'sparse']
+
+
+def inducingPoints(X, num):
+	""" Indices of num points of X chosen by farthest point sampling. """
+	X = np.asarray(X, dtype=float)
+	num = min(num, len(X))
+
+	idx = np.zeros(num, dtype=int)
+	dist = np.sum((X - X[0]) ** 2, axis=1)
+	for k in range(1, num):
+		idx[k] = np.argmax(dist)
+		dist = np.minimum(dist, np.sum((X - X[idx[k]]) ** 2, axis=1))
+
+	return idx
+
+
+class SparseGPR:
+	"""
+	Inducing point GPR with the interface used by the drivers:
+
+		gpr = gprHelper.SparseGPR(kernel)
+		gpr.calibrate(CalCoord, CalVal)		# optional, once per map
+		gpr.fit(TrCoord, TrVal)
+		latEstGPR = gpr.predict(vertices, return_std=False)
+
+	alpha is the noise variance of the (normalized) observations, as in
+	sklearn.  Once calibrated, fits reuse the calibrated hyperparameters
+	unless reoptimize=True.  Drivers running trials in worker processes
+	calibrate in the parent before forking, so every worker fits with the same
+	hyperparameters.
+	"""
+
+	def __init__(self, kernel, numInducing=NUM_INDUCING, alpha=1e-10, normalize_y=True,
+		reoptimize=False, batchSize=PREDICT_BATCH):
+		self.kernel = kernel
+		self.numInducing = numInducing
+		self.alpha = alpha
+		self.normalize_y = normalize_y
+		self.reoptimize = reoptimize
+		self.batchSize = batchSize
+
+		self.kernel_ = None
+		self.calibrated = False
+
+	def _optimize(self, X, y):
+		""" Returns the kernel optimized on the given points (sklearn). """
+		from sklearn.base import clone
+		from sklearn.gaussian_process import GaussianProcessRegressor
+
+		gpr = GaussianProcessRegressor(kernel=clone(self.kernel), alpha=self.alpha, normalize_y=self.normalize_y)
+		gpr.fit(X, y)
+		return gpr.kernel_
+
+	def calibrate(self, X, y):
+		"""
+		Optimizes the hyperparameters once on the observations (X, y), e.g. the
+		union of a few seed-derived calibration sample sets; later fits reuse
+		them.
+		"""
+		X = np.asarray(X, dtype=float)
+		y = np.asarray(y, dtype=float).reshape(-1)
+
+		iu = inducingPoints(X, self.numInducing)
+		self.kernel_ = self._optimize(X[iu], y[iu])
+		self.calibrated = True
+
+		return self
+
+	def fit(self, X, y):
+		X = np.asarray(X, dtype=float)
+		y = np.asarray(y, dtype=float).reshape(-1)
+
+		if self.normalize_y:
+			self._yMean = np.mean(y)
+			self._yStd = np.std(y) if np.std(y) > 0 else 1.0
+		else:
+			self._yMean = 0.0
+			self._yStd = 1.0
+		yn = (y - self._yMean) / self._yStd
+
+		iu = inducingPoints(X, self.numInducing)
+		self._Xu = X[iu]
+
+		# the calibrated hyperparameters, or the optimum for this sample set
+		if self.calibrated and not self.reoptimize:
+			self._kernel = self.kernel_
+		else:
+			self._kernel = self._optimize(self._Xu, y[iu])
+
+		Kuu = self._kernel(self._Xu)
+		Kuu[np.diag_indices_from(Kuu)] += JITTER * np.mean(np.diag(Kuu))
+
+		self._exact = (len(X) == len(iu))
+		if self._exact:
+			# exact posterior
+			Kuu[np.diag_indices_from(Kuu)] += self.alpha
+			self._L = np.linalg.cholesky(Kuu)
+			self._weights = cho_solve((self._L, True), yn[iu])
+			return self
+
+		# subset of regressors: mean weights w = (alpha Kuu + Kuf Kfu)^-1 Kuf y,
+		# solved as the least squares problem [Kfu; sqrt(alpha) Luu^T] w = [y; 0]
+		# by A = QR; the posterior covariance of w is alpha (R^T R)^-1
+		Kfu = self._kernel(X, self._Xu)
+		Luu = np.linalg.cholesky(Kuu)
+
+		A = np.vstack([Kfu, np.sqrt(self.alpha) * Luu.T])
+		b = np.concatenate([yn, np.zeros(len(iu))])
+		(Q, self._R) = np.linalg.qr(A)
+		self._weights = solve_triangular(self._R, Q.T @ b)
+
+		return self
+
+	def predict(self, X, return_std=False):
+		"""
+		Predictive mean at X and, with return_std=True, the standard deviation
+		of the latent function (without the observation noise, as in sklearn).
+		"""
+		X = np.asarray(X, dtype=float)
+		est = np.zeros(len(X))
+		std = np.zeros(len(X))
+		for start in range(0, len(X), self.batchSize):
+			stop = min(start + self.batchSize, len(X))
+			Ksu = self._kernel(X[start:stop], self._Xu)
+			est[start:stop] = Ksu @ self._weights
+
+			if return_std:
+				if self._exact:
+					v = solve_triangular(self._L, Ksu.T, lower=True)
+					var = self._kernel.diag(X[start:stop]) - np.sum(v ** 2, axis=0)
+				else:
+					v = solve_triangular(self._R, Ksu.T, trans='T')
+					var = self.alpha * np.sum(v ** 2, axis=0)
+				std[start:stop] = np.sqrt(np.maximum(var, 0))
+
+		est = est * self._yStd + self._yMean
+		if return_std:
+			return est, std * self._yStd
+		return est
+
+
+def gprModel(kernel, mode='exact'):
+	""" Returns the GPR baseline for the given mode (see GPR_MODES). """
+	if mode == 'exact':
+		# scikit-learn is only loaded when a GPR model is requested
+		from sklearn.gaussian_process import GaussianProcessRegressor
+
+		return GaussianProcessRegressor(kernel=kernel, normalize_y=True)
+	elif mode == 'sparse':
+		return SparseGPR(kernel)
+	raise ValueError('unknown GPR mode \'{}\', choose from: {}'.format(mode, ', '.join(GPR_MODES)))
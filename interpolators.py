@@ -0,0 +1,270 @@
+"""
+--------------------------------------------------------------------------------
+Registry of LAT interpolation methods with a common interface.
+--------------------------------------------------------------------------------
+
+Description: Wraps every interpolation method compared by the drivers behind
+one interface, selected by name:
+
+	'magic'				MAGIC-LAT (weighted cotan Laplacian, magicLAT.py)
+	'magic-unweighted'	MAGIC-LAT with the binary adjacency Laplacian
+						(magicLATunweighted.py, dense, small meshes only)
+	'gpr'				Gaussian process regression (gprHelper.py, exact or
+						sparse)
+	'quLATi'			GPMI / quLATi (quLATiHelper.py)
+	'nn'				nearest neighbour tiling of the samples
+
+The mesh-level setup of a method is done when the interpolator is created.
+Interpolators hold the state of their last fit (and their calibration), so
+create() returns a new one on every call; the read-only setup they build on
+is cached per mesh (MAGIC-LAT mesh structures in memory, see
+magicLAT.meshStructures, and the quLATi eigenbasis on disk), so creating
+another interpolator for the same map is cheap.
+estimate() times each call (and records an 'estimate' stage with the method
+label when profiling is enabled, see profiling.py).
+
+Per-map state learned from samples (sparse GPR and quLATi hyperparameters) is set
+once by calibrate(), on training sets drawn from the master seed, before any
+trial runs; drivers call it in the parent process, so worker processes share
+the calibration and no estimate depends on the trials run before it.
+
+Usage:
+	interp = interpolators.create('magic', vertices, faces, edgeThreshold=50)
+	interpolators.calibrate({'magic': interp}, data, m, masterSeed)	# optional
+	latEst = interp.estimate(TrIdx, TrVal)	# (N,) estimate at every vertex
+	print(interp.lastTime)
+
+Backend packages (scikit-learn, quLATi) are imported when a method that needs
+them is created.
+
+Requirements: timeit, numpy, scipy
+
+File: interpolators.py
+--------------------------------------------------------------------------------
+"""
+
+from timeit import default_timer as timer
+
+import numpy as np
+
+# KD-Tree for mapping to nearest point
+from scipy.spatial import cKDTree
+
+import profiling
+import trials
+import utils
+
+
+# training sets drawn for calibrate()
+CALIBRATION_SPLITS		=		3
+
+
+class Interpolator:
+	"""
+	Base class.  Subclasses do the mesh-level setup in __init__ and implement
+	fit() and predict(); estimate() is the timed combination used by drivers.
+	"""
+
+	label = ''
+
+	def __init__(self, V, F):
+		self.V = np.asarray(V)
+		self.F = np.array(F, dtype='int')
+		self.setupTime = 0.0
+		self.lastTime = 0.0
+		self.totalTime = 0.0
+		self.calls = 0
+
+	def reset(self):
+		""" Forgets state carried between successive fits (warm starts). """
+		pass
+
+	def calibrate(self, splits):
+		""" Learns per-map state from the (trIdx, trVal) training sets (no-op by default). """
+		pass
+
+	def fit(self, trIdx, trVal):
+		self.trIdx = np.asarray(trIdx, dtype=int)
+		self.trVal = np.asarray(trVal, dtype=float).reshape(-1)
+		return self
+
+	def predict(self, x0=None):
+		raise NotImplementedError
+
+	def estimate(self, trIdx, trVal, x0=None):
+		"""
+		Fits the samples trVal at vertex indices trIdx and returns the (N,)
+		estimate at every vertex.  x0 is an optional initial guess, used by
+		methods that support warm starts.
+		"""
+		start = timer()
+		with profiling.stage('estimate', method=self.label, n=len(self.V), m=len(trIdx)):
+			est = np.asarray(self.fit(trIdx, trVal).predict(x0=x0)).reshape(-1)
+		self.lastTime = timer() - start
+
+		self.totalTime += self.lastTime
+		self.calls += 1
+
+		return est
+
+
+class MagicInterpolator(Interpolator):
+
+	label = 'MAGIC-LAT'
+
+	def __init__(self, V, F, edgeThreshold=50, alpha=1e-5, beta=1e-2, solver='inv', reorder='rcm'):
+		super().__init__(V, F)
+		from magicLAT import MagicLATModel
+
+		self.model = MagicLATModel(V, F, edgeThreshold, alpha, beta, solver, reorder)
+
+	@property
+	def alpha(self):
+		return self.model.alpha
+
+	@property
+	def beta(self):
+		return self.model.beta
+
+	def fit(self, trIdx, trVal):
+		self.model.fit(trIdx, trVal)
+		return self
+
+	def predict(self, x0=None):
+		return self.model.predict(x0=x0)
+
+
+class UnweightedMagicInterpolator(Interpolator):
+
+	label = 'MAGIC-LAT (unw.)'
+
+	def __init__(self, V, F, edgeThreshold=50, alpha=1e-5, beta=1e-2):
+		super().__init__(V, F)
+		self.edgeThreshold = edgeThreshold
+		self.alpha = alpha
+		self.beta = beta
+
+	def predict(self, x0=None):
+		from magicLATunweighted import magicLATunweighted
+
+		return magicLATunweighted(self.V, self.F, list(self.trIdx), self.V[self.trIdx], list(self.trVal),
+			self.edgeThreshold, self.alpha, self.beta)
+
+
+class GPRInterpolator(Interpolator):
+	"""
+	GPR on the vertex coordinates.  With warm=True each fit starts its kernel
+	optimization from the previous optimum (until reset()).  In sparse mode,
+	calibrate() optimizes the hyperparameters once on the union of the
+	calibration sets, and fits reuse them.
+	"""
+
+	label = 'GPR'
+
+	def __init__(self, V, F, mode='exact', warm=False):
+		super().__init__(V, F)
+		from sklearn.gaussian_process.kernels import RBF
+		import gprHelper
+
+		self.mode = mode
+		self.warm = warm
+		self.kernel = RBF(length_scale=0.01) + RBF(length_scale=0.1) + RBF(length_scale=1)
+		self.gpr = gprHelper.gprModel(self.kernel, mode)
+
+	def reset(self):
+		if self.mode == 'exact':
+			self.gpr.set_params(kernel=self.kernel)
+
+	def calibrate(self, splits):
+		if self.mode == 'sparse':
+			samples = {}
+			for (trIdx, trVal) in splits:
+				samples.update(zip(np.asarray(trIdx, dtype=int), np.asarray(trVal, dtype=float).reshape(-1)))
+			idx = sorted(samples.keys())
+			self.gpr.calibrate(self.V[idx], [samples[i] for i in idx])
+
+	def fit(self, trIdx, trVal):
+		super().fit(trIdx, trVal)
+		self.gpr.fit(self.V[self.trIdx], self.trVal)
+		if self.warm and self.mode == 'exact':
+			self.gpr.set_params(kernel=self.gpr.kernel_)
+		return self
+
+	def predict(self, x0=None):
+		return self.gpr.predict(self.V, return_std=False)
+
+
+class QuLATiInterpolator(Interpolator):
+	"""
+	quLATi on the cached mesh eigenbasis; hyper selects the hyperparameter mode
+	(restart1 and freeze reuse the values set by calibrate()).
+	"""
+
+	label = 'quLATi'
+
+	def __init__(self, V, F, hyper='full'):
+		super().__init__(V, F)
+		import quLATiHelper
+
+		self.helper = quLATiHelper
+		self.model = quLATiHelper.quLATiModel(None, self.V, self.F)
+		self.hyper = quLATiHelper.HyperParams(hyper)
+
+	def calibrate(self, splits):
+		self.hyper.calibrate(self.model, splits)
+
+	def predict(self, x0=None):
+		return self.helper.quLATi(self.trIdx, self.trVal, self.V, self.model, self.hyper)
+
+
+class NNInterpolator(Interpolator):
+	""" Each vertex takes the value of the nearest sampled vertex. """
+
+	label = 'NN'
+
+	def predict(self, x0=None):
+		[_, nearest] = cKDTree(self.V[self.trIdx]).query(self.V, k=1)
+		return self.trVal[nearest]
+
+
+INTERPOLATORS = {
+	'magic': MagicInterpolator,
+	'magic-unweighted': UnweightedMagicInterpolator,
+	'gpr': GPRInterpolator,
+	'quLATi': QuLATiInterpolator,
+	'nn': NNInterpolator
+}
+
+
+def create(name, V, F, **options):
+	"""
+	Returns a new interpolator of the named method for the mesh (its setup is
+	timed in setupTime).
+	"""
+	if name not in INTERPOLATORS:
+		raise ValueError('unknown interpolation method \'{}\', choose from: {}'.format(name, ', '.join(INTERPOLATORS.keys())))
+
+	start = timer()
+	interp = INTERPOLATORS[name](V, F, **options)
+	interp.setupTime = timer() - start
+
+	return interp
+
+
+def calibrate(interps, data, numSamps, masterSeed, num=CALIBRATION_SPLITS):
+	"""
+	Calibrates the interpolators (dict method name -> interpolator) of the map
+	data (preprocess.MapData) on num training sets of numSamps samples, drawn
+	from the streams (map, 'calibration', m, k) of the master seed; each
+	method's own randomness comes from (map, method, 'calibration', m).
+	"""
+	splits = []
+	for k in range(num):
+		rng = trials.stream(masterSeed, data.mapName, 'calibration', numSamps, k)
+		tr_i, _ = utils.sampleTrainTest(data.sampLst, data.M, numSamps, rng)
+		trIdx = sorted(np.take(data.latIdx, tr_i))
+		splits.append((trIdx, [data.mapLAT[i] for i in trIdx]))
+
+	for (method, interp) in interps.items():
+		np.random.seed(trials.streamSeed(masterSeed, data.mapName, method, 'calibration', numSamps))
+		interp.calibrate(splits)
@@ -5,7 +5,7 @@ MAGIC-LAT implementation.
 
 Description: Implements MAGIC-LAT and associated sub-functions.
 
-Requirements: numpy, math, robust_laplacian, scipy
+Requirements: numpy, math, robust_laplacian, scipy, pyamg (optional)
 
 File: magicLAT.py
 
@@ -20,12 +20,21 @@ import math
 # Robust cotan-based Laplacian for triangle mesh
 import robust_laplacian
 
-# nearest-neighbor interpolation
-from scipy.interpolate import griddata
-
 # KD-Tree for mapping to nearest point
 from scipy.spatial import cKDTree
 
+# system assembly and solver backends
+import solvers
+
+# fill-reducing vertex reordering
+import ordering
+
+# per-mesh memoization
+import cache
+
+# stage timing (off by default)
+import profiling
+
 
 def updateFaces(V, F, latTiled, knownV, thresh):
 	"""
@@ -83,56 +92,226 @@ def updateFaces(V, F, latTiled, knownV, thresh):
 	return np.array(newF, dtype='int')
 
 
-def magicLAT(V, F, trIdx, trCoord, trLAT, edgeThreshold=50, alpha=1e-5, beta=1e-2):
+def meshEdges(F):
+	"""
+	Returns the unique edges of the triangle mesh as an (E,2) array and, for
+	every triangle, the indices of its three edges (v0-v1, v1-v2, v2-v0).
+	"""
+	F = np.asarray(F, dtype=int)
+
+	halfEdges = np.concatenate((F[:, [0, 1]], F[:, [1, 2]], F[:, [2, 0]]))
+	halfEdges = np.sort(halfEdges, axis=1)
 
-	N = len(V)	# number of vertices in the graph
-	M = len(trIdx)			# number of signal samples
+	edges, inv = np.unique(halfEdges, axis=0, return_inverse=True)
+	faceEdges = np.asarray(inv).reshape(3, len(F)).T
 
-	IDX = [i for i in range(N)]
-	COORD = [V[i] for i in IDX]
-	lat = np.zeros((N,1))
+	return edges, faceEdges
 
-	trCoord = [V[i] for i in trIdx]
 
-	# (short) lists of sampled vertices, coordinates, and  LAT values
-	for i in range(M):
-		verIdx = trIdx[i]
-		lat[verIdx] = trLAT[i]
+class MeshStructures:
+	"""
+	Mesh-level structures of MAGIC-LAT for one mesh and vertex ordering: the
+	ordering (perm, iperm, None if reorder is None), the reordered vertices V
+	and triangles F, the vertex KD-tree, the unique edges and the edges of
+	each triangle, and the Laplacian L of the full mesh.  They are shared by
+	every model on the mesh (see meshStructures()) and read-only.
+	"""
 
-	# NN interpolation of unknown vertices
-	latNN = [0 for i in range(N)]
-	unknownCoord = [COORD[i] for i in range(N) if i not in trIdx]
-	unknownCoord = griddata(np.array(trCoord), np.array(trLAT), np.array(unknownCoord), method='nearest')
-	currIdx = 0
-	for i in range(N):
-		if i not in trIdx:
-			latNN[i] = unknownCoord[currIdx]
-			currIdx += 1
+	def __init__(self, V, F, reorder='rcm'):
+		if reorder is not None:
+			self.V, self.F, self.perm = ordering.reorderMesh(V, F, reorder)
+			self.iperm = ordering.inversePerm(self.perm)
 		else:
-			latNN[i] = lat[i]
+			self.V = np.array(V)
+			self.F = np.array(F, dtype='int')
+			self.perm = None
+			self.iperm = None
 
-	faces = updateFaces(V, F, latNN, trCoord, edgeThreshold)
+		# KD Tree to map sample coordinates to the nearest mesh vertex
+		self.tree = cKDTree(self.V)
 
-	L, _ = robust_laplacian.mesh_laplacian(V, faces)
+		# unique edges and the edges of each triangle
+		self.edges, self.faceEdges = meshEdges(self.F)
 
-	latEst = np.zeros((N,1))
+		# Laplacian of the full mesh, reused whenever no faces are removed
+		self.L, _ = robust_laplacian.mesh_laplacian(self.V, self.F)
 
-	M_l = np.zeros((N,N))
-	M_u = np.zeros((N,N))
+		for arr in [self.V, self.F, self.perm, self.iperm, self.edges, self.faceEdges, self.L.data]:
+			if arr is not None:
+				arr.flags.writeable = False
 
-	for i in range(N):
-		if i in trIdx:
-			M_l[i,i] = float(1)
-		else:
-			M_u[i,i] = float(1)
 
+def meshStructures(V, F, reorder='rcm'):
+	""" Returns the MeshStructures of the mesh, cached per mesh and ordering. """
+	return cache.memoize(cache.meshKey(V, F, 'magicMesh', reorder), lambda: MeshStructures(V, F, reorder))
+
+
+class MagicLATModel:
+	"""
+	MAGIC-LAT interpolation on a fixed mesh.
+
+	The mesh-level structures (vertex ordering, vertex KD-tree, edge structure
+	and the Laplacian of the full mesh) are computed once per mesh and shared
+	by all models on it (meshStructures()); fit() then only does the
+	per-sample-set work (nearest-neighbor tiling, edge removal and system
+	assembly) and predict() solves the system.
 
-	T = np.linalg.inv(M_l + alpha*M_u + beta*L)
+	A model holds the state of its last fit(), and alpha and beta may be
+	changed between fits, so a model must not be shared between threads;
+	create one per caller (cheap once the mesh structures are cached).
 
-	latEst = np.matmul(T, lat)
+		model = MagicLATModel(vertices, faces, EDGE_THRESHOLD)
+		latEst = model.fit(TrIdx, TrVal).predict()
 
-	for i in range(N):
-		if i in trIdx:
-			latEst[i] = lat[i]
+	Vertex indices passed in and estimates returned are always in the original
+	(input) vertex numbering.
+
+	The stages of setup, fit() and predict() are timed when profiling is
+	enabled (see profiling.py), with the mesh size n, sample count m and the
+	fraction of faces removed (faceRemoval).
+	"""
+
+	def __init__(self, V, F, edgeThreshold=50, alpha=1e-5, beta=1e-2, solver='inv', reorder='rcm'):
+		"""
+		solver: name of the linear system backend (see solvers.SOLVERS)
+		reorder: vertex ordering applied internally (see ordering.ORDERINGS),
+			or None to use the mesh as given
+		"""
+		self.edgeThreshold = edgeThreshold
+		self.alpha = alpha
+		self.beta = beta
+		self.solver = solver
+
+		self.N = len(V)
+
+		with profiling.stage('magic.setup', n=self.N):
+			mesh = meshStructures(V, F, reorder)
+
+		(self.V, self.F, self.perm, self.iperm) = (mesh.V, mesh.F, mesh.perm, mesh.iperm)
+		(self.tree, self.edges, self.faceEdges, self.L) = (mesh.tree, mesh.edges, mesh.faceEdges, mesh.L)
+
+		self.trIdx = None
+		self.lat = None
+		self.A = None
+		self.faceRemoval = 0.0
+
+	def _toInternal(self, idx):
+		""" Maps original vertex indices to the model's vertex numbering. """
+		idx = np.asarray(idx, dtype=int)
+		if self.iperm is None:
+			return idx
+		return self.iperm[idx]
+
+	def _toOriginal(self, x):
+		""" Maps a per-vertex array in the model's numbering to the original numbering. """
+		if self.perm is None:
+			return x
+		return ordering.unpermute(x, self.perm)
+
+	def updateFaces(self, latNN, knownDist):
+		"""
+		Vectorized equivalent of updateFaces(): keeps a triangle only if each
+		of its edges has a LAT delta < edgeThreshold or an endpoint further
+		than 15 from the nearest measured vertex.
+		"""
+		v0 = self.edges[:, 0]
+		v1 = self.edges[:, 1]
+
+		keepEdge = (np.abs(latNN[v0] - latNN[v1]) < self.edgeThreshold) | (knownDist[v0] > 15) | (knownDist[v1] > 15)
+
+		return np.all(keepEdge[self.faceEdges], axis=1)
+
+	def fit(self, trIdx, trLAT):
+		"""
+		Sets the LAT samples trLAT at (original) vertex indices trIdx and
+		assembles the MAGIC-LAT system.  Returns the model.
+		"""
+		trIdx = self._toInternal(trIdx)
+		trLAT = np.asarray(trLAT, dtype=float).reshape(-1)
+
+		with profiling.stage('magic.fit', n=self.N, m=len(trIdx)):
+			lat = np.zeros((self.N, 1))
+			lat[trIdx, 0] = trLAT
+
+			with profiling.stage('magic.nn'):
+				# NN interpolation of unknown vertices
+				knownTree = cKDTree(self.V[trIdx])
+				[_, nearest] = knownTree.query(self.V, k=1)
+				latNN = trLAT[nearest]
+				latNN[trIdx] = trLAT
+
+				# distance from each vertex to the nearest other known vertex
+				[d, _] = knownTree.query(self.V, k=2)
+				knownDist = np.where(d[:, 0] > 0, d[:, 0], d[:, 1])
+
+			with profiling.stage('magic.updateFaces'):
+				keep = self.updateFaces(latNN, knownDist)
+
+			self.faceRemoval = 1.0 - np.count_nonzero(keep)/max(len(keep), 1)
+			profiling.annotate(faceRemoval=self.faceRemoval)
+
+			with profiling.stage('magic.laplacian'):
+				if np.all(keep):
+					L = self.L
+				else:
+					L, _ = robust_laplacian.mesh_laplacian(self.V, self.F[keep])
+
+			self.trIdx = trIdx
+			self.lat = lat
+			with profiling.stage('magic.assembly'):
+				self.A = solvers.systemMatrix(self.N, trIdx, L, self.alpha, self.beta)
+
+		return self
+
+	def fitCoords(self, trCoord, trLAT):
+		"""
+		Same as fit(), with the samples given at coordinates that are mapped
+		to their nearest mesh vertex.
+		"""
+		[_, nearest] = self.tree.query(np.asarray(trCoord), k=1)
+		if self.perm is not None:
+			nearest = self.perm[nearest]
+
+		return self.fit(nearest, trLAT)
+
+	def predict(self, x0=None):
+		"""
+		Solves the assembled system and returns the (N,1) LAT estimate for
+		every vertex, in the original vertex numbering.  x0 is an optional
+		initial guess (e.g. a previous estimate) for the iterative solvers.
+		"""
+		if self.A is None:
+			raise RuntimeError('MagicLATModel.predict() called before fit()')
+
+		if x0 is not None and self.perm is not None:
+			x0 = np.asarray(x0).reshape(-1)[self.perm]
+
+		with profiling.stage('magic.solve', n=self.N, m=len(self.trIdx), faceRemoval=self.faceRemoval, solver=self.solver):
+			latEst = solvers.solve(self.A, self.lat, method=self.solver,
+				V=self.V, F=self.F, alpha=self.alpha, beta=self.beta, x0=x0)
+
+		with profiling.stage('magic.overwrite', n=self.N, m=len(self.trIdx), faceRemoval=self.faceRemoval):
+			latEst[self.trIdx] = self.lat[self.trIdx]
+			latEst = self._toOriginal(latEst)
+
+		return latEst
+
+
+def magicLAT(V, F, trIdx, trCoord, trLAT, edgeThreshold=50, alpha=1e-5, beta=1e-2, solver='inv', reorder='rcm'):
+	"""
+	Estimates the LAT signal on every mesh vertex from the samples trLAT at
+	vertices trIdx (trCoord is unused and kept for compatibility).
+
+	Thin wrapper around MagicLATModel.  Each call fits its own model, so
+	concurrent calls do not share state; the mesh-level structures are cached
+	per mesh, so repeated calls on the same mesh reuse the mesh-level work.
+
+	solver: name of the linear system backend (see solvers.SOLVERS), e.g.
+		'inv' (dense, default), 'direct', 'mixed', 'cg', 'amg' or 'schwarz'
+	reorder: vertex ordering applied internally (see ordering.ORDERINGS), or
+		None to use the mesh as given.  The estimate is always returned in the
+		original vertex numbering.
+	"""
+	model = MagicLATModel(V, F, edgeThreshold, alpha, beta, solver, reorder)
 
-	return latEst
+	return model.fit(trIdx, trLAT).predict()
@@ -3,9 +3,15 @@
 Performance metric functions.
 --------------------------------------------------------------------------------
 
-Description: LAT interpolation performance metrics.
+Description: LAT interpolation performance metrics.  evaluate() computes
+several metrics for a whole batch of trials at once; the calc* functions are
+single-trial shortcuts to it.  deltaE maps the LAT values to colormap entries
+and looks up a precomputed CIEDE2000 table for the colormap.
 
-Requirements: numpy, cv2, matplotlib, colour
+matplotlib (colormaps) and OpenCV (colour conversion) are only imported by
+the first deltaE computation, so the other metrics need numpy only.
+
+Requirements: numpy, matplotlib and cv2 (deltaE only)
 
 File: metrics.py
 
@@ -16,48 +22,195 @@ Email: jenniferhellar@gmail.com
 
 import numpy as np
 
-import cv2
-import matplotlib.cm as cm
-from matplotlib.colors import Normalize
-import colour
 
+# colormap used for deltaE unless another is given (matplotlib name)
+DEFAULT_CMAP			=		'viridis_r'
 
-def deltaE(trueVals, estVals, MINLAT, MAXLAT, cmap=cm.viridis_r):
-	norm = Normalize(vmin=MINLAT, vmax=MAXLAT)
-	m = cm.ScalarMappable(norm=norm, cmap=cmap)
+# per-colormap tables: LAB color of every colormap entry and the CIEDE2000
+# difference between every pair of entries
+_deltaETables = {}
 
-	trueVals = list(np.array(trueVals).flatten())
-	estVals = list(np.array(estVals).flatten())
 
-	trueColors = m.to_rgba(trueVals)[:,:3]	# multiply by 255 for RGB
+def ciede2000(lab1, lab2):
+	"""
+	CIEDE2000 color difference (kL = kC = kH = 1) between arrays of CIE L*a*b*
+	colors of shape (..., 3), vectorized over the leading dimensions.
+	"""
+	lab1 = np.asarray(lab1, dtype=float)
+	lab2 = np.asarray(lab2, dtype=float)
 
-	trueColors = np.array([trueColors])	# cvtColor req 2-dim array
+	L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+	L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
 
-	trueColors = cv2.cvtColor(trueColors.astype("float32"), cv2.COLOR_RGB2LAB)
-	estColors = m.to_rgba(estVals)[:,:3]
-	estColors = np.array([estColors])
-	estColors = cv2.cvtColor(estColors.astype("float32"), cv2.COLOR_RGB2LAB)
+	Cbar = 0.5*(np.hypot(a1, b1) + np.hypot(a2, b2))
+	G = 0.5*(1 - np.sqrt(Cbar**7 / (Cbar**7 + 25.0**7)))
 
-	dE = np.mean(colour.delta_E(trueColors, estColors, method='CIE 2000'))
+	a1p = (1 + G)*a1
+	a2p = (1 + G)*a2
+	C1p = np.hypot(a1p, b1)
+	C2p = np.hypot(a2p, b2)
 
-	return dE
+	h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+	h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+	h1p[(b1 == 0) & (a1p == 0)] = 0
+	h2p[(b2 == 0) & (a2p == 0)] = 0
 
+	dLp = L2 - L1
+	dCp = C2p - C1p
 
-def calcMSE(sig, sigEst):
-	n = len(sig)
+	CC = C1p*C2p
+	dhp = h2p - h1p
+	dhp = np.where(dhp > 180, dhp - 360, dhp)
+	dhp = np.where(dhp < -180, dhp + 360, dhp)
+	dhp = np.where(CC == 0, 0, dhp)
+	dHp = 2*np.sqrt(CC)*np.sin(np.radians(dhp/2))
+
+	Lbarp = 0.5*(L1 + L2)
+	Cbarp = 0.5*(C1p + C2p)
+
+	hSum = h1p + h2p
+	hbarp = np.where(np.abs(h1p - h2p) > 180, np.where(hSum < 360, hSum + 360, hSum - 360), hSum)
+	hbarp = np.where(CC == 0, hSum, 0.5*hbarp)
+
+	T = (1 - 0.17*np.cos(np.radians(hbarp - 30)) + 0.24*np.cos(np.radians(2*hbarp))
+		+ 0.32*np.cos(np.radians(3*hbarp + 6)) - 0.20*np.cos(np.radians(4*hbarp - 63)))
+
+	dTheta = 30*np.exp(-((hbarp - 275)/25)**2)
+	RC = 2*np.sqrt(Cbarp**7 / (Cbarp**7 + 25.0**7))
+	SL = 1 + 0.015*(Lbarp - 50)**2 / np.sqrt(20 + (Lbarp - 50)**2)
+	SC = 1 + 0.045*Cbarp
+	SH = 1 + 0.015*Cbarp*T
+	RT = -np.sin(np.radians(2*dTheta))*RC
+
+	return np.sqrt((dLp/SL)**2 + (dCp/SC)**2 + (dHp/SH)**2 + RT*(dCp/SC)*(dHp/SH))
+
+
+def colormap(cmap=DEFAULT_CMAP):
+	""" Returns the matplotlib colormap for a colormap or colormap name. """
+	if isinstance(cmap, str):
+		import matplotlib.cm as cm
+		return getattr(cm, cmap)
+	return cmap
+
+
+def deltaETable(cmap=DEFAULT_CMAP):
+	"""
+	Returns the CIEDE2000 difference between every pair of colormap entries,
+	as an array indexed by the entry numbers from colorIndex().  The colormap
+	entries (including the under/over/bad colors) are converted to L*a*b* with
+	OpenCV once, and the table is cached per colormap.
+	"""
+	cmap = colormap(cmap)
+	if cmap.name not in _deltaETables:
+		import cv2
+
+		# integer inputs index the colormap entries directly
+		rgb = np.vstack([cmap(np.arange(cmap.N)), cmap.get_under(), cmap.get_over(), cmap.get_bad()])[:, :3]
+		lab = cv2.cvtColor(np.array([rgb]).astype('float32'), cv2.COLOR_RGB2LAB)[0]
+
+		_deltaETables[cmap.name] = ciede2000(lab[:, np.newaxis, :], lab[np.newaxis, :, :])
+
+	return _deltaETables[cmap.name]
+
+
+def colorIndex(vals, MINLAT, MAXLAT, cmap=DEFAULT_CMAP):
+	"""
+	Colormap entry of each LAT value for the color range [MINLAT, MAXLAT],
+	following matplotlib's normalization and binning exactly.
+	"""
+	from matplotlib.colors import Normalize
+
+	cmap = colormap(cmap)
+	x = np.asarray(Normalize(vmin=MINLAT, vmax=MAXLAT)(np.asarray(vals, dtype=float)), dtype=float)
+
+	N = cmap.N
+	x = x*N
+	x[x == N] = N - 1
+
+	with np.errstate(invalid='ignore'):
+		idx = np.floor(x).astype(int)
+	idx[x < 0] = N		# under
+	idx[x >= N] = N + 1	# over
+	idx[np.isnan(x)] = N + 2	# bad
+
+	return idx
+
+
+def deltaE(trueVals, estVals, MINLAT, MAXLAT, cmap=DEFAULT_CMAP, axis=None):
+	"""
+	Mean CIEDE2000 difference between the colors of the true and estimated
+	LAT values on the given colormap and color range.  Computed by table
+	lookup (see deltaETable()); with axis set, the mean is taken along that
+	axis only (e.g. axis=1 for a (trials, n) batch).
+	"""
+	cmap = colormap(cmap)
+	table = deltaETable(cmap)
+
+	iTrue = colorIndex(np.asarray(trueVals, dtype=float), MINLAT, MAXLAT, cmap)
+	iEst = colorIndex(np.asarray(estVals, dtype=float).reshape(iTrue.shape), MINLAT, MAXLAT, cmap)
 
-	err = [abs(sigEst[i] - sig[i]) for i in range(n)]
-	err = np.array(err)
+	return np.mean(table[iTrue, iEst], axis=axis)
 
-	mse = 1/n*np.sum(err ** 2)
 
-	return mse
+# metrics computed by evaluate() unless a subset is requested
+METRICS					=		['mse', 'mae', 'nmse', 'snr']
+
+
+def evaluate(sig, sigEst, metrics=METRICS, MINLAT=None, MAXLAT=None):
+	"""
+	Computes the requested metrics for a batch of trials in one vectorized pass.
+
+	sig and sigEst are (trials, n) arrays of true and estimated values (a
+	single (n,) trial is also accepted).  The error and signal power are
+	computed once and shared by all metrics.  'de2000' additionally requires
+	the MINLAT/MAXLAT colormap range.
+
+	Returns a dict mapping each metric name to an array with one value per
+	trial (a scalar for a single trial).
+	"""
+	sig = np.asarray(sig, dtype=float)
+	sigEst = np.asarray(sigEst, dtype=float)
+	single = (sig.ndim == 1)
+
+	sig = np.atleast_2d(sig)
+	sigEst = np.atleast_2d(sigEst).reshape(sig.shape)
+	n = sig.shape[1]
+
+	err = sigEst - sig
+	errPower = np.sum(err ** 2, axis=1)
+
+	res = {}
+	if 'mse' in metrics:
+		res['mse'] = errPower / n
+	if 'mae' in metrics:
+		res['mae'] = np.mean(np.abs(err), axis=1)
+	if ('nmse' in metrics) or ('snr' in metrics):
+		sigPower = np.sum((sig - np.mean(sig, axis=1, keepdims=True)) ** 2, axis=1)
+		if 'nmse' in metrics:
+			res['nmse'] = errPower / sigPower
+		if 'snr' in metrics:
+			res['snr'] = 20*np.log10(sigPower / errPower)
+	if 'de2000' in metrics:
+		if MINLAT is None or MAXLAT is None:
+			raise ValueError('the \'de2000\' metric requires MINLAT and MAXLAT')
+		res['de2000'] = deltaE(sig, sigEst, MINLAT, MAXLAT, axis=1)
+
+	unknown = [name for name in metrics if name not in res]
+	if unknown:
+		raise ValueError('unknown metrics: {}'.format(', '.join(unknown)))
+
+	if single:
+		res = {name: val[0] for (name, val) in res.items()}
+
+	return res
+
+
+def calcMSE(sig, sigEst):
+	return evaluate(sig, sigEst, ['mse'])['mse']
 
 
 def calcMAE(sig, sigEst):
-	delta = [abs(sig[i] - sigEst[i]) for i in range(len(sig))]
-	delta = np.array(delta)
-	return np.average(delta)
+	return evaluate(sig, sigEst, ['mae'])['mae']
 
 
 def calcNMSE(sig, sigEst, multichannel=False):
@@ -71,27 +224,10 @@ def calcNMSE(sig, sigEst, multichannel=False):
 
 		nmse = err / sigPower
 	else:
-		n = len(sig)
-
-		err = [abs(sigEst[i] - sig[i]) for i in range(n)]
-		err = np.array(err)
-
-		sigKnown = [sig[i] for i in range(n)]
-		sigPower = np.sum((np.array(sigKnown) - np.mean(sigKnown)) ** 2)
-
-		nmse = np.sum(err ** 2)/sigPower
+		nmse = evaluate(sig, sigEst, ['nmse'])['nmse']
 
 	return nmse
 
 
 def calcSNR(sig, sigEst):
-	n = len(sig)
-	err = [abs(sigEst[i] - sig[i]) for i in range(n)]
-	err = np.array(err)
-
-	sigKnown = [sig[i] for i in range(n)]
-	sigPower = np.sum((np.array(sigKnown) - np.mean(sigKnown)) ** 2)
-
-	snr = 20*np.log10(sigPower/np.sum(err ** 2))
-
-	return snr
\ No newline at end of file
+	return evaluate(sig, sigEst, ['snr'])['snr']
@@ -7,9 +7,25 @@ Description: Computes MAGIC-LAT error metrics for test sets of 100 vertices with
 either coarse or fine regularization parameters.  Results written out to text
 files.
 
+The grid search runs as a set of independent (alpha, beta, trial) jobs on a
+pool of worker processes.  Each job result is committed to a checkpoint store
+as soon as it completes; a restarted run (same map, repeats and output
+directory) skips completed jobs and reuses the stored master seed; it must
+use the same anomaly removal, edge threshold and grid as the stored run.  The
+checkpoint is removed once the run completes, so a new run draws (or takes
+with -s) a new seed.  Metrics
+are aggregated per (alpha, beta) cell as jobs complete, with live progress.
+Trial t draws its split from the random stream (map, m, t) of the master seed
+(trials.streamSeed), so every (alpha, beta) cell is evaluated on the same
+splits, whatever the number of workers.
+The text files are produced once every job has completed, and the
+per-trial results are added to the results store (see results.py).
+
 Results independently plotted.
 
-Requirements: os, argparse, numpy, math, random
+usage: params.py [-h] -i IDX [-a ANOMALIES_REMOVED] -r REPEAT [-w WORKERS] [-s SEED]
+
+Requirements: os, argparse, timeit, numpy, random, multiprocessing, sqlite3
 
 File: params.py
 
@@ -21,20 +37,22 @@ Email: jenniferhellar@gmail.com
 """
 
 import os
+from timeit import default_timer as timer
 import argparse
 
 import numpy as np
-import math
 import random
 
-# functions to read the files
-from readMesh import readMesh
-from readLAT import readLAT
-
 import utils
 import metrics
-from const import DATADIR, DATAFILES
-from magicLAT import magicLAT
+from magicLAT import MagicLATModel
+
+import datasets
+import preprocess
+import trials
+import results
+from accumulators import Accumulators
+from checkpoint import CheckpointStore
 
 
 NUM_TRAIN_SAMPS 		= 		100
@@ -51,175 +69,171 @@ else:
 	exit(0)
 
 
-""" Parse the input for data index argument. """
-parser = argparse.ArgumentParser(
-    description='Processes a single mesh file repeatedly for comparison of MAGIC-LAT, GPR, and quLATi performance.')
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Processes a single mesh file repeatedly for comparison of MAGIC-LAT, GPR, and quLATi performance.')
 
-parser.add_argument('-i', '--idx', required=True, default='11',
-                    help='Data index to process. \
-                    Default: 11')
+	parser.add_argument('-i', '--idx', required=True, default='11',
+	                    help='Data index or map ID (e.g. p037_9) to process. \
+	                    Default: 11')
 
-parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
-                    help='Remove anomalous points (disable: 0, enable: 1). \
-                    Default: 1')
+	parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
+	                    help='Remove anomalous points (disable: 0, enable: 1). \
+	                    Default: 1')
 
-parser.add_argument('-r', '--repeat', required=True, default=20,
-                    help='Number of test repetitions. \
-                    Default: 20')
+	parser.add_argument('-r', '--repeat', required=True, default=20,
+	                    help='Number of test repetitions. \
+	                    Default: 20')
 
-args = parser.parse_args()
+	parser.add_argument('-w', '--workers', required=False, default=1,
+	                    help='Number of worker processes. \
+	                    Default: 1')
 
-PATIENT_IDX				=		int(vars(args)['idx'])
-NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
-remove_anomalies		=		int(vars(args)['anomalies_removed'])
+	parser.add_argument('-s', '--seed', required=False, default=None,
+	                    help='Master random seed for a new run (a resumed run keeps its stored seed). \
+	                    Default: random')
 
-""" Obtain file names, patient number, mesh id, etc. """
-(meshFile, latFile, ablFile) = DATAFILES[PATIENT_IDX]
+	args = parser.parse_args(argv)
 
-nm = meshFile[0:-5]
-patient = nm[7:10]
-id = latFile.split('_')[3]
+	PATIENT_IDX				=		datasets.index(vars(args)['idx'])
+	NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
+	remove_anomalies		=		int(vars(args)['anomalies_removed'])
+	NUM_WORKERS				=		int(vars(args)['workers'])
 
-# create a results directory
-resDir = os.path.join('..','res_reg')
-if not os.path.isdir(resDir):
-	os.makedirs(resDir)
+	""" Preprocess the map (shared, cached) """
+	data = preprocess.loadMap(PATIENT_IDX, remove_anomalies)
 
-resFileNMSE = os.path.join(resDir, 'p{}_t{:g}_m{:g}_r{:g}_nmse.txt'.format(patient, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
-with open(resFileNMSE, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('alpha', 'beta', 'mean', 'std'))
+	(patient, id, mapName) = (data.patient, data.id, data.mapName)
+	(latIdx, mapLAT, M) = (data.latIdx, data.mapLAT, data.M)
 
-resFileSNR = os.path.join(resDir, 'p{}_t{:g}_m{:g}_r{:g}_snr.txt'.format(patient, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
-with open(resFileSNR, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('alpha', 'beta', 'mean', 'std'))
+	# create a results directory
+	resDir = os.path.join('..','res_reg')
+	if not os.path.isdir(resDir):
+		os.makedirs(resDir)
 
-resFileMAE = os.path.join(resDir, 'p{}_t{:g}_m{:g}_r{:g}_mae.txt'.format(patient, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
-with open(resFileMAE, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('alpha', 'beta', 'mean', 'std'))
+	(MINLAT, MAXLAT) = preprocess.roundedRange(data.allLatVal)
 
-resFileDE2000 = os.path.join(resDir, 'p{}_t{:g}_m{:g}_r{:g}_de2000.txt'.format(patient, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
-with open(resFileDE2000, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('alpha', 'beta', 'mean', 'std'))
+	""" Checkpoint store: one record per completed (alpha, beta, trial) job """
+	ckptFile = os.path.join(resDir, 'p{}_{}_t{:g}_m{:g}_r{:g}_ckpt.sqlite'.format(patient, id, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
+	store = CheckpointStore(ckptFile)
 
-print('Reading files for ' + nm + ' ...\n')
-[vertices, faces] = readMesh(os.path.join(DATADIR, meshFile))
-[OrigLatCoords, OrigLatVals] = readLAT(os.path.join(DATADIR, latFile))
+	if vars(args)['seed'] is None:
+		SEED = store.meta('seed', trials.newMasterSeed())
+	else:
+		SEED = store.meta('seed', int(vars(args)['seed']))
+		if SEED != int(vars(args)['seed']):
+			print('Resuming run with stored seed {:d} (ignoring -s).'.format(SEED))
+	if store.meta('seeding', trials.SEEDING if len(store) == 0 else 1) != trials.SEEDING:
+		parser.error('checkpoint ' + ckptFile + ' uses an older seed derivation, remove it to rerun')
 
-n = len(vertices)
+	# the checkpointed jobs hold results for this configuration only
+	CONFIG = {'edgeThreshold': EDGE_THRESHOLD, 'anomaliesRemoved': remove_anomalies, 'alphas': alphas, 'betas': betas}
+	if store.meta('config', CONFIG if len(store) == 0 else None) != CONFIG:
+		parser.error('checkpoint ' + ckptFile + ' was written with another edge threshold, anomaly removal or grid, rerun with the same options or remove it')
 
-mapIdx = [i for i in range(n)]
-mapCoord = [vertices[i] for i in mapIdx]
+	""" Create the MAGIC-LAT model (mesh-level structures computed once) """
+	magicModel = MagicLATModel(data.vertices, data.faces, EDGE_THRESHOLD)
 
-allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
 
-M = len(allLatIdx)
+	def runJob(alpha, beta, test, seed):
+		""" One random train/test split for one (alpha, beta) cell; returns the metrics. """
+		rng = random.Random(seed)
 
-# Identify and exclude anomalous LAT samples
-anomalous = np.zeros(M)
-if remove_anomalies:
-	anomIdx = []	
-	if PATIENT_IDX == 4:
-		anomIdx = [25, 112, 159, 218, 240, 242, 264]
-	elif PATIENT_IDX == 5:
-		anomIdx = [119, 150, 166, 179, 188, 191, 209, 238]
-	elif PATIENT_IDX == 6:
-		anomIdx = [11, 12, 59, 63, 91, 120, 156]
-	elif PATIENT_IDX ==7:
-		anomIdx = [79, 98, 137, 205]
-	elif PATIENT_IDX == 8:
-		anomIdx = [10, 11, 51, 56, 85, 105, 125, 143, 156, 158, 169, 181, 210, 269, 284, 329, 336, 357, 365, 369, 400, 405]
-	elif PATIENT_IDX == 9:
-		anomIdx = [0, 48, 255, 322]
-	else:
-		anomalous = utils.isAnomalous(allLatCoord, allLatVal)
-	anomalous[anomIdx] = 1
-else:
-	anomalous = [0 for i in range(M)]
+		tr_i, tst_i = utils.sampleTrainTest(data.sampLst, M, NUM_TRAIN_SAMPS, rng)
+
+		# get map indices of training/test vertices
+		TrIdx = sorted(np.take(latIdx, tr_i))
+		TstIdx = sorted(np.take(latIdx, tst_i))
+
+		# get training values
+		TrVal = [mapLAT[i] for i in TrIdx]
 
-numPtsIgnored = np.sum(anomalous)
 
-latIdx = [allLatIdx[i] for i in range(M) if anomalous[i] == 0]
-latCoords = [allLatCoord[i] for i in range(M) if anomalous[i] == 0]
-latVals = [allLatVal[i] for i in range(M) if anomalous[i] == 0]
+		""" MAGIC-LAT estimate """
+		start = timer()
+		magicModel.alpha = alpha
+		magicModel.beta = beta
+		latEst = magicModel.fit(TrIdx, TrVal).predict()
+		runtime = timer() - start
 
-M = len(latIdx)
 
-mapLAT = [0 for i in range(n)]
-for i in range(M):
-	mapLAT[latIdx[i]] = latVals[i]
+		""" Error metrics """
+		TstVal = [mapLAT[i] for i in TstIdx]
+		TstValEst = latEst[TstIdx]
 
+		ev = metrics.evaluate(TstVal, TstValEst, ['nmse', 'snr', 'mae', 'de2000'], MINLAT, MAXLAT)
+		res = {name: float(val) for (name, val) in ev.items()}
 
+		res['runtime'] = runtime
 
-""" Sampling """
-sampLst = utils.getModifiedSampList(latVals)
+		return res
 
-MINLAT = math.floor(min(allLatVal)/10)*10
-MAXLAT = math.ceil(max(allLatVal)/10)*10
 
-for a_idx in range(len(alphas)):
-	alpha = alphas[a_idx]
+	""" Job graph: every (alpha, beta, trial) cell, with the split seed of its trial """
+	allJobs = [(alpha, beta, test) for alpha in alphas for beta in betas for test in range(NUM_TEST_REPEATS)]
+	seeds = {job: trials.streamSeed(SEED, mapName, NUM_TRAIN_SAMPS, job[2]) for job in allJobs}
 
-	for b_idx in range(len(betas)):
-		beta = betas[b_idx]
+	todo = [job + (seeds[job],) for job in allJobs if job not in store]
 
-		print('\nCross-validating alpha=' + str(alpha) + ', beta=' + str(beta))
+	print('\n{:g} of {:g} jobs already completed, {:g} to run.'.format(len(allJobs) - len(todo), len(allJobs), len(todo)))
 
-		magicNMSE = [0 for i in range(NUM_TEST_REPEATS)]
-		magicSNR = [0 for i in range(NUM_TEST_REPEATS)]
-		magicMAE = [0 for i in range(NUM_TEST_REPEATS)]
-		magicDE2000 = [0 for i in range(NUM_TEST_REPEATS)]
 
-		for test in range(NUM_TEST_REPEATS):
-			
-			print('test #{:g} of {:g}.'.format(test + 1, NUM_TEST_REPEATS))
+	def cellName(alpha, beta, metric):
+		return 'a={:g},b={:g}/{}'.format(alpha, beta, metric)
 
-			samps = sampLst
 
-			tr_i = []
-			for i in range(NUM_TRAIN_SAMPS):
-				elem = random.sample(samps, 1)[0]
-				tr_i.append(elem)
-				samps = [i for i in samps if i != elem]	# to prevent repeats
-			tst_i = [i for i in range(M) if i not in tr_i]
+	def aggregate(acc, alpha, beta, res):
+		for metric in ['nmse', 'snr', 'mae', 'de2000']:
+			acc.add(cellName(alpha, beta, metric), res[metric])
 
-			# get map indices of training/test vertices
-			TrIdx = sorted(np.take(latIdx, tr_i))
-			TstIdx = sorted(np.take(latIdx, tst_i))
 
-			# get training values and coordinates
-			TrVal = [mapLAT[i] for i in TrIdx]
-			TrCoord = [mapCoord[i] for i in TrIdx]
+	""" Running aggregates per (alpha, beta) cell, starting from the completed jobs """
+	acc = Accumulators()
+	for ((alpha, beta, test), res) in store.items():
+		aggregate(acc, alpha, beta, res)
 
 
-			""" MAGIC-LAT estimate """
-			latEst = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD, alpha, beta)
+	def jobDone(job, res):
+		(alpha, beta, test, seed) = job
+		store.put((alpha, beta, test), res)
+		aggregate(acc, alpha, beta, res)
+		print('alpha={:g}, beta={:g}, test #{:g} of {:g} done.'.format(alpha, beta, test + 1, NUM_TEST_REPEATS))
+		print(acc.progress([cellName(alpha, beta, 'de2000')]))
 
+	trials.runJobs(runJob, todo, NUM_WORKERS, callback=jobDone)
 
-			""" Error metrics """
-			TstVal = [mapLAT[i] for i in TstIdx]
-			TstValEst = latEst[TstIdx]
 
-			magicNMSE[test] = metrics.calcNMSE(TstVal, TstValEst)
-			magicSNR[test] = metrics.calcSNR(TstVal, TstValEst)
-			magicMAE[test] = metrics.calcMAE(TstVal, TstValEst)
-			magicDE2000[test] = metrics.deltaE(TstVal, TstValEst, MINLAT, MAXLAT)
+	""" Write the result tables from the running aggregates """
+	for metric in ['nmse', 'snr', 'mae', 'de2000']:
+		resFile = os.path.join(resDir, 'p{}_t{:g}_m{:g}_r{:g}_{}.txt'.format(patient, EDGE_THRESHOLD, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS, metric))
+		with open(resFile, 'w') as fid:
+			fid.write('{:<20}{:<20}{:<20}{:<20}'.format('alpha', 'beta', 'mean', 'std'))
+			for alpha in alphas:
+				for beta in betas:
+					cell = acc[cellName(alpha, beta, metric)]
+					fid.write('\n')
+					fid.write('{:<20.6f}{:<20.6f}{:<20.6f}{:<20.6f}'.format(alpha, beta, cell.mean, cell.std))
 
+	""" Add the per-trial results to the results store (replacing a previous run) """
+	rows = []
+	for (alpha, beta, test) in allJobs:
+		res = store.get((alpha, beta, test))
+		runtime = res.pop('runtime', np.nan)
+		rows += results.records({'experiment': 'params', 'map': mapName, 'method': 'magic',
+			'alpha': alpha, 'beta': beta, 'threshold': EDGE_THRESHOLD, 'anomalies': remove_anomalies, 'm': NUM_TRAIN_SAMPS, 'trial': test,
+			'seed': seeds[(alpha, beta, test)], 'runtime': runtime}, res)
 
-		with open(resFileNMSE, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20.6f}{:<20.6f}{:<20.6f}{:<20.6f}'.format(alpha, beta, np.average(magicNMSE), np.std(magicNMSE)))
+	results.ResultsStore().append(rows, name='params_{}_t{:g}_m{:g}_r{:g}_a{:d}'.format(mapName, EDGE_THRESHOLD, NUM_TRAIN_SAMPS,
+		NUM_TEST_REPEATS, remove_anomalies))
 
-		with open(resFileSNR, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20.6f}{:<20.6f}{:<20.6f}{:<20.6f}'.format(alpha, beta, np.average(magicSNR), np.std(magicSNR)))
+	""" The run is complete: a new invocation starts a new run """
+	store.close()
+	os.remove(ckptFile)
 
-		with open(resFileMAE, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20.6f}{:<20.6f}{:<20.6f}{:<20.6f}'.format(alpha, beta, np.average(magicMAE), np.std(magicMAE)))
 
-		with open(resFileDE2000, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20.6f}{:<20.6f}{:<20.6f}{:<20.6f}'.format(alpha, beta, np.average(magicDE2000), np.std(magicDE2000)))
+	print('\nTest complete.\n')
 
 
-print('\nTest complete.\n')
\ No newline at end of file
+if __name__ == '__main__':
+	main()
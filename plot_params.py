@@ -3,9 +3,9 @@
 Plots results for cross-validation over regularization parameters.
 --------------------------------------------------------------------------------
 
-Description: Plots output of params.py
+Description: Plots output of params.py, read from the results store
 
-Requirements: os, numpy, matplotlib
+Requirements: numpy, matplotlib
 
 File: plot_params.py
 
@@ -14,45 +14,34 @@ Email: jenniferhellar@gmail.com
 --------------------------------------------------------------------------------
 """
 
-import os
 import numpy as np
 
 # plotting packages
 import matplotlib.pyplot as plt
 
+import results
 
 
-def plot_single(fileDir, fileName):
+# run of params.py to plot
+EDGE_THRESHOLD			=		50
+NUM_TRAIN_SAMPS			=		100
+ANOMALIES_REMOVED		=		1
+
+
+def plot_single(store, mapName):
 	""" Plots result for a single patient/map. """
-	alphas = []
-	betas = []
+	agg = store.aggregate(['alpha', 'beta'], experiment='params', map=mapName, threshold=EDGE_THRESHOLD,
+		anomalies=ANOMALIES_REMOVED, m=NUM_TRAIN_SAMPS, metric='de2000')
+
+	alphas = [float(a) for a in np.unique(agg['alpha'])]
+	betas = [float(b) for b in np.unique(agg['beta'])]
 
 	res = {}
 	double_std = {}
-
-	cnt = 0
-
-	with open(os.path.join(fileDir, fileName), 'r') as fID:
-		for line in fID:
-			if line[0] == 'a':
-				continue
-			lineSplit = line.split(' ')
-			lineSplit = [i.strip() for i in lineSplit if i.strip() != '']
-			alpha = float(lineSplit[0])
-			beta = float(lineSplit[1])
-			mean = float(lineSplit[2])
-			std = float(lineSplit[3])
-
-			if alpha not in res.keys():
-				res[alpha] = [mean]
-				double_std[alpha] = [2*std]
-				alphas.append(alpha)
-				cnt += 1
-			else:
-				res[alpha].append(mean)
-				double_std[alpha].append(2*std)
-			if cnt < 2:
-				betas.append(beta)
+	for alpha in alphas:
+		sel = (agg['alpha'] == alpha)
+		res[alpha] = agg['mean'][sel]
+		double_std[alpha] = 2*agg['std'][sel]
 
 	leg = []
 
@@ -66,7 +55,7 @@ def plot_single(fileDir, fileName):
 	for i in range(len(alphas)):
 		leg.append(r'$\alpha$ = ' + str(alphas[i]))
 
-	ax.set_title('Regularization Parameter Cross-Validation, Patient ' + fileName[1:4])
+	ax.set_title('Regularization Parameter Cross-Validation, Patient ' + mapName[1:4])
 	ax.set_xlabel(r'$\beta$')
 	plt.xticks(alphas, alphas, rotation = 'vertical')
 	plt.xscale('log')
@@ -77,7 +66,7 @@ def plot_single(fileDir, fileName):
 
 
 
-def plot_average(fileDir, fileNames):
+def plot_average(store, mapNames):
 	""" Plots average across patients. """
 
 	alphas = [0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0, 10.0]
@@ -86,28 +75,19 @@ def plot_average(fileDir, fileNames):
 	res = np.zeros((7,7))
 	double_std = np.zeros((7,7))
 
-	cnt = 0
-
-	for fileName in fileNames:
-		with open(os.path.join(fileDir, fileName), 'r') as fID:
-			for line in fID:
-				if line[0] == 'a':
-					continue
-				lineSplit = line.split(' ')
-				lineSplit = [i.strip() for i in lineSplit if i.strip() != '']
-				alpha = float(lineSplit[0])
-				beta = float(lineSplit[1])
-				mean = float(lineSplit[2])
-				std = float(lineSplit[3])
+	# per-map mean and std of each (alpha, beta) cell, averaged over the maps
+	agg = store.aggregate(['map', 'alpha', 'beta'], experiment='params', map=mapNames,
+		alpha=alphas, beta=betas, threshold=EDGE_THRESHOLD, anomalies=ANOMALIES_REMOVED, m=NUM_TRAIN_SAMPS,
+		metric='de2000')
 
-				a = alphas.index(alpha)
-				b = betas.index(beta)
+	a = np.searchsorted(alphas, agg['alpha'])
+	b = np.searchsorted(betas, agg['beta'])
 
-				res[a, b] += mean
-				double_std[a, b] += std
+	np.add.at(res, (a, b), agg['mean'])
+	np.add.at(double_std, (a, b), agg['std'])
 
-	res = 1/len(fileNames) * res
-	double_std = 1/len(fileNames) * double_std
+	res = 1/len(mapNames) * res
+	double_std = 1/len(mapNames) * double_std
 
 	leg = []
 
@@ -131,14 +111,14 @@ def plot_average(fileDir, fileNames):
 	plt.show()
 
 
-fileDir = 'params_results'
-fileName = 'p033_t50_m100_r20_de2000.txt'
-# fileName = 'p034_t50_m100_r20_de2000.txt'
-# fileName = 'p035_t50_m100_r20_de2000.txt'
-# fileName = 'p037_t50_m100_r20_de2000.txt'
+store = results.ResultsStore()
+
+mapName = 'p033_3'
+# mapName = 'p034_4'
+# mapName = 'p035_8'
+# mapName = 'p037_9'
 
-fileNames = ['p033_t50_m100_r20_de2000.txt', 'p034_t50_m100_r20_de2000.txt',
-	'p035_t50_m100_r20_de2000.txt', 'p037_t50_m100_r20_de2000.txt']
+mapNames = ['p033_3', 'p034_4', 'p035_8', 'p037_9']
 
-plot_single(fileDir, fileName)
-plot_average(fileDir, fileNames)
\ No newline at end of file
+plot_single(store, mapName)
+plot_average(store, mapNames)
@@ -3,9 +3,9 @@
 Plots results for cross-validation over multiple input sizes..
 --------------------------------------------------------------------------------
 
-Description: Plots results of test_varied_m.py
+Description: Plots results of test_varied_m.py, read from the results store
 
-Requirements: os, math, matplotlib
+Requirements: math, matplotlib
 
 File: plot_varied_m.py
 
@@ -13,50 +13,44 @@ Author: Jennifer Hellar
 Email: jennifer.hellar@rice.edu
 --------------------------------------------------------------------------------
 """
-import os
-
 # plotting packages
 import matplotlib.pyplot as plt
 
 import math
 
+import results
 
 
-def plot_single(fileDir, patient, id, title):
+# run of test_varied_m.py to plot
+EDGE_THRESHOLD			=		50
+M_VALUES				=		[25, 50, 75, 100, 125, 150, 175, 200, 225, 250]
+ANOMALIES_REMOVED		=		1
+SOLVER					=		'inv'
+GPR_MODE				=		'exact'
+QULATI_MODE				=		'full'
 
-	meanFile = os.path.join(fileDir, 'p' + patient + '_' + id + '_mean.txt')
-	stdFile = os.path.join(fileDir, 'p' + patient + '_' + id + '_std.txt')
 
-	m = []
+def plot_single(store, patient, id, title):
 
-	magicMean = []
-	gprMean = []
-	quLATiMean = []
+	mapName = 'p' + patient + '_' + id
 
-	magicStd = []
-	gprStd = []
-	quLATiStd = []
+	means = {}
+	stds = {}
+	for method in ['magic', 'gpr', 'quLATi']:
+		agg = store.aggregate(['m'], experiment='test_varied_m', map=mapName, method=method,
+			threshold=EDGE_THRESHOLD, anomalies=ANOMALIES_REMOVED, solver=SOLVER, gpr=GPR_MODE, qulati=QULATI_MODE,
+			m=M_VALUES, metric='de2000')
+		m = [int(i) for i in agg['m']]
+		means[method] = list(agg['mean'])
+		stds[method] = list(2*agg['std'])
 
-	with open(meanFile, 'r') as fID:
-		for line in fID:
-			if line[0] == 'm':
-				continue
-			lineSplit = line.split(' ')
-			lineSplit = [i.strip() for i in lineSplit if i.strip() != '']
-			m.append(int(lineSplit[0]))
-			magicMean.append(float(lineSplit[1]))
-			gprMean.append(float(lineSplit[2]))
-			quLATiMean.append(float(lineSplit[3]))
+	magicMean = means['magic']
+	gprMean = means['gpr']
+	quLATiMean = means['quLATi']
 
-	with open(stdFile, 'r') as fID:
-		for line in fID:
-			if line[0] == 'm':
-				continue
-			lineSplit = line.split(' ')
-			lineSplit = [i.strip() for i in lineSplit if i.strip() != '']
-			magicStd.append(2*float(lineSplit[1]))
-			gprStd.append(2*float(lineSplit[2]))
-			quLATiStd.append(2*float(lineSplit[3]))
+	magicStd = stds['magic']
+	gprStd = stds['gpr']
+	quLATiStd = stds['quLATi']
 
 	leg = ['GPR', 'GPMI', 'MAGIC-LAT']
 
@@ -90,7 +84,7 @@ def plot_single(fileDir, patient, id, title):
 
 	plt.show()
 
-fileDir = 'test_varied_m_results'
+store = results.ResultsStore()
 
 PATIENT_IDX = 11
 
@@ -110,4 +104,4 @@ elif PATIENT_IDX == 11:
 	patient, id, title = ('037', '9', 'Map 6 (Patient D)')
 
 
-plot_single(fileDir, patient, id, title)
\ No newline at end of file
+plot_single(store, patient, id, title)
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+--------------------------------------------------------------------------------
+Shared preprocessing of one map for the experiment drivers.
+--------------------------------------------------------------------------------
+
+Description: Reads the mesh and LAT files of a map, maps the LAT samples to
+their nearest mesh vertices, excludes the anomalous samples and builds the
+sampling distribution used for the random train/test splits.  Every driver
+used to repeat these steps; they now call loadMap(), which memoizes the
+result per (map, anomaly removal) for the lifetime of the process.  File
+names and anomaly lists come from the dataset registry (datasets.py).
+
+The results are also persisted as versioned artifacts in the on-disk cache
+(cache.DISKDIR), so later runs skip the file parsing and the sample mapping:
+
+	mesh		vertices, faces (per mesh file)
+	samples		mapped samples, anomaly flags, sampling list (per mesh and
+				LAT file, anomaly selection and removal flag)
+
+Artifacts are keyed by ARTIFACT_VERSION, the content of the input files and
+the anomaly selection (the registry list or ANOMALY_PARAMS), so they are
+rebuilt whenever any of these change.  Bump ARTIFACT_VERSION when the
+preprocessing itself changes.
+
+Usage:
+	data = preprocess.loadMap('p037_9')	# or data index 11
+	TrVal = [data.mapLAT[i] for i in TrIdx]
+
+Requirements: os, hashlib, math, numpy
+
+File: preprocess.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import hashlib
+import math
+
+import numpy as np
+
+# functions to read the files
+from readMesh import readMesh
+from readLAT import readLAT
+
+import utils
+import cache
+import datasets
+from const import DATADIR
+
+
+# version of the stored preprocessing artifacts
+ARTIFACT_VERSION		=		1
+
+# parameters of utils.isAnomalous (maps without a manual anomaly list)
+ANOMALY_PARAMS			=		{'k': 6, 'd': 5, 'thresh': 50}
+
+
+def fileDigest(fileName):
+	""" SHA-1 hex digest of the file content. """
+	h = hashlib.sha1()
+	with open(fileName, 'rb') as fid:
+		for chunk in iter(lambda: fid.read(2**20), b''):
+			h.update(chunk)
+
+	return h.hexdigest()
+
+
+def roundedRange(vals, step=10):
+	""" (min, max) of vals rounded out to multiples of step, for colorbars. """
+	return (math.floor(min(vals)/step)*step, math.ceil(max(vals)/step)*step)
+
+
+def _artifactKey(kind, mapId, *params):
+	h = hashlib.sha1(repr((ARTIFACT_VERSION,) + params).encode('utf-8'))
+
+	return '{}_{}_{}'.format(kind, mapId, h.hexdigest())
+
+
+class MapData:
+	"""
+	Preprocessed map.  Attributes:
+
+		info							registry entry (datasets.MapInfo)
+		idx, nm, patient, id, mapName	data index and naming
+		ablFile							ablation file path (or None)
+		vertices, faces, n				mesh
+		allLatIdx, allLatCoord,
+		allLatVal						all mapped samples
+		anomalous, numPtsIgnored		anomaly flags (per mapped sample)
+		latIdx, latCoords, latVals, M	retained samples
+		mapLAT							partially-sampled signal vector (n,)
+		MINLAT, MAXLAT					range of the retained samples
+		sampLst							sampling list for utils.sampleTrainTest
+	"""
+
+	def __init__(self, info, removeAnomalies=True):
+		self.info = info
+
+		self.idx = info.idx
+		self.nm = info.name
+		self.patient = info.patient
+		self.id = info.latId
+		self.mapName = info.mapId
+
+		""" Read the files """
+		print('\nProcessing ' + self.nm + ' ...\n')
+		meshFile = os.path.join(DATADIR, info.meshFile)
+		latFile = os.path.join(DATADIR, info.latFile)
+		meshDigest = fileDigest(meshFile)
+		latDigest = fileDigest(latFile)
+
+		def buildMesh():
+			[V, F] = readMesh(meshFile)
+			return (V, np.array(F, dtype=float).reshape(-1, 3))
+
+		(V, F) = cache.diskCache(_artifactKey('mesh', info.mapId, meshDigest),
+			['vertices', 'faces'], buildMesh)
+		self.vertices = np.array(V)
+		self.faces = F.tolist()
+
+		if info.ablFile != '':
+			self.ablFile = os.path.join(DATADIR, info.ablFile)
+		else:
+			self.ablFile = None
+			print('No ablation file available for this mesh... continuing...\n')
+
+		self.n = len(self.vertices)
+
+		anomalySelection = info.anomalies if info.anomalies is not None else sorted(ANOMALY_PARAMS.items())
+
+		def buildSamples():
+			[OrigLatCoords, OrigLatVals] = readLAT(latFile)
+
+			mapIdx = [i for i in range(self.n)]
+			mapCoord = [self.vertices[i] for i in mapIdx]
+
+			# Map the LAT samples to nearest mesh vertices
+			allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
+
+			M = len(allLatIdx)
+
+			# Identify and exclude anomalous LAT samples
+			if removeAnomalies:
+				if info.anomalies is not None:
+					anomalous = np.zeros(M)
+					anomalous[info.anomalies] = 1
+				else:
+					anomalous = utils.isAnomalous(allLatCoord, allLatVal, **ANOMALY_PARAMS)
+			else:
+				anomalous = np.zeros(M)
+
+			latVals = [allLatVal[i] for i in range(M) if anomalous[i] == 0]
+
+			return (np.array(allLatIdx, dtype=int), np.array(allLatCoord).reshape(-1, 3),
+				np.array(allLatVal, dtype=float), anomalous, np.array(utils.getModifiedSampList(latVals), dtype=int))
+
+		(allLatIdx, allLatCoord, allLatVal, anomalous, sampLst) = cache.diskCache(
+			_artifactKey('samples', info.mapId, meshDigest, latDigest, anomalySelection, bool(removeAnomalies)),
+			['allLatIdx', 'allLatCoord', 'allLatVal', 'anomalous', 'sampLst'], buildSamples)
+
+		self.allLatIdx = allLatIdx.tolist()
+		self.allLatCoord = [np.array(c) for c in allLatCoord]
+		self.allLatVal = allLatVal.tolist()
+
+		M = len(self.allLatIdx)
+
+		self.anomalous = np.array(anomalous)
+		self.numPtsIgnored = np.sum(anomalous)
+
+		self.latIdx = [self.allLatIdx[i] for i in range(M) if self.anomalous[i] == 0]
+		self.latCoords = [self.allLatCoord[i] for i in range(M) if self.anomalous[i] == 0]
+		self.latVals = [self.allLatVal[i] for i in range(M) if self.anomalous[i] == 0]
+
+		self.M = len(self.latIdx)
+
+		# For colorbar ranges
+		self.MINLAT = min(self.latVals)
+		self.MAXLAT = max(self.latVals)
+
+		# Create partially-sampled signal vector
+		self.mapLAT = [0 for i in range(self.n)]
+		for i in range(self.M):
+			self.mapLAT[self.latIdx[i]] = self.latVals[i]
+
+		# list with values repeated proportionally to sampling probability
+		self.sampLst = sampLst.tolist()
+
+
+def loadMap(key, removeAnomalies=True):
+	"""
+	Returns the preprocessed map (MapData) for a data index or map ID, cached
+	for the process.
+	"""
+	info = datasets.get(key)
+
+	return cache.memoize('map:{}:{:d}'.format(info.mapId, int(bool(removeAnomalies))),
+		lambda: MapData(info, bool(removeAnomalies)))
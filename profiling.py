@@ -0,0 +1,245 @@
+"""
+--------------------------------------------------------------------------------
+Stage-level timing and memory instrumentation.
+--------------------------------------------------------------------------------
+
+Description: Records the wall time, CPU time and peak memory of named stages
+of the pipeline (e.g. the NN tiling, face removal, Laplacian, system assembly
+and solve of MAGIC-LAT).  Profiling is off by default; stage() then returns a
+shared no-op context, so instrumented code pays one function call per stage.
+
+Each record holds the stage name, its start time, wall and CPU time, the peak
+memory allocated during the stage (traced by tracemalloc, which covers numpy
+arrays but not the internal buffers of compiled solvers), the process peak
+RSS (where the resource module exists, i.e. not on Windows; nan otherwise),
+and the context given to the stage and to its enclosing stages (e.g. n,
+m and faceRemoval), so inner stages carry the mesh and sample set they ran on.
+
+Usage:
+	profiling.enable()		# or MAGICLAT_PROFILE=1 in the environment
+
+	with profiling.stage('magic.solve', n=N, m=len(trIdx)):
+		...
+		profiling.annotate(faceRemoval=0.02)	# context known inside the stage
+
+	print(profiling.summary())
+	profiling.writeTrace('trace.json')	# chrome://tracing / Perfetto
+	results.ResultsStore().append(profiling.toRecords('test_repeated', 'p037_9'))
+
+Records made in worker processes are returned with drain() and added to the
+parent's records with extend().
+
+Requirements: os, time, json, resource, tracemalloc, numpy
+
+File: profiling.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import time
+import json
+import tracemalloc
+
+try:
+	import resource		# Unix only
+except ImportError:
+	resource = None
+
+import numpy as np
+
+
+# record fields exported as metrics (results store rows)
+METRICS					=		['wall', 'cpu', 'peakMem']
+
+_enabled = False
+_memory = True
+_records = []
+_stack = []
+
+
+class _NullStage:
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+
+_NULL = _NullStage()
+
+
+class _Stage:
+
+	def __init__(self, name, context):
+		self.name = name
+		self.context = context
+		self.records = []	# records of this stage and the stages nested in it
+
+	def __enter__(self):
+		self.mem = 0
+		self.peak = np.nan
+		if _memory:
+			if _stack:
+				_stack[-1].peak = max(_stack[-1].peak, tracemalloc.get_traced_memory()[1])
+			tracemalloc.reset_peak()
+
+			self.mem = tracemalloc.get_traced_memory()[0]
+			self.peak = 0
+		_stack.append(self)
+
+		self.start = time.perf_counter()
+		self.cpu = time.process_time()
+		return self
+
+	def __exit__(self, *exc):
+		wall = time.perf_counter() - self.start
+		cpu = time.process_time() - self.cpu
+
+		_stack.pop()
+		if _memory:
+			self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+			tracemalloc.reset_peak()
+
+		rec = {'stage': self.name, 'start': self.start, 'wall': wall, 'cpu': cpu,
+			'peakMem': self.peak - self.mem, 'maxRSS': _maxRSS(), 'pid': os.getpid()}
+		self.records.append(rec)
+
+		# inner records inherit the context of this stage (inner values take precedence)
+		for r in self.records:
+			for (key, val) in self.context.items():
+				r.setdefault(key, val)
+
+		if _stack:
+			if _memory:
+				_stack[-1].peak = max(_stack[-1].peak, self.peak)
+			_stack[-1].records.extend(self.records)
+		else:
+			_records.extend(self.records)
+
+		return False
+
+
+def _maxRSS():
+	""" Peak resident set size of the process in bytes (nan without resource). """
+	if resource is None:
+		return np.nan
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+def enable(memory=True):
+	"""
+	Turns profiling on.  With memory=True, tracemalloc is started (if needed)
+	to record peak memory, which slows allocation-heavy Python code; with
+	memory=False only times are recorded (peakMem is nan).
+	"""
+	global _enabled, _memory
+	if memory and not tracemalloc.is_tracing():
+		tracemalloc.start()
+	_memory = memory
+	_enabled = True
+
+
+def disable():
+	""" Turns profiling off; recorded stages are kept. """
+	global _enabled
+	_enabled = False
+
+
+def enabled():
+	return _enabled
+
+
+def stage(name, **context):
+	"""
+	Context manager timing the named stage.  context (e.g. n, m) is stored
+	with the record and inherited by the stages nested in it.
+	"""
+	if not _enabled:
+		return _NULL
+
+	return _Stage(name, context)
+
+
+def annotate(**context):
+	""" Adds context to the innermost open stage (no-op when off). """
+	if _enabled and _stack:
+		_stack[-1].context.update(context)
+
+
+def records():
+	""" Completed stage records (list of dicts), in completion order. """
+	return list(_records)
+
+
+def drain():
+	""" Returns the completed records and clears them, e.g. to send from a worker. """
+	recs = list(_records)
+	_records.clear()
+
+	return recs
+
+
+def extend(recs):
+	""" Adds records made elsewhere (e.g. returned by drain() in a worker). """
+	_records.extend(recs)
+
+
+def clear():
+	_records.clear()
+
+
+def summary(recs=None):
+	""" Per-stage table: calls, total and mean wall time, CPU time and max peak memory. """
+	recs = _records if recs is None else recs
+
+	stages = []
+	for r in recs:
+		if r['stage'] not in stages:
+			stages.append(r['stage'])
+
+	lines = ['{:<24}{:>8}{:>14}{:>14}{:>14}{:>14}'.format('stage', 'calls', 'wall (s)', 'mean (ms)', 'cpu (s)', 'peak (MB)')]
+	for name in stages:
+		sel = [r for r in recs if r['stage'] == name]
+		wall = np.sum([r['wall'] for r in sel])
+		lines.append('{:<24}{:>8d}{:>14.4f}{:>14.3f}{:>14.4f}{:>14.1f}'.format(name, len(sel), wall,
+			1000*wall/len(sel), np.sum([r['cpu'] for r in sel]), np.max([r['peakMem'] for r in sel])/2**20))
+
+	return '\n'.join(lines)
+
+
+def writeTrace(fileName, recs=None):
+	""" Writes the records as a Chrome trace event file (complete events, in microseconds). """
+	recs = _records if recs is None else recs
+
+	events = []
+	for r in recs:
+		args = {key: val for (key, val) in r.items() if key not in ['stage', 'start', 'wall', 'pid']}
+		events.append({'name': r['stage'], 'ph': 'X', 'ts': r['start']*1e6, 'dur': r['wall']*1e6,
+			'pid': r['pid'], 'tid': r['pid'], 'args': args})
+
+	with open(fileName, 'w') as fid:
+		json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fid, default=float)
+
+
+def toRecords(experiment, mapName, recs=None):
+	"""
+	Results store rows (see results.py) for the records: the method column
+	holds the stage, m the sample count, trial the record index, and one row
+	per metric in METRICS.
+	"""
+	import results
+
+	recs = _records if recs is None else recs
+
+	rows = []
+	for (i, r) in enumerate(recs):
+		rows += results.records({'experiment': experiment + '/profile', 'map': mapName, 'method': r['stage'],
+			'm': int(r.get('m', -1)), 'trial': i, 'runtime': r['wall']},
+			{metric: float(r[metric]) for metric in METRICS})
+
+	return rows
+
+
+if os.environ.get('MAGICLAT_PROFILE', '0') not in ['', '0']:
+	enable()
@@ -1,46 +1,141 @@
 
 import numpy as np
-import os
 
-from qulati import gpmi, eigensolver
+import cache
+
+
+# eigensolver parameters (part of the cache key)
+HOLES					=		0
+LAYERS					=		10
+NUM_EIGEN				=		256
+
+# hyperparameter optimization: random restarts per fit (full, and calibration
+# fits), and restarts per fit in the restart1 mode
+RESTARTS				=		5
+SHORT_RESTARTS			=		1
+
+HYPER_MODES				=		['full', 'restart1', 'freeze']
+
+# gpmi model attributes used by the restart1 and freeze modes: the optimized
+# hyperparameters and nugget, and the negative log likelihood
+# LLH(log([HP, nugget]), fixed_nugget=None) that optimize() minimizes
+GPMI_API				=		['HP', 'nugget', 'LLH']
+
+
+class HyperParams:
+	"""
+	quLATi hyperparameter mode of one map.
+
+		'full'		every fit optimizes with RESTARTS random restarts (original)
+		'restart1'	fits optimize with SHORT_RESTARTS random restart (the
+					optimizer is not started from the calibrated values)
+					and keep the calibrated values instead if these have the
+					lower negative log likelihood on the fit's data
+		'freeze'	fits use the calibrated values without optimizing
+
+	The calibrated values (elementwise median over fits optimized in full on
+	the calibration training sets) are set once by calibrate(); drivers call
+	it in the parent process (interpolators.calibrate), so every worker uses
+	the same values.  Fits never change them.
+	"""
+
+	def __init__(self, mode='full'):
+		if mode not in HYPER_MODES:
+			raise ValueError('unknown quLATi hyperparameter mode \'{}\', choose from: {}'.format(mode, ', '.join(HYPER_MODES)))
+		self.mode = mode
+		self.HP = None
+		self.nugget = None
+
+	def calibrated(self):
+		return self.HP is not None
+
+	def restarts(self):
+		return SHORT_RESTARTS if self.mode == 'restart1' else RESTARTS
+
+	def calibrate(self, model, splits):
+		""" Optimizes in full on each (TrIdx, TrVal) training set and keeps the median values. """
+		if self.mode == 'full':
+			return
+
+		fits = []
+		for (TrIdx, TrVal) in splits:
+			_setData(model, TrIdx, TrVal)
+			model.optimize(nugget = None, restarts = RESTARTS)
+			_checkAPI(model)
+			fits.append(np.append(np.array(model.HP, dtype=float), model.nugget))
+
+		best = np.median(np.array(fits), axis=0)
+		(self.HP, self.nugget) = (best[:-1], float(best[-1]))
+
+	def apply(self, model):
+		""" Sets the calibrated values on the model. """
+		model.HP = self.HP.copy()
+		model.nugget = self.nugget
+
+
+def _checkAPI(model):
+	missing = [name for name in GPMI_API if not hasattr(model, name)]
+	if missing:
+		raise AttributeError('the installed quLATi model does not provide {}, needed by the restart1 and freeze hyperparameter modes (use full)'.format(', '.join(missing)))
 
 
 def quLATiModel(patient, vertices, faces):
-	QFile = 'Q_p{}.npy'.format(patient)
-	VFile = 'V_p{}.npy'.format(patient)
-	gradVFile = 'gradV_p{}.npy'.format(patient)
-
-	# model with reduced rank efficiency
-	if not os.path.isfile(QFile):
-		Q, V, gradV, centroids = eigensolver(vertices, np.array(faces), holes = 0, layers = 10, num = 256)
-		with open(QFile, 'wb') as fid:
-			np.save(fid, Q)
-		with open(VFile, 'wb') as fid:
-			np.save(fid, V)
-		with open(gradVFile, 'wb') as fid:
-			np.save(fid, gradV)
-	else:
-		Q = np.load(QFile, allow_pickle = True)
-		V = np.load(VFile, allow_pickle = True)
-		gradV = np.load(gradVFile, allow_pickle = True)
+	# quLATi (and JAX) are only loaded when a quLATi model is requested
+	from qulati import gpmi, eigensolver
+
+	def build():
+		Q, V, gradV, centroids = eigensolver(vertices, np.array(faces), holes = HOLES, layers = LAYERS, num = NUM_EIGEN)
+		return (Q, V, gradV)
+
+	# model with reduced rank efficiency; the eigenbasis is cached on disk per mesh
+	key = cache.meshKey(vertices, faces, 'eigensolver', HOLES, LAYERS, NUM_EIGEN)
+	(Q, V, gradV) = cache.diskCache(key, ['Q', 'V', 'gradV'], build)
 
 	model = gpmi.Matern(vertices, np.array(faces), Q, V, gradV, JAX = False)
 
 	return model	
 
 
-def quLATi(TrIdx, TrVal, vertices, model):
+def _setData(model, TrIdx, TrVal):
 	obs = np.array(TrVal)
 	trVertices = np.array(TrIdx)
 
 	model.set_data(obs, trVertices)
 	model.kernelSetup(smoothness = 3./2.)
 
-	# optimize the nugget
-	model.optimize(nugget = None, restarts = 5)
+
+def quLATi(TrIdx, TrVal, vertices, model, hyper=None):
+	if hyper is None:
+		hyper = HyperParams('full')
+	if (hyper.mode != 'full') and not hyper.calibrated():
+		raise RuntimeError('quLATi hyperparameter mode \'{}\' needs calibrate() first (see interpolators.calibrate)'.format(hyper.mode))
+
+	_setData(model, TrIdx, TrVal)
+
+	if hyper.mode == 'freeze':
+		hyper.apply(model)
+	else:
+		# optimize the nugget (a single restart in the restart1 mode)
+		model.optimize(nugget = None, restarts = hyper.restarts())
+		if hyper.mode == 'restart1':
+			_keepBetter(model, hyper)
 
 	pred_mean, pred_stdev = model.posterior(pointwise = True)
 
 	est = pred_mean[0:vertices.shape[0]]
 
-	return est
\ No newline at end of file
+	return est
+
+
+def _negLogLik(model, HP, nugget):
+	return model.LLH(np.log(np.append(np.array(HP, dtype=float), nugget)), None)
+
+
+def _keepBetter(model, hyper):
+	"""
+	restart1 mode: replaces the result of the short optimization by the
+	calibrated hyperparameters when these have the lower negative log
+	likelihood on the current data.
+	"""
+	if _negLogLik(model, hyper.HP, hyper.nugget) < _negLogLik(model, model.HP, model.nugget):
+		hyper.apply(model)
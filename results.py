@@ -0,0 +1,184 @@
+"""
+--------------------------------------------------------------------------------
+Columnar store for experiment results.
+--------------------------------------------------------------------------------
+
+Description: Every driver appends its per-trial results to one store, one row
+per (map, method, parameters, trial, metric) with the typed schema below.  The
+rows are written as compressed numpy column chunks (.npz), one file per
+append, so appends from several processes never touch the same file.  Each
+chunk is written to a temporary file and renamed into place, so readers never
+see a partial chunk.  Reads load every chunk (cached, chunks are immutable),
+concatenate the columns and filter them with boolean masks; aggregate()
+computes grouped mean/std/count without any text parsing.
+
+Usage:
+	store = results.ResultsStore()
+	store.append([{'experiment': 'params', 'map': 'p037_9', 'method': 'magic',
+		'alpha': 1e-5, 'beta': 1e-2, 'trial': 0, 'metric': 'de2000', 'value': 2.1}])
+
+	cols = store.read(experiment='params', map=['p033_3', 'p037_9'], metric='de2000')
+	agg = store.aggregate(['alpha', 'beta'], experiment='params', metric='de2000')
+
+Requirements: os, glob, time, numpy
+
+File: results.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+import glob
+import time
+
+import numpy as np
+
+
+STOREDIR				=		'results_store'
+
+# column name, numpy dtype, value used when a record omits the column
+# (threshold, anomalies, solver, gpr, qulati: the run options -- MAGIC-LAT
+# edge threshold, anomalies removed (1/0), MAGIC-LAT solver backend, GPR and
+# quLATi modes -- on all of its rows)
+SCHEMA					=		[('experiment', 'U', ''),
+								('map', 'U', ''),
+								('method', 'U', ''),
+								('alpha', 'f8', np.nan),
+								('beta', 'f8', np.nan),
+								('threshold', 'f8', np.nan),
+								('anomalies', 'i8', -1),
+								('solver', 'U', ''),
+								('gpr', 'U', ''),
+								('qulati', 'U', ''),
+								('m', 'i8', -1),
+								('trial', 'i8', -1),
+								('seed', 'i8', -1),
+								('metric', 'U', ''),
+								('value', 'f8', np.nan),
+								('runtime', 'f8', np.nan)]
+
+COLUMNS					=		[name for (name, dtype, default) in SCHEMA]
+
+
+class ResultsStore:
+	"""
+	Directory of immutable column chunks.  Chunks appended under a name replace
+	the previous chunk of that name, so re-running a driver with the same
+	settings does not duplicate its rows.  Drivers name their chunks after the
+	experiment, map and run parameters.
+	"""
+
+	def __init__(self, dirName=STOREDIR):
+		self.dirName = dirName
+		if not os.path.isdir(dirName):
+			os.makedirs(dirName, exist_ok=True)
+		self._chunks = {}
+		self._count = 0
+
+	def _newName(self):
+		self._count += 1
+		return '{:x}-{:d}-{:d}'.format(time.time_ns(), os.getpid(), self._count)
+
+	def append(self, records, name=None):
+		"""
+		Writes the records (list of dicts keyed by column name) as one chunk and
+		returns its file name.  Missing columns take their schema default.
+		"""
+		if len(records) == 0:
+			return None
+
+		cols = {}
+		for (col, dtype, default) in SCHEMA:
+			cols[col] = np.array([rec.get(col, default) for rec in records], dtype=dtype)
+
+		unknown = set().union(*[rec.keys() for rec in records]) - set(COLUMNS)
+		if unknown:
+			raise ValueError('unknown result columns: {}'.format(', '.join(sorted(unknown))))
+
+		if name is None:
+			name = self._newName()
+		fileName = os.path.join(self.dirName, name + '.npz')
+		tmpFile = fileName + '.{:d}.tmp'.format(os.getpid())
+
+		with open(tmpFile, 'wb') as fid:
+			np.savez_compressed(fid, **cols)
+		os.replace(tmpFile, fileName)
+
+		return fileName
+
+	def _load(self, fileName):
+		"""
+		Columns of one chunk, cached by file name and modification time; columns
+		added to the schema after the chunk was written take their default.
+		"""
+		stamp = os.stat(fileName).st_mtime_ns
+		if fileName not in self._chunks or self._chunks[fileName][0] != stamp:
+			with np.load(fileName, allow_pickle=False) as data:
+				num = len(data['value'])
+				self._chunks[fileName] = (stamp, {col: data[col] if col in data.files else np.full(num, default, dtype=dtype)
+					for (col, dtype, default) in SCHEMA})
+		return self._chunks[fileName][1]
+
+	def read(self, **filters):
+		"""
+		Returns a dict of column arrays for the rows matching every filter.  A
+		filter value is either a single value (equality) or a list of values.
+		"""
+		for col in filters:
+			if col not in COLUMNS:
+				raise ValueError('unknown result column \'{}\''.format(col))
+
+		fileNames = sorted(glob.glob(os.path.join(self.dirName, '*.npz')))
+		chunks = [self._load(f) for f in fileNames]
+
+		if len(chunks) == 0:
+			return {col: np.array([], dtype=dtype) for (col, dtype, default) in SCHEMA}
+
+		cols = {col: np.concatenate([c[col] for c in chunks]) for col in COLUMNS}
+
+		mask = np.ones(len(cols['value']), dtype=bool)
+		for (col, val) in filters.items():
+			if isinstance(val, (list, tuple, set, np.ndarray)):
+				mask &= np.isin(cols[col], list(val))
+			else:
+				mask &= (cols[col] == val)
+
+		return {col: cols[col][mask] for col in COLUMNS}
+
+	def aggregate(self, by, **filters):
+		"""
+		Groups the matching rows by the columns in by and returns a dict with
+		those columns (one entry per group, sorted) plus 'mean', 'std' and
+		'count' of the value column.
+		"""
+		cols = self.read(**filters)
+
+		keys = np.empty(len(cols['value']), dtype=[(col, cols[col].dtype) for col in by])
+		for col in by:
+			keys[col] = cols[col]
+
+		groups, inv = np.unique(keys, return_inverse=True)
+		inv = inv.reshape(-1)
+
+		count = np.bincount(inv, minlength=len(groups))
+		mean = np.bincount(inv, weights=cols['value'], minlength=len(groups)) / np.maximum(count, 1)
+		dev = cols['value'] - mean[inv]
+		std = np.sqrt(np.bincount(inv, weights=dev*dev, minlength=len(groups)) / np.maximum(count, 1))
+
+		agg = {col: groups[col] for col in by}
+		agg['mean'] = mean
+		agg['std'] = std
+		agg['count'] = count
+
+		return agg
+
+
+def records(base, values):
+	""" Expands one {metric: value} dict into rows sharing the columns in base. """
+	rows = []
+	for (metric, value) in values.items():
+		row = dict(base)
+		row['metric'] = metric
+		row['value'] = float(value)
+		rows.append(row)
+
+	return rows
@@ -0,0 +1,76 @@
+"""
+--------------------------------------------------------------------------------
+Single entry point for the MAGIC-LAT experiments.
+--------------------------------------------------------------------------------
+
+usage: run.py [-h] COMMAND ...
+
+Runs one experiment driver; the remaining arguments are passed to it.
+
+commands:
+  test          Compares MAGIC-LAT, GPR and quLATi on one random split of a map,
+                with visual results (test.py)
+  repeated      Compares the methods over repeated random splits (test_repeated.py)
+  varied_m      Compares the methods across numbers of samples (test_varied_m.py)
+  params        Regularization parameter grid search (params.py)
+  precision     Mixed precision vs float64 MAGIC-LAT solve (test_precision.py)
+  anomalies     Plots the LAT samples one by one for inspection (test_anomalies.py)
+  benchmark     Scaling benchmarks on synthetic meshes (benchmark.py)
+
+Example:
+	python run.py repeated -i 11 -r 20 -m magic,nn
+	python run.py test -h
+	python run.py benchmark -n 1000,10000 -c baseline.json
+
+Every driver exposes main(argv) and reads its map through preprocess.loadMap(),
+so the mesh/LAT preprocessing is shared (and cached) rather than repeated in
+each script.  Only the selected driver is imported, and the drivers load the
+heavy packages (vedo/VTK, scikit-learn, quLATi) only when visual output or the
+corresponding method is requested.  The exit status is the driver's return
+value (e.g. 1 for a benchmark regression).
+
+Requirements: sys, argparse, importlib
+
+File: run.py
+--------------------------------------------------------------------------------
+"""
+
+import sys
+import argparse
+import importlib
+
+
+# command: (driver module, description)
+COMMANDS				=		{'test': ('test', 'Compares MAGIC-LAT, GPR and quLATi on one random split of a map, with visual results'),
+								'repeated': ('test_repeated', 'Compares the methods over repeated random splits'),
+								'varied_m': ('test_varied_m', 'Compares the methods across numbers of samples'),
+								'params': ('params', 'Regularization parameter grid search'),
+								'precision': ('test_precision', 'Mixed precision vs float64 MAGIC-LAT solve'),
+								'anomalies': ('test_anomalies', 'Plots the LAT samples one by one for inspection'),
+								'benchmark': ('benchmark', 'Scaling benchmarks on synthetic meshes')}
+
+
+def main(argv=None):
+	epilog = 'commands:\n' + '\n'.join('  {:<14}{} ({}.py)'.format(name, desc, module)
+		for (name, (module, desc)) in COMMANDS.items())
+
+	parser = argparse.ArgumentParser(
+	    description='Runs one experiment driver; the remaining arguments are passed to it.',
+	    epilog=epilog, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+	parser.add_argument('command', choices=COMMANDS.keys(), metavar='COMMAND',
+	                    help='Experiment to run (see below).')
+
+	parser.add_argument('args', nargs=argparse.REMAINDER,
+	                    help='Arguments of the experiment (see run.py COMMAND -h).')
+
+	args = parser.parse_args(argv)
+
+	(module, desc) = COMMANDS[vars(args)['command']]
+	sys.argv[0] = 'run.py ' + vars(args)['command']	# program name in the driver's usage
+
+	return importlib.import_module(module).main(vars(args)['args'])
+
+
+if __name__ == '__main__':
+	sys.exit(main())
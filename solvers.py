@@ -0,0 +1,300 @@
+"""
+--------------------------------------------------------------------------------
+Linear system solvers for MAGIC-LAT.
+--------------------------------------------------------------------------------
+
+Description: Assembles the MAGIC-LAT system (M_l + alpha*M_u + beta*L) and
+solves it with one of several interchangeable backends, selected by name:
+
+	'inv'		dense inverse (original implementation, small meshes only)
+	'direct'	sparse LU factorization
+	'cg'		Jacobi-preconditioned conjugate gradient
+	'amg'		algebraic multigrid preconditioned conjugate gradient
+	'schwarz'	two-level additive Schwarz (domain decomposition) preconditioned
+				conjugate gradient, with subdomains solved in parallel
+	'mixed'		sparse LU factorization in float32 with float64 iterative
+				refinement (about half the memory of 'direct' for the factor)
+
+The AMG aggregation hierarchy is built once per mesh from the full-mesh
+operator (alpha*I + beta*L) and reused for every trial and sample set on that
+mesh; only the numerical Galerkin products are recomputed per system.
+
+The Schwarz backend partitions the mesh into one subdomain per worker by
+recursive coordinate bisection (cached per mesh), factors the overlapping
+local systems concurrently on a fixed thread pool, and couples them through a
+coarse space of subdomain indicator vectors.  Local contributions are summed
+in subdomain order, so results do not depend on thread scheduling.
+
+Requirements: os, concurrent.futures, numpy, scipy, robust_laplacian,
+	pyamg (optional, 'amg' only)
+
+File: solvers.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import scipy.sparse as sp
+from scipy.linalg import cho_factor, cho_solve
+from scipy.sparse.linalg import cg, spsolve, splu, LinearOperator
+
+# Robust cotan-based Laplacian for triangle mesh
+import robust_laplacian
+
+import cache
+
+
+# default relative residual tolerance for the iterative solvers
+TOL						=		1e-8
+
+# AMG coarsening stops once a level has fewer unknowns than this
+AMG_MAX_COARSE			=		50
+
+# mixed precision: maximum refinement steps and target relative residual
+MAX_REFINE				=		10
+REFINE_TOL				=		1e-12
+
+# size of the worker pool (and default number of Schwarz subdomains)
+NUM_WORKERS				=		os.cpu_count() or 1
+
+# layers of vertices added around each Schwarz subdomain
+SCHWARZ_OVERLAP			=		1
+
+_pool = None
+
+
+def systemMatrix(N, trIdx, L, alpha, beta):
+	"""
+	Returns the sparse MAGIC-LAT system matrix M_l + alpha*M_u + beta*L, where
+	M_l (M_u) is the diagonal indicator of the labelled (unlabelled) vertices.
+	"""
+	d = np.full(N, float(alpha))
+	d[np.asarray(trIdx, dtype=int)] = 1.0
+
+	return (sp.diags(d) + beta*sp.csr_matrix(L)).tocsr()
+
+
+def _cg(A, b, x0=None, tol=TOL, M=None, maxiter=None):
+	""" Conjugate gradient, compatible with old (tol) and new (rtol) scipy. """
+	try:
+		x, info = cg(A, b, x0=x0, rtol=tol, M=M, maxiter=maxiter)
+	except TypeError:	# scipy < 1.12
+		x, info = cg(A, b, x0=x0, tol=tol, M=M, maxiter=maxiter)
+
+	if info > 0:
+		print('WARNING: conjugate gradient did not converge in {:g} iterations'.format(info))
+
+	return x
+
+
+def solveInv(A, b, **kwargs):
+	""" Dense inverse of the system matrix (original implementation). """
+	T = np.linalg.inv(A.toarray())
+
+	return np.matmul(T, b)
+
+
+def solveDirect(A, b, **kwargs):
+	""" Sparse LU factorization. """
+	return spsolve(A.tocsc(), b)
+
+
+def solveCG(A, b, x0=None, tol=TOL, **kwargs):
+	""" Jacobi-preconditioned conjugate gradient. """
+	Minv = sp.diags(1.0/A.diagonal())
+
+	return _cg(A, b, x0=x0, tol=tol, M=Minv)
+
+
+def solveMixed(A, b, x0=None, tol=REFINE_TOL, **kwargs):
+	"""
+	Mixed precision direct solve: the LU factors are computed and applied in
+	float32, and the solution is corrected with float64 residuals until the
+	relative residual reaches tol.  Falls back to CG preconditioned by the
+	float32 factors if refinement stagnates.
+	"""
+	lu = splu(A.astype(np.float32).tocsc())
+
+	def lowSolve(r):
+		return lu.solve(r.astype(np.float32)).astype(np.float64)
+
+	bNorm = np.linalg.norm(b)
+	if bNorm == 0:
+		return np.zeros(len(b))
+
+	if x0 is None:
+		x = lowSolve(b)
+	else:
+		x = np.array(x0, dtype=np.float64)
+
+	prevRes = np.inf
+	for k in range(MAX_REFINE):
+		r = b - A @ x
+		res = np.linalg.norm(r) / bNorm
+		if res <= tol:
+			return x
+		if res >= prevRes:	# refinement stagnated
+			break
+		prevRes = res
+		x = x + lowSolve(r)
+
+	M = LinearOperator(A.shape, matvec=lambda r: lowSolve(np.asarray(r).reshape(-1)))
+
+	return _cg(A, b, x0=x, tol=tol, M=M)
+
+
+def amgAggregates(V, F, alpha, beta):
+	"""
+	Returns the per-level aggregation operators of a smoothed aggregation AMG
+	hierarchy for the full mesh operator alpha*I + beta*L.  Cached per mesh,
+	so that the (expensive) coarsening is done once and reused across trials.
+	"""
+	try:
+		import pyamg
+	except ImportError:
+		raise ImportError('the \'amg\' solver requires the pyamg package (pip install pyamg)')
+
+	def build():
+		L, _ = robust_laplacian.mesh_laplacian(np.asarray(V), np.array(F, dtype='int'))
+		P = (alpha*sp.identity(len(V)) + beta*L).tocsr()
+		ml = pyamg.smoothed_aggregation_solver(P, max_coarse=AMG_MAX_COARSE, keep=True)
+		return [('predefined', {'AggOp': lvl.AggOp.tocsr()}) for lvl in ml.levels[:-1]]
+
+	return cache.memoize(cache.meshKey(V, F, 'amg', alpha, beta), build)
+
+
+def solveAMG(A, b, V=None, F=None, alpha=None, beta=None, x0=None, tol=TOL, **kwargs):
+	""" Algebraic multigrid preconditioned conjugate gradient. """
+	import pyamg
+
+	if V is None or F is None:
+		raise ValueError('the \'amg\' solver requires the mesh vertices and faces')
+
+	aggs = amgAggregates(V, F, alpha, beta)
+	ml = pyamg.smoothed_aggregation_solver(A, aggregate=aggs,
+		max_levels=len(aggs)+1, max_coarse=AMG_MAX_COARSE)
+
+	return _cg(A, b, x0=x0, tol=tol, M=ml.aspreconditioner(cycle='V'))
+
+
+def workerPool():
+	""" Returns the fixed-size thread pool shared by the parallel backends. """
+	global _pool
+	if _pool is None:
+		_pool = ThreadPoolExecutor(max_workers=NUM_WORKERS)
+
+	return _pool
+
+
+def _bisect(V, idx, nParts, labels, first):
+	""" Recursive coordinate bisection along the longest bounding box axis. """
+	if nParts == 1:
+		labels[idx] = first
+		return
+
+	ax = np.argmax(V[idx].max(axis=0) - V[idx].min(axis=0))
+	order = idx[np.argsort(V[idx, ax], kind='stable')]
+
+	nLeft = nParts // 2
+	split = len(idx) * nLeft // nParts
+
+	_bisect(V, order[:split], nLeft, labels, first)
+	_bisect(V, order[split:], nParts - nLeft, labels, first + nLeft)
+
+
+def partitionMesh(V, F, nParts):
+	"""
+	Returns a subdomain label (0..nParts-1) for every vertex, computed by
+	recursive coordinate bisection and cached per mesh.
+	"""
+	def build():
+		V_ = np.asarray(V, dtype=float)
+		labels = np.zeros(len(V_), dtype=int)
+		_bisect(V_, np.arange(len(V_)), min(nParts, len(V_)), labels, 0)
+		return labels
+
+	return cache.memoize(cache.meshKey(V, F, 'partition', nParts), build)
+
+
+def schwarzPreconditioner(A, labels, overlap=SCHWARZ_OVERLAP):
+	"""
+	Returns the two-level additive Schwarz preconditioner for A as a
+	LinearOperator.  Local factorizations and solves run on the worker pool.
+	"""
+	N = A.shape[0]
+	nParts = labels.max() + 1
+	pool = workerPool()
+
+	G = abs(A).tocsr()	# graph of the system, for growing the overlap
+
+	subs = []
+	for p in range(nParts):
+		mask = (labels == p)
+		for k in range(overlap):
+			mask = mask | (G @ mask.astype(float) > 0)
+		subs.append(np.flatnonzero(mask))
+
+	lus = list(pool.map(lambda idx: splu(A[idx][:, idx].tocsc()), subs))
+
+	# coarse space of subdomain indicator vectors
+	Z = sp.csr_matrix((np.ones(N), (np.arange(N), labels)), shape=(N, nParts))
+	A0 = cho_factor((Z.T @ A @ Z).toarray())
+
+	def apply(r):
+		r = np.asarray(r).reshape(-1)
+		local = list(pool.map(lambda k: lus[k].solve(r[subs[k]]), range(nParts)))
+
+		z = Z @ cho_solve(A0, Z.T @ r)
+		for k in range(nParts):	# fixed order, for determinism
+			z[subs[k]] += local[k]
+		return z
+
+	return LinearOperator((N, N), matvec=apply)
+
+
+def solveSchwarz(A, b, V=None, F=None, x0=None, tol=TOL, nParts=None, overlap=SCHWARZ_OVERLAP, **kwargs):
+	""" Domain decomposition (two-level additive Schwarz) preconditioned CG. """
+	if V is None or F is None:
+		raise ValueError('the \'schwarz\' solver requires the mesh vertices and faces')
+
+	if nParts is None:
+		nParts = NUM_WORKERS
+
+	labels = partitionMesh(V, F, nParts)
+	M = schwarzPreconditioner(A, labels, overlap)
+
+	return _cg(A, b, x0=x0, tol=tol, M=M)
+
+
+SOLVERS = {
+	'inv': solveInv,
+	'direct': solveDirect,
+	'cg': solveCG,
+	'amg': solveAMG,
+	'schwarz': solveSchwarz,
+	'mixed': solveMixed
+}
+
+
+def solve(A, b, method='inv', **kwargs):
+	"""
+	Solves A x = b with the named backend (see SOLVERS).  Mesh context needed
+	by some backends (V, F, alpha, beta) and an optional initial guess x0 are
+	passed through as keyword arguments.
+
+	Returns x as an (N,1) array.
+	"""
+	if method not in SOLVERS:
+		raise ValueError('unknown solver \'{}\', choose from: {}'.format(method, ', '.join(SOLVERS.keys())))
+
+	b = np.asarray(b, dtype=float).reshape(-1)
+	x0 = kwargs.pop('x0', None)
+	if x0 is not None:
+		x0 = np.asarray(x0, dtype=float).reshape(-1)
+
+	x = SOLVERS[method](A, b, x0=x0, **kwargs)
+
+	return np.asarray(x).reshape(-1, 1)
@@ -3,18 +3,27 @@
 Executes GPR, GPMI, and MAGIC-LAT 1x for 1 map and saves the visual results..
 --------------------------------------------------------------------------------
 
-usage: test.py [-h] -i IDX -a ANOMALIES_REMOVED [-v VERBOSE] [-t TEXT]
+usage: test.py [-h] -i IDX -a ANOMALIES_REMOVED [-v VERBOSE] [-t TEXT] [-g {exact,sparse}]
+               [-s SEED]
 
 Processes a single mesh file for comparison of MAGIC-LAT, GPR, and quLATi performance.
 
 optional arguments:
   -h, --help            show this help message and exit
-  -i IDX, --idx IDX     Data index to process. Default: 11
+  -i IDX, --idx IDX     Data index or map ID (e.g. p037_9) to process. Default: 11
   -a ANOMALIES_REMOVED, --anomalies_removed ANOMALIES_REMOVED
                         Remove anomalous points (disable: 0, enable: 1). Default: 1
   -v VERBOSE, --verbose VERBOSE
                         Verbose output (disable: 0, enable: 1). Default: 1
   -t TEXT, --text TEXT  Generate text-only outputs (disable: 0, enable: 1). Default: 0
+  -g {exact,sparse}, --gpr {exact,sparse}
+                        GPR baseline: exact sklearn GPR, or sparse inducing
+                        point GPR with calibrated hyperparameters. Default: exact
+  -s SEED, --seed SEED  Master random seed. Default: random
+
+The split is drawn from the random stream (map, m, 0) of the master seed
+(trials.streamSeed), i.e. it is trial 0 of test_repeated.py with the same
+seed; the seed is written to metrics.txt.
 
 DATA INDICES:
 		p033 = 4 (3-RV-FAM-PVC-A-NORMAL), 5 (4-RV-FAM-PVC-A-LAT-HYBRID)
@@ -24,7 +33,7 @@ DATA INDICES:
 
 Requirements: 
 	os, argparse,
-	numpy, math, random, 
+	numpy, math, 
 	vedo, scikit-learn,
 	quLATi, robust_laplacian
 
@@ -40,26 +49,15 @@ import argparse
 
 import numpy as np
 import math
-import random
-
-# plotting packages
-from vedo import Mesh
-
-# Gaussian process regression interpolation
-from sklearn.gaussian_process import GaussianProcessRegressor
-from sklearn.gaussian_process.kernels import RBF
-
-# functions to read the files
-from readMesh import readMesh
-from readLAT import readLAT
-
 
 import utils
 import metrics
-from const import DATADIR, DATAFILES
-from magicLAT import magicLAT
-
-import quLATiHelper
+import datasets
+import preprocess
+import gprHelper
+import interpolators
+import results
+import trials
 
 
 
@@ -69,225 +67,188 @@ EDGE_THRESHOLD			=		50
 OUTDIR				 	=		'test_results'
 
 
-""" Parse the input for data index argument. """
-parser = argparse.ArgumentParser(
-    description='Processes a single mesh file for comparison of MAGIC-LAT, GPR, and quLATi performance.')
-
-parser.add_argument('-i', '--idx', required=True, default='11',
-                    help='Data index to process. \
-                    Default: 11')
-
-parser.add_argument('-a', '--anomalies_removed', required=True, default=1,
-                    help='Remove anomalous points (disable: 0, enable: 1). \
-                    Default: 1')
-
-parser.add_argument('-v', '--verbose', required=False, default=1,
-                    help='Verbose output (disable: 0, enable: 1). \
-                    Default: 1')
-
-parser.add_argument('-t', '--text', required=False, default=0,
-                    help='Generate text-only outputs (disable: 0, enable: 1). \
-                    Default: 0')
-
-args = parser.parse_args()
-
-PATIENT_IDX				=		int(vars(args)['idx'])
-verbose					=		int(vars(args)['verbose'])
-visualSuppressed		=		int(vars(args)['text'])
-remove_anomalies		=		int(vars(args)['anomalies_removed'])
-
-""" Obtain file names, patient number, mesh id, etc. """
-(meshFile, latFile, ablFile) = DATAFILES[PATIENT_IDX]
-
-nm = meshFile[0:-5]
-patient = nm[7:10]
-id = latFile.split('_')[3]
-
-""" Create output directory for this script and subdir for this mesh. """
-outSubDir = os.path.join(OUTDIR, 'p' + patient + '_' + id)
-if not os.path.isdir(OUTDIR):
-	os.makedirs(OUTDIR)
-if not os.path.isdir(outSubDir):
-	os.makedirs(outSubDir)
-
-""" Read the files """
-print('\nProcessing ' + nm + ' ...\n')
-[vertices, faces] = readMesh(os.path.join(DATADIR, meshFile))
-[OrigLatCoords, OrigLatVals] = readLAT(os.path.join(DATADIR, latFile))
-
-if ablFile != '':
-	ablFile = os.path.join(DATADIR, ablFile)
-else:
-	ablFile = None
-	print('No ablation file available for this mesh... continuing...\n')
-
-""" Pre-process the mesh and LAT samples. """
-mesh = Mesh([vertices, faces])
-mesh.c('grey')
-
-n = len(vertices)
-
-mapIdx = [i for i in range(n)]
-mapCoord = [vertices[i] for i in mapIdx]
-
-# Map the LAT samples to nearest mesh vertices
-allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
-
-M = len(allLatIdx)
-
-# Identify and exclude anomalous LAT samples
-anomalous = np.zeros(M)
-if remove_anomalies:
-	anomIdx = []	
-	if PATIENT_IDX == 4:
-		anomIdx = [25, 112, 159, 218, 240, 242, 264]
-	elif PATIENT_IDX == 5:
-		anomIdx = [119, 150, 166, 179, 188, 191, 209, 238]
-	elif PATIENT_IDX == 6:
-		anomIdx = [11, 12, 59, 63, 91, 120, 156]
-	elif PATIENT_IDX ==7:
-		anomIdx = [79, 98, 137, 205]
-	elif PATIENT_IDX == 8:
-		anomIdx = [10, 11, 51, 56, 85, 105, 125, 143, 156, 158, 169, 181, 210, 269, 284, 329, 336, 357, 365, 369, 400, 405]
-	elif PATIENT_IDX == 9:
-		anomIdx = [0, 48, 255, 322]
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Processes a single mesh file for comparison of MAGIC-LAT, GPR, and quLATi performance.')
+
+	parser.add_argument('-i', '--idx', required=True, default='11',
+	                    help='Data index or map ID (e.g. p037_9) to process. \
+	                    Default: 11')
+
+	parser.add_argument('-a', '--anomalies_removed', required=True, default=1,
+	                    help='Remove anomalous points (disable: 0, enable: 1). \
+	                    Default: 1')
+
+	parser.add_argument('-v', '--verbose', required=False, default=1,
+	                    help='Verbose output (disable: 0, enable: 1). \
+	                    Default: 1')
+
+	parser.add_argument('-t', '--text', required=False, default=0,
+	                    help='Generate text-only outputs (disable: 0, enable: 1). \
+	                    Default: 0')
+
+	parser.add_argument('-g', '--gpr', required=False, default='exact', choices=gprHelper.GPR_MODES,
+	                    help='GPR baseline: exact sklearn GPR, or sparse inducing point GPR with hyperparameters calibrated per map. \
+	                    Default: exact')
+
+	parser.add_argument('-s', '--seed', required=False, default=None,
+	                    help='Master random seed. \
+	                    Default: random')
+
+	args = parser.parse_args(argv)
+
+	PATIENT_IDX				=		datasets.index(vars(args)['idx'])
+	verbose					=		int(vars(args)['verbose'])
+	visualSuppressed		=		int(vars(args)['text'])
+	remove_anomalies		=		int(vars(args)['anomalies_removed'])
+
+	if vars(args)['seed'] is None:
+		SEED				=		trials.newMasterSeed()
 	else:
-		anomalous = utils.isAnomalous(allLatCoord, allLatVal)
-	anomalous[anomIdx] = 1
-else:
-	anomalous = [0 for i in range(M)]
+		SEED				=		int(vars(args)['seed'])
 
-numPtsIgnored = np.sum(anomalous)
+	""" Preprocess the map (shared, cached) """
+	data = preprocess.loadMap(PATIENT_IDX, remove_anomalies)
 
-latIdx = [allLatIdx[i] for i in range(M) if anomalous[i] == 0]
-latCoords = [allLatCoord[i] for i in range(M) if anomalous[i] == 0]
-latVals = [allLatVal[i] for i in range(M) if anomalous[i] == 0]
+	(nm, patient, id, ablFile) = (data.nm, data.patient, data.id, data.ablFile)
+	(vertices, faces) = (data.vertices, data.faces)
+	(n, M, numPtsIgnored) = (data.n, data.M, data.numPtsIgnored)
+	(latIdx, latCoords, latVals, mapLAT) = (data.latIdx, data.latCoords, data.latVals, data.mapLAT)
 
-M = len(latIdx)
+	""" Create output directory for this script and subdir for this mesh. """
+	outSubDir = os.path.join(OUTDIR, 'p' + patient + '_' + id)
+	if not os.path.isdir(OUTDIR):
+		os.makedirs(OUTDIR)
+	if not os.path.isdir(outSubDir):
+		os.makedirs(outSubDir)
 
-# For colorbar ranges
-MINLAT = math.floor(min(latVals)/10)*10
-MAXLAT = math.ceil(max(latVals)/10)*10
-if PATIENT_IDX == 4 or PATIENT_IDX == 5 or PATIENT_IDX == 8 or PATIENT_IDX == 9:
-	MAXLAT = MINLAT + math.ceil((3/4 * (max(latVals) - MINLAT)) / 10)*10
-elif PATIENT_IDX == 6 or PATIENT_IDX == 7 or PATIENT_IDX == 11:
-	MAXLAT = MINLAT + math.ceil((7/8 * (max(latVals) - MINLAT)) / 10)*10
+	# For colorbar ranges
+	(MINLAT, MAXLAT) = preprocess.roundedRange(latVals)
+	if PATIENT_IDX == 4 or PATIENT_IDX == 5 or PATIENT_IDX == 8 or PATIENT_IDX == 9:
+		MAXLAT = MINLAT + math.ceil((3/4 * (max(latVals) - MINLAT)) / 10)*10
+	elif PATIENT_IDX == 6 or PATIENT_IDX == 7 or PATIENT_IDX == 11:
+		MAXLAT = MINLAT + math.ceil((7/8 * (max(latVals) - MINLAT)) / 10)*10
 
-# Create partially-sampled signal vector
-mapLAT = [0 for i in range(n)]
-for i in range(M):
-	mapLAT[latIdx[i]] = latVals[i]
 
+	""" Random train/test split by non-uniform sampling distribution. """
+	mapName = data.mapName
+	rng = trials.stream(SEED, mapName, NUM_TRAIN_SAMPS, 0)
 
-""" Random train/test split by non-uniform sampling distribution. """
-# list with values repeated proportionally to sampling probability
-sampLst = utils.getModifiedSampList(latVals)
+	tr_i, tst_i = utils.sampleTrainTest(data.sampLst, M, NUM_TRAIN_SAMPS, rng)
 
-tr_i = []
-for i in range(NUM_TRAIN_SAMPS):
-	elem = random.sample(sampLst, 1)[0]
-	tr_i.append(elem)
-	sampLst = [i for i in sampLst if i != elem]	# to prevent repeats
-tst_i = [i for i in range(M) if i not in tr_i]
+	# get vertex indices of labelled/unlabelled nodes
+	TrIdx = sorted(np.take(latIdx, tr_i))
+	TstIdx = sorted(np.take(latIdx, tst_i))
 
-# get vertex indices of labelled/unlabelled nodes
-TrIdx = sorted(np.take(latIdx, tr_i))
-TstIdx = sorted(np.take(latIdx, tst_i))
+	# get vertex coordinates
+	TrCoord = [vertices[i] for i in TrIdx]
+	TstCoord = [vertices[i] for i in TstIdx]
 
-# get vertex coordinates
-TrCoord = [vertices[i] for i in TrIdx]
-TstCoord = [vertices[i] for i in TstIdx]
+	# get mapLAT signal values
+	TrVal = [mapLAT[i] for i in TrIdx]
+	TstVal = [mapLAT[i] for i in TstIdx]
 
-# get mapLAT signal values
-TrVal = [mapLAT[i] for i in TrIdx]
-TstVal = [mapLAT[i] for i in TstIdx]
 
+	""" MAGIC-LAT estimate """
+	if verbose:
+		print('\tBeginning MAGIC-LAT computation...')
 
-""" MAGIC-LAT estimate """
-if verbose:
-	print('\tBeginning MAGIC-LAT computation...')
+	np.random.seed(trials.streamSeed(SEED, mapName, 'magic', NUM_TRAIN_SAMPS, 0))
+	latEst = interpolators.create('magic', vertices, faces, edgeThreshold=EDGE_THRESHOLD).estimate(TrIdx, TrVal)
 
-latEst = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD)
 
+	""" GPR estimate """
+	if verbose:
+		print('\tBeginning GPR computation...')
 
-""" GPR estimate """
-if verbose:
-	print('\tBeginning GPR computation...')
+	gpr = interpolators.create('gpr', vertices, faces, mode=vars(args)['gpr'])
+	interpolators.calibrate({'gpr': gpr}, data, NUM_TRAIN_SAMPS, SEED)		# as in test_repeated.py
 
-gp_kernel = RBF(length_scale=0.01) + RBF(length_scale=0.1) + RBF(length_scale=1)
-gpr = GaussianProcessRegressor(kernel=gp_kernel, normalize_y=True)
+	np.random.seed(trials.streamSeed(SEED, mapName, 'gpr', NUM_TRAIN_SAMPS, 0))	# optimizer restarts
+	latEstGPR = gpr.estimate(TrIdx, TrVal)
 
-# fit the GPR with training samples
-gpr.fit(TrCoord, TrVal)
 
-# predict the entire signal
-latEstGPR = gpr.predict(vertices, return_std=False)
+	""" quLATi estimate """
+	if verbose:
+		print('\tBeginning quLATi computation...')
 
+	np.random.seed(trials.streamSeed(SEED, mapName, 'quLATi', NUM_TRAIN_SAMPS, 0))
+	latEstquLATi = interpolators.create('quLATi', vertices, faces).estimate(TrIdx, TrVal)
 
-""" quLATi estimate """
-if verbose:
-	print('\tBeginning quLATi computation...')
 
-model = quLATiHelper.quLATiModel(patient, vertices, faces)
-latEstquLATi = quLATiHelper.quLATi(TrIdx, TrVal, vertices, model)
+	if not visualSuppressed:
+		# plotting packages
+		from vedo import Mesh
 
+		mesh = Mesh([vertices, faces])
+		mesh.c('grey')
 
-if not visualSuppressed:
-	elev, azimuth, roll = utils.getPerspective(patient)
+		elev, azimuth, roll = data.info.view
 
-	# MAGIC-LAT results (multiple subfigures)
-	utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEst, 
-		azimuth, elev, roll, MINLAT, MAXLAT,
-		outSubDir, title='MAGIC-LAT', filename='magic', ablFile=ablFile)
+		# MAGIC-LAT results (multiple subfigures)
+		utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEst, 
+			azimuth, elev, roll, MINLAT, MAXLAT,
+			outSubDir, title='MAGIC-LAT', filename='magic', ablFile=ablFile)
 
-	# GPR results (multiple subfigures)
-	utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEstGPR, 
-		azimuth, elev, roll, MINLAT, MAXLAT,
-		outSubDir, title='GPR', filename='gpr', ablFile=ablFile)
+		# GPR results (multiple subfigures)
+		utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEstGPR, 
+			azimuth, elev, roll, MINLAT, MAXLAT,
+			outSubDir, title='GPR', filename='gpr', ablFile=ablFile)
 
-	# GPMI (quLATi) results (multiple subfigures)
-	utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEstquLATi, 
-		azimuth, elev, roll, MINLAT, MAXLAT,
-		outSubDir, title='quLATi', filename='quLATi', ablFile=ablFile)
+		# GPMI (quLATi) results (multiple subfigures)
+		utils.plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEstquLATi, 
+			azimuth, elev, roll, MINLAT, MAXLAT,
+			outSubDir, title='quLATi', filename='quLATi', ablFile=ablFile)
 
-	# Compare colormap representations of the same interpolation
-	utils.plotSaveTwoColorMaps(mesh, latEst,
-		azimuth, elev, roll, MINLAT, MAXLAT, outSubDir, 'gist_rainbow', 'viridis_r', filename='raw')
+		# Compare colormap representations of the same interpolation
+		utils.plotSaveTwoColorMaps(mesh, latEst,
+			azimuth, elev, roll, MINLAT, MAXLAT, outSubDir, 'gist_rainbow', 'viridis_r', filename='raw')
 
-	# Plot all results as individual figures, anterior and posterior views
-	utils.plotSaveIndividual(mesh, latCoords, latVals, TrCoord, TrVal, latEst, latEstGPR, latEstquLATi,
-		azimuth, elev, roll, MINLAT, MAXLAT, outSubDir, idx=7, ablFile=ablFile)
-"""
-Error metrics
-"""
-if verbose:
-	print('\tComputing metrics...')
+		# Plot all results as individual figures, anterior and posterior views
+		utils.plotSaveIndividual(mesh, latCoords, latVals, TrCoord, TrVal, latEst, latEstGPR, latEstquLATi,
+			azimuth, elev, roll, MINLAT, MAXLAT, outSubDir, idx=7, ablFile=ablFile)
+	"""
+	Error metrics
+	"""
+	if verbose:
+		print('\tComputing metrics...')
+
+	ests = np.array([np.ravel(latEst[TstIdx]), np.ravel(latEstGPR[TstIdx]), np.ravel(latEstquLATi[TstIdx])])
+	ev = metrics.evaluate(np.tile(TstVal, (3, 1)), ests, ['nmse', 'mae', 'de2000'], MINLAT, MAXLAT)
+
+	(nmse, nmseGPR, nmsequLATi) = ev['nmse']
+	(mae, maeGPR, maequLATi) = ev['mae']
+	(dE, dEGPR, dEquLATi) = ev['de2000']
 
-nmse = metrics.calcNMSE(TstVal, latEst[TstIdx])
-nmseGPR = metrics.calcNMSE(TstVal, latEstGPR[TstIdx])
-nmsequLATi = metrics.calcNMSE(TstVal, latEstquLATi[TstIdx])
+	if verbose:
+		print('\tWriting to file...')
 
-mae = metrics.calcMAE(TstVal, latEst[TstIdx])
-maeGPR = metrics.calcMAE(TstVal, latEstGPR[TstIdx])
-maequLATi = metrics.calcMAE(TstVal, latEstquLATi[TstIdx])
+	with open(os.path.join(outSubDir, 'metrics.txt'), 'w') as fid:
+		fid.write(nm + '\n\n')
+		fid.write('{:<20}{:g}\n'.format('n', n))
+		fid.write('{:<20}{:g}/{:g}\n'.format('m', NUM_TRAIN_SAMPS, M))
+		fid.write('{:<20}{:g}\n'.format('anomalous', numPtsIgnored))
+		fid.write('{:<20}{:d}\n\n'.format('seed', SEED))
 
-dE = metrics.deltaE(TstVal, latEst[TstIdx], MINLAT, MAXLAT)
-dEGPR = metrics.deltaE(TstVal, latEstGPR[TstIdx], MINLAT, MAXLAT)
-dEquLATi = metrics.deltaE(TstVal, latEstquLATi[TstIdx], MINLAT, MAXLAT)
+		fid.write('{:<20}{:<20}{:<20}{:<20}\n\n'.format('Metric', 'MAGIC-LAT', 'GPR', 'quLATi'))
+		fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('NMSE', nmse, nmseGPR, nmsequLATi))
+		fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('MAE', mae, maeGPR, maequLATi))
+		fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('DeltaE', dE, dEGPR, dEquLATi))
 
-if verbose:
-	print('\tWriting to file...')
+	rows = []
+	for (method, vals) in [('magic', [nmse, mae, dE]), ('gpr', [nmseGPR, maeGPR, dEGPR]), ('quLATi', [nmsequLATi, maequLATi, dEquLATi])]:
+		rows += results.records({'experiment': 'test', 'map': mapName, 'method': method, 'threshold': EDGE_THRESHOLD, 'anomalies': remove_anomalies,
+			'gpr': vars(args)['gpr'], 'm': NUM_TRAIN_SAMPS, 'trial': 0,
+			'seed': trials.streamSeed(SEED, mapName, NUM_TRAIN_SAMPS, 0)},
+			dict(zip(['nmse', 'mae', 'de2000'], vals)))
+	# one chunk per map and settings: a rerun replaces the previous rows
+	results.ResultsStore().append(rows, name='test_{}_t{:g}_m{:g}_a{:d}_g{}'.format(mapName, EDGE_THRESHOLD, NUM_TRAIN_SAMPS,
+		remove_anomalies, vars(args)['gpr']))
 
-with open(os.path.join(outSubDir, 'metrics.txt'), 'w') as fid:
-	fid.write(nm + '\n\n')
-	fid.write('{:<20}{:g}\n'.format('n', n))
-	fid.write('{:<20}{:g}/{:g}\n'.format('m', NUM_TRAIN_SAMPS, M))
-	fid.write('{:<20}{:g}\n\n'.format('anomalous', numPtsIgnored))
+	print('Success.\n')
+	print('Results saved to ' + outSubDir + '\n')
 
-	fid.write('{:<20}{:<20}{:<20}{:<20}\n\n'.format('Metric', 'MAGIC-LAT', 'GPR', 'quLATi'))
-	fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('NMSE', nmse, nmseGPR, nmsequLATi))
-	fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('MAE', mae, maeGPR, maequLATi))
-	fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}\n'.format('DeltaE', dE, dEGPR, dEquLATi))
 
-print('Success.\n')
-print('Results saved to ' + outSubDir + '\n')
\ No newline at end of file
+if __name__ == '__main__':
+	main()
@@ -10,7 +10,7 @@ Sequentially plots LAT observations for manual inspection.
 
 optional arguments:
   -h, --help            show this help message and exit
-  -i IDX, --idx IDX     Data index to process. Default: 11
+  -i IDX, --idx IDX     Data index or map ID (e.g. p037_9) to process. Default: 11
 
 DATA INDICES:
 	  p033 = 4 (3-RV-FAM-PVC-A-NORMAL), 5 (4-RV-FAM-PVC-A-LAT-HYBRID)
@@ -19,8 +19,7 @@ DATA INDICES:
 		p037 = 11 (9-RV-SINUS-VOLTAGE)
 
 Requirements: 
-	os, argparse,
-	numpy, math, random, 
+	argparse,
 	vedo
 
 File: test_anomalies.py
@@ -28,78 +27,54 @@ File: test_anomalies.py
 Author: Jennifer Hellar
 Email: jenniferhellar@gmail.com
 """
-import os
-
 import argparse
 
-import numpy as np
-import math
-import random
-
-# plotting packages
-from vedo import Mesh, Points, Point, show, Plotter
-
-# functions to read the files
-from readMesh import readMesh
-from readLAT import readLAT
-
-
-import utils
-from const import DATADIR, DATAFILES
-
+import datasets
+import preprocess
 
-""" Parse the input for data index argument. """
-parser = argparse.ArgumentParser(
-    description='Sequentially plots LAT observations for manual inspection.')
 
-parser.add_argument('-i', '--idx', required=True, default='11',
-                    help='Data index to process. \
-                    Default: 11')
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Sequentially plots LAT observations for manual inspection.')
 
-args = parser.parse_args()
+	parser.add_argument('-i', '--idx', required=True, default='11',
+	                    help='Data index or map ID (e.g. p037_9) to process. \
+	                    Default: 11')
 
-PATIENT_IDX				=		int(vars(args)['idx'])
+	args = parser.parse_args(argv)
 
-""" Obtain file names, patient number, mesh id, etc. """
-(meshFile, latFile, ablFile) = DATAFILES[PATIENT_IDX]
+	# plotting packages
+	from vedo import Mesh, Points, Point, Plotter
 
-nm = meshFile[0:-5]
-patient = nm[7:10]
-id = latFile.split('_')[3]
+	PATIENT_IDX				=		datasets.index(vars(args)['idx'])
 
-""" Read the files """
-print('\nProcessing ' + nm + ' ...\n')
-[vertices, faces] = readMesh(os.path.join(DATADIR, meshFile))
-[OrigLatCoords, OrigLatVals] = readLAT(os.path.join(DATADIR, latFile))
+	""" Preprocess the map (shared, cached), keeping every sample """
+	data = preprocess.loadMap(PATIENT_IDX, removeAnomalies=False)
 
-""" Pre-process the mesh and LAT samples. """
-mesh = Mesh([vertices, faces])
-mesh.c('grey')
+	(allLatIdx, allLatCoord, allLatVal) = (data.allLatIdx, data.allLatCoord, data.allLatVal)
 
-n = len(vertices)
+	mesh = Mesh([data.vertices, data.faces])
+	mesh.c('grey')
 
-mapIdx = [i for i in range(n)]
-mapCoord = [vertices[i] for i in mapIdx]
+	M = len(allLatIdx)
 
-# Map the LAT samples to nearest mesh vertices
-allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
+	# For colorbar ranges
+	(MINLAT, MAXLAT) = preprocess.roundedRange(allLatVal)
 
-M = len(allLatIdx)
+	allPoints = Points(allLatCoord, r=10).cmap('gist_rainbow', allLatVal, vmin=MINLAT, vmax=MAXLAT).addScalarBar(c='white')
 
-# For colorbar ranges
-MINLAT = math.floor(min(allLatVal)/10)*10
-MAXLAT = math.ceil(max(allLatVal)/10)*10
+	vplt = Plotter(N=1, axes=0, interactive=True)
+	for i in range(M):
+		coord = allLatCoord[i]
+		val = allLatVal[i]
 
-allPoints = Points(allLatCoord, r=10).cmap('gist_rainbow', allLatVal, vmin=MINLAT, vmax=MAXLAT).addScalarBar(c='white')
+		# plot current point as larger than the others
+		testPoint = Point(coord, r=20).cmap('gist_rainbow', [val], vmin=MINLAT, vmax=MAXLAT).addScalarBar(c='white')
+		vplt.show(mesh, allPoints, testPoint, title='i={:g}/{:g}'.format(i, M), bg='black')
 
-vplt = Plotter(N=1, axes=0, interactive=True)
-for i in range(M):
-	idx = allLatIdx[i]
-	coord = allLatCoord[i]
-	val = allLatVal[i]
+	vplt.close()
 
-	# plot current point as larger than the others
-	testPoint = Point(coord, r=20).cmap('gist_rainbow', [val], vmin=MINLAT, vmax=MAXLAT).addScalarBar(c='white')
-	vplt.show(mesh, allPoints, testPoint, title='i={:g}/{:g}'.format(i, M), bg='black')
 
-vplt.close()
\ No newline at end of file
+if __name__ == '__main__':
+	main()
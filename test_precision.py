@@ -0,0 +1,223 @@
+"""
+--------------------------------------------------------------------------------
+Compares the accuracy of the mixed precision MAGIC-LAT solve against the
+float64 solve across maps and saves the reports.
+--------------------------------------------------------------------------------
+
+usage: test_precision.py [-h] [-i IDX] [-a ANOMALIES_REMOVED] -r REPEAT [-s SEED]
+
+Compares float64 and mixed precision (float32 factorization with float64
+refinement) MAGIC-LAT estimates on one or more maps.
+
+optional arguments:
+  -h, --help            show this help message and exit
+  -i IDX, --idx IDX     Comma-separated data indices or map IDs, or 'all'. Default: all
+  -a ANOMALIES_REMOVED, --anomalies_removed ANOMALIES_REMOVED
+                        Remove anomalous points (disable: 0, enable: 1). Default: 1
+  -r REPEAT, --repeat REPEAT
+                        Number of test repetitions. Default: 20
+  -s SEED, --seed SEED  Master random seed (split seeds derive from it). Default: random
+
+Trial t uses the split stream (map, m, t) of the master seed
+(trials.streamSeed), as in test_repeated.py.
+
+A report is written per map, and summary.txt lists the largest float64 vs
+mixed differences of every map and the worst case over all maps.
+
+DATA INDICES:
+		p033 = 4 (3-RV-FAM-PVC-A-NORMAL), 5 (4-RV-FAM-PVC-A-LAT-HYBRID)
+		p034 = 6 (4-RVFAM-LAT-HYBRID), 7 (5-RVFAM-PVC), 8 (6-RVFAM-SINUS-VOLTAGE)
+		p035 = 9 (8-SINUS)
+		p037 = 11 (9-RV-SINUS-VOLTAGE)
+
+Requirements:
+	os, argparse, timeit
+	numpy, math,
+	robust_laplacian
+
+File: test_precision.py
+--------------------------------------------------------------------------------
+"""
+
+import os
+from timeit import default_timer as timer
+
+import argparse
+
+import numpy as np
+import math
+
+import utils
+import metrics
+from magicLAT import magicLAT
+import datasets
+import preprocess
+import trials
+
+
+NUM_TRAIN_SAMPS 		= 		100
+EDGE_THRESHOLD			=		50
+
+OUTDIR				 	=		'test_precision_results'
+
+
+def compareMap(data, NUM_TEST_REPEATS, SEED):
+	"""
+	Runs the float64 and mixed precision estimates on NUM_TEST_REPEATS splits
+	of the map, writes its report and returns the largest differences.
+	"""
+	(nm, patient, id) = (data.nm, data.patient, data.id)
+	(vertices, faces) = (data.vertices, data.faces)
+	(n, M, numPtsIgnored) = (data.n, data.M, data.numPtsIgnored)
+	(latIdx, mapLAT, sampLst) = (data.latIdx, data.mapLAT, data.sampLst)
+
+	outFile = os.path.join(OUTDIR, 'p' + patient + '_' + id + '.txt')
+
+	doubleNMSE = [0 for i in range(NUM_TEST_REPEATS)]
+	doubleMAE = [0 for i in range(NUM_TEST_REPEATS)]
+	doubleTime = [0 for i in range(NUM_TEST_REPEATS)]
+
+	mixedNMSE = [0 for i in range(NUM_TEST_REPEATS)]
+	mixedMAE = [0 for i in range(NUM_TEST_REPEATS)]
+	mixedTime = [0 for i in range(NUM_TEST_REPEATS)]
+
+	maxDiff = [0 for i in range(NUM_TEST_REPEATS)]
+
+	for test in range(NUM_TEST_REPEATS):
+
+		rng = trials.stream(SEED, data.mapName, NUM_TRAIN_SAMPS, test)
+		tr_i, tst_i = utils.sampleTrainTest(sampLst, M, NUM_TRAIN_SAMPS, rng)
+
+		# get vertex indices of labelled/unlabelled nodes
+		TrIdx = sorted(np.take(latIdx, tr_i))
+		TstIdx = sorted(np.take(latIdx, tst_i))
+
+		# get vertex coordinates
+		TrCoord = [vertices[i] for i in TrIdx]
+
+		# get mapLAT signal values
+		TrVal = [mapLAT[i] for i in TrIdx]
+		TstVal = [mapLAT[i] for i in TstIdx]
+
+
+		""" MAGIC-LAT estimate, float64 sparse LU """
+		start = timer()
+		latEst = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD, solver='direct')
+		doubleTime[test] = timer() - start
+
+		""" MAGIC-LAT estimate, float32 sparse LU with float64 refinement """
+		start = timer()
+		latEstMixed = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD, solver='mixed')
+		mixedTime[test] = timer() - start
+
+		""" Error metrics """
+		doubleNMSE[test] = metrics.calcNMSE(TstVal, latEst[TstIdx])
+		mixedNMSE[test] = metrics.calcNMSE(TstVal, latEstMixed[TstIdx])
+
+		doubleMAE[test] = metrics.calcMAE(TstVal, latEst[TstIdx])
+		mixedMAE[test] = metrics.calcMAE(TstVal, latEstMixed[TstIdx])
+
+		maxDiff[test] = np.max(np.abs(np.array(latEst) - np.array(latEstMixed)))
+
+	worst = {'NMSE': np.max(np.abs(np.array(doubleNMSE) - np.array(mixedNMSE))),
+		'MAE': np.max(np.abs(np.array(doubleMAE) - np.array(mixedMAE))),
+		'LAT': np.max(maxDiff)}
+
+	print('\n\tWriting to file...')
+
+	with open(outFile, 'w') as fid:
+		fid.write(nm + '\n\n')
+		fid.write('{:<20}{:g}\n'.format('n', n))
+		fid.write('{:<20}{:g}/{:g}\n'.format('m', NUM_TRAIN_SAMPS, M))
+		fid.write('{:<20}{:g}\n\n'.format('anomalous', numPtsIgnored))
+		fid.write('{:<20}{:g}\n'.format('repetitions', NUM_TEST_REPEATS))
+		fid.write('{:<20}{:d}\n'.format('seed', SEED))
+
+		fid.write('\n\n')
+
+		fid.write('{:<10}{:<25}{:<25}{:<25}\n\n'.format('Metric', 'float64', 'mixed', 'abs. difference'))
+
+		for (name, d, x) in [('NMSE', doubleNMSE, mixedNMSE), ('MAE', doubleMAE, mixedMAE), ('time (s)', doubleTime, mixedTime)]:
+			dStr = '{:.6f} +/- {:.6f}'.format(np.average(d), np.std(d))
+			xStr = '{:.6f} +/- {:.6f}'.format(np.average(x), np.std(x))
+			diffStr = '{:.3e}'.format(np.max(np.abs(np.array(d) - np.array(x))))
+			fid.write('{:<10}{:<25}{:<25}{:<25}\n'.format(name, dStr, xStr, diffStr))
+
+		fid.write('\n{:<20}{:.3e} ms\n'.format('max |LAT diff|', worst['LAT']))
+
+	print('Results saved to ' + outFile + '\n')
+
+	return worst
+
+
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Compares float64 and mixed precision MAGIC-LAT estimates on one or more maps.')
+
+	parser.add_argument('-i', '--idx', required=False, default='all',
+	                    help='Comma-separated data indices or map IDs, or \'all\'. \
+	                    Default: all')
+
+	parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
+	                    help='Remove anomalous points (disable: 0, enable: 1). \
+	                    Default: 1')
+
+	parser.add_argument('-r', '--repeat', required=True, default=20,
+	                    help='Number of test repetitions. \
+	                    Default: 20')
+
+	parser.add_argument('-s', '--seed', required=False, default=None,
+	                    help='Master random seed (split seeds derive from it). \
+	                    Default: random')
+
+	args = parser.parse_args(argv)
+
+	NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
+	remove_anomalies		=		int(vars(args)['anomalies_removed'])
+
+	if vars(args)['idx'] == 'all':
+		# every map found in the data directory
+		indices = [info.idx for info in datasets.load() if info.numVertices is not None]
+	else:
+		indices = [datasets.index(i) for i in vars(args)['idx'].split(',')]
+
+	if vars(args)['seed'] is None:
+		SEED				=		trials.newMasterSeed()
+	else:
+		SEED				=		int(vars(args)['seed'])
+
+	""" Create output directory for this script. """
+	if not os.path.isdir(OUTDIR):
+		os.makedirs(OUTDIR)
+
+	""" Compare the solves on every map (preprocessing shared, cached) """
+	worst = {}
+	for idx in indices:
+		data = preprocess.loadMap(idx, remove_anomalies)
+		worst[data.mapName] = compareMap(data, NUM_TEST_REPEATS, SEED)
+
+	""" Largest differences per map and over all maps """
+	summaryFile = os.path.join(OUTDIR, 'summary.txt')
+	with open(summaryFile, 'w') as fid:
+		fid.write('{:<20}{:g}\n'.format('repetitions', NUM_TEST_REPEATS))
+		fid.write('{:<20}{:d}\n\n'.format('seed', SEED))
+
+		fid.write('{:<20}{:<20}{:<20}{:<20}\n\n'.format('Map', '|NMSE diff|', '|MAE diff|', '|LAT diff| (ms)'))
+		for (mapName, w) in worst.items():
+			fid.write('{:<20}{:<20.3e}{:<20.3e}{:<20.3e}\n'.format(mapName, w['NMSE'], w['MAE'], w['LAT']))
+
+		fid.write('\n')
+		for key in ['NMSE', 'MAE', 'LAT']:
+			mapName = max(worst, key=lambda name: worst[name][key])
+			fid.write('{:<20}{:.3e} ({})\n'.format('worst |' + key + ' diff|', worst[mapName][key], mapName))
+
+	with open(summaryFile, 'r') as fid:
+		print(fid.read())
+
+	print('Success.\n')
+	print('Summary saved to ' + summaryFile + '\n')
+
+
+if __name__ == '__main__':
+	main()
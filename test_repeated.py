@@ -5,18 +5,74 @@ the performance metric results
 --------------------------------------------------------------------------------
 
 usage: test_repeated.py [-h] -i IDX [-a ANOMALIES_REMOVED] -r REPEAT [-v VERBOSE]
+                        [-w WORKERS] [-s SEED] [-c CI] [-k METRIC] [-n MIN_REPEAT]
+                        [-q {full,restart1,freeze}] [-g {exact,sparse}] [-m METHODS]
+                        [-p PROFILE]
 
 Processes a single mesh file repeatedly for comparison of MAGIC-LAT, GPR, and quLATi performance.
 
 optional arguments:
   -h, --help            show this help message and exit
-  -i IDX, --idx IDX     Data index to process. Default: 11
+  -i IDX, --idx IDX     Data index or map ID (e.g. p037_9) to process. Default: 11
   -a ANOMALIES_REMOVED, --anomalies_removed ANOMALIES_REMOVED
                         Remove anomalous points (disable: 0, enable: 1). Default: 1
   -r REPEAT, --repeat REPEAT
-                        Number of test repetitions. Default: 20
+                        Number of test repetitions (maximum number if -c is
+                        given). Default: 20
   -v VERBOSE, --verbose VERBOSE
                         Verbose output (disable: 0, enable: 1). Default: 1
+  -w WORKERS, --workers WORKERS
+                        Number of worker processes for the trials. Default: 1
+  -s SEED, --seed SEED  Master random seed (trial seeds derive from it). Default: random
+  -c CI, --ci CI        Stop once the 95% confidence interval half-width of
+                        the metric is below CI for every method (0: run all
+                        repetitions). Default: 0
+  -k METRIC, --metric METRIC
+                        Metric for the stopping rule (nmse, mae, de2000).
+                        Default: de2000
+  -n MIN_REPEAT, --min_repeat MIN_REPEAT
+                        Minimum number of repetitions before stopping early.
+                        Default: 10
+  -q {full,restart1,freeze}, --qulati {full,restart1,freeze}
+                        quLATi hyperparameters: optimize every fit (full),
+                        one restart, keeping the calibrated values if better
+                        (restart1), or freeze them after calibration
+                        (freeze). Default: full
+  -g {exact,sparse}, --gpr {exact,sparse}
+                        GPR baseline: exact sklearn GPR, or sparse inducing
+                        point GPR with calibrated hyperparameters. Default: exact
+  -m METHODS, --methods METHODS
+                        Comma-separated interpolation methods to compare (see
+                        interpolators.INTERPOLATORS). Default: magic,gpr,quLATi
+  -p PROFILE, --profile PROFILE
+                        Record the time and memory of every pipeline stage and
+                        write them to this Chrome trace file (and the results
+                        store). Default: off
+
+Metrics are aggregated as the trials complete, with live progress (mean and
+95% confidence interval).  Every completed trial is checkpointed together
+with the running aggregates; an interrupted run resumes from the checkpoint
+(and its stored seed) when restarted with the same map and repeats, and
+refuses to if the methods, their modes (-q, -g) or -a differ.
+
+With -c, no further trials are started once every method's interval on the
+chosen metric is narrower than the target (and at least MIN_REPEAT trials
+are done); trials already running on the other workers still complete.  The
+run otherwise stops after REPEAT trials.  Trials are started in order and
+their seeds do not depend on the stopping point, so an early-stopped run is
+a prefix of the full run with the same seed.
+
+The split of trial t is drawn from the random stream (map, m, t) of the master
+seed (trials.streamSeed), and each method's own randomness from (map, method,
+m, t), so results do not depend on the number of workers, and the splits
+match those of test_varied_m.py for the same seed and m.  State learned per
+map (sparse GPR and quLATi hyperparameters) is calibrated once in the parent
+process, on training sets from the seed's calibration streams, before any
+trial runs.
+
+With -q restart1/freeze, the map's quLATi hyperparameters are calibrated by fits
+optimized in full on the calibration training sets, and every trial reuses
+them (see quLATiHelper.HyperParams).
 
 DATA INDICES:
 		p033 = 4 (3-RV-FAM-PVC-A-NORMAL), 5 (4-RV-FAM-PVC-A-LAT-HYBRID)
@@ -25,7 +81,7 @@ DATA INDICES:
 		p037 = 11 (9-RV-SINUS-VOLTAGE)
 
 Requirements: 
-	os, argparse, timeit
+	os, argparse, multiprocessing, sqlite3
 	numpy, math, random, 
 	vedo, scikit-learn,
 	quLATi, robust_laplacian
@@ -38,7 +94,6 @@ Email: jenniferhellar@gmail.com
 """
 
 import os
-from timeit import default_timer as timer
 
 import argparse
 
@@ -46,21 +101,19 @@ import numpy as np
 import math
 import random
 
-# Gaussian process regression interpolation
-from sklearn.gaussian_process import GaussianProcessRegressor
-from sklearn.gaussian_process.kernels import RBF
-
-# functions to read the files
-from readMesh import readMesh
-from readLAT import readLAT
-
-
 import utils
 import metrics
-from const import DATADIR, DATAFILES
-from magicLAT import magicLAT
 
+import datasets
+import preprocess
 import quLATiHelper
+import gprHelper
+import interpolators
+import trials
+import results
+import profiling
+from accumulators import Accumulators
+from checkpoint import CheckpointStore
 
 
 NUM_TRAIN_SAMPS 		= 		100
@@ -69,216 +122,267 @@ EDGE_THRESHOLD			=		50
 OUTDIR				 	=		'test_repeated_results'
 
 
-""" Parse the input for data index argument. """
-parser = argparse.ArgumentParser(
-    description='Processes a single mesh file repeatedly for comparison of MAGIC-LAT, GPR, and quLATi performance.')
-
-parser.add_argument('-i', '--idx', required=True, default='11',
-                    help='Data index to process. \
-                    Default: 11')
-
-parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
-                    help='Remove anomalous points (disable: 0, enable: 1). \
-                    Default: 1')
-
-parser.add_argument('-r', '--repeat', required=True, default=20,
-                    help='Number of test repetitions. \
-                    Default: 20')
-
-parser.add_argument('-v', '--verbose', required=False, default=1,
-                    help='Verbose output (disable: 0, enable: 1). \
-                    Default: 1')
-
-args = parser.parse_args()
-
-PATIENT_IDX				=		int(vars(args)['idx'])
-NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
-verbose					=		int(vars(args)['verbose'])
-remove_anomalies		=		int(vars(args)['anomalies_removed'])
-
-""" Obtain file names, patient number, mesh id, etc. """
-(meshFile, latFile, ablFile) = DATAFILES[PATIENT_IDX]
-
-nm = meshFile[0:-5]
-patient = nm[7:10]
-id = latFile.split('_')[3]
-
-""" Create output directory for this script and subdir for this mesh. """
-if not os.path.isdir(OUTDIR):
-	os.makedirs(OUTDIR)
-outFile = os.path.join(OUTDIR, 'p' + patient + '_' + id + '.txt')
-
-""" Read the files """
-print('\nProcessing ' + nm + ' ...\n')
-[vertices, faces] = readMesh(os.path.join(DATADIR, meshFile))
-[OrigLatCoords, OrigLatVals] = readLAT(os.path.join(DATADIR, latFile))
-
-if ablFile != '':
-	ablFile = os.path.join(DATADIR, ablFile)
-else:
-	ablFile = None
-	print('No ablation file available for this mesh... continuing...\n')
-
-""" Pre-process the mesh and LAT samples. """
-n = len(vertices)
-
-mapIdx = [i for i in range(n)]
-mapCoord = [vertices[i] for i in mapIdx]
-
-# Map the LAT samples to nearest mesh vertices
-allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
-
-M = len(allLatIdx)
-
-# Identify and exclude anomalous LAT samples
-anomalous = np.zeros(M)
-if remove_anomalies:
-	anomIdx = []	
-	if PATIENT_IDX == 4:
-		anomIdx = [25, 112, 159, 218, 240, 242, 264]
-	elif PATIENT_IDX == 5:
-		anomIdx = [119, 150, 166, 179, 188, 191, 209, 238]
-	elif PATIENT_IDX == 6:
-		anomIdx = [11, 12, 59, 63, 91, 120, 156]
-	elif PATIENT_IDX ==7:
-		anomIdx = [79, 98, 137, 205]
-	elif PATIENT_IDX == 8:
-		anomIdx = [10, 11, 51, 56, 85, 105, 125, 143, 156, 158, 169, 181, 210, 269, 284, 329, 336, 357, 365, 369, 400, 405]
-	elif PATIENT_IDX == 9:
-		anomIdx = [0, 48, 255, 322]
-	else:
-		anomalous = utils.isAnomalous(allLatCoord, allLatVal)
-	anomalous[anomIdx] = 1
-else:
-	anomalous = [0 for i in range(M)]
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Processes a single mesh file repeatedly for comparison of MAGIC-LAT, GPR, and quLATi performance.')
 
-numPtsIgnored = np.sum(anomalous)
+	parser.add_argument('-i', '--idx', required=True, default='11',
+	                    help='Data index or map ID (e.g. p037_9) to process. \
+	                    Default: 11')
 
-latIdx = [allLatIdx[i] for i in range(M) if anomalous[i] == 0]
-latCoords = [allLatCoord[i] for i in range(M) if anomalous[i] == 0]
-latVals = [allLatVal[i] for i in range(M) if anomalous[i] == 0]
+	parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
+	                    help='Remove anomalous points (disable: 0, enable: 1). \
+	                    Default: 1')
 
-M = len(latIdx)
+	parser.add_argument('-r', '--repeat', required=True, default=20,
+	                    help='Number of test repetitions. \
+	                    Default: 20')
 
-# For colorbar ranges
-MINLAT = min(latVals)
-MAXLAT = max(latVals)
+	parser.add_argument('-v', '--verbose', required=False, default=1,
+	                    help='Verbose output (disable: 0, enable: 1). \
+	                    Default: 1')
 
-# Create partially-sampled signal vector
-mapLAT = [0 for i in range(n)]
-for i in range(M):
-	mapLAT[latIdx[i]] = latVals[i]
+	parser.add_argument('-w', '--workers', required=False, default=1,
+	                    help='Number of worker processes for the trials. \
+	                    Default: 1')
 
-""" Create GPR kernel and regressor """
-gp_kernel = RBF(length_scale=0.01) + RBF(length_scale=0.1) + RBF(length_scale=1)
-gpr = GaussianProcessRegressor(kernel=gp_kernel, normalize_y=True)
+	parser.add_argument('-s', '--seed', required=False, default=None,
+	                    help='Master random seed (trial seeds derive from it). \
+	                    Default: random')
 
-"""
-Create the quLATi model
-"""
-model = quLATiHelper.quLATiModel(patient, vertices, faces)
+	parser.add_argument('-c', '--ci', required=False, default=0,
+	                    help='Stop once the 95%% confidence interval half-width of the metric is below CI for every method (0: run all repetitions). \
+	                    Default: 0')
 
-""" Random train/test split by non-uniform sampling distribution. """
-# list with values repeated proportionally to sampling probability
-sampLst = utils.getModifiedSampList(latVals)
+	parser.add_argument('-k', '--metric', required=False, default='de2000', choices=['nmse', 'mae', 'de2000'],
+	                    help='Metric for the stopping rule. \
+	                    Default: de2000')
 
-magicNMSE = [0 for i in range(NUM_TEST_REPEATS)]
-magicMAE = [0 for i in range(NUM_TEST_REPEATS)]
-magicDE = [0 for i in range(NUM_TEST_REPEATS)]
+	parser.add_argument('-n', '--min_repeat', required=False, default=10,
+	                    help='Minimum number of repetitions before stopping early. \
+	                    Default: 10')
 
-gprNMSE = [0 for i in range(NUM_TEST_REPEATS)]
-gprMAE = [0 for i in range(NUM_TEST_REPEATS)]
-gprDE = [0 for i in range(NUM_TEST_REPEATS)]
+	parser.add_argument('-q', '--qulati', required=False, default='full', choices=quLATiHelper.HYPER_MODES,
+	                    help='quLATi hyperparameters: optimize every fit (full), one restart, keeping the calibrated values if better (restart1), or freeze them after calibration (freeze). \
+	                    Default: full')
 
-quLATiNMSE = [0 for i in range(NUM_TEST_REPEATS)]
-quLATiMAE = [0 for i in range(NUM_TEST_REPEATS)]
-quLATiDE = [0 for i in range(NUM_TEST_REPEATS)]
+	parser.add_argument('-g', '--gpr', required=False, default='exact', choices=gprHelper.GPR_MODES,
+	                    help='GPR baseline: exact sklearn GPR, or sparse inducing point GPR with hyperparameters calibrated per map. \
+	                    Default: exact')
 
+	parser.add_argument('-m', '--methods', required=False, default='magic,gpr,quLATi',
+	                    help='Comma-separated interpolation methods to compare (see interpolators.INTERPOLATORS). \
+	                    Default: magic,gpr,quLATi')
 
-for test in range(NUM_TEST_REPEATS):
-	
-	# print('\ttest #{:g} of {:g}.'.format(test + 1, NUM_TEST_REPEATS))
+	parser.add_argument('-p', '--profile', required=False, default=None,
+	                    help='Record the time and memory of every pipeline stage and write them to this Chrome trace file (and the results store). \
+	                    Default: off')
 
-	samps = sampLst
+	args = parser.parse_args(argv)
 
-	tr_i = []
-	for i in range(NUM_TRAIN_SAMPS):
-		elem = random.sample(samps, 1)[0]
-		tr_i.append(elem)
-		samps = [i for i in samps if i != elem]	# to prevent repeats
-	tst_i = [i for i in range(M) if i not in tr_i]
+	PATIENT_IDX				=		datasets.index(vars(args)['idx'])
+	NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
+	verbose					=		int(vars(args)['verbose'])
+	remove_anomalies		=		int(vars(args)['anomalies_removed'])
+	NUM_WORKERS				=		int(vars(args)['workers'])
+	CI_TARGET				=		float(vars(args)['ci'])
+	STOP_METRIC				=		vars(args)['metric']
+	MIN_TEST_REPEATS		=		int(vars(args)['min_repeat'])
+	METHODS					=		vars(args)['methods'].split(',')
+	PROFILE					=		vars(args)['profile']
 
-	# get vertex indices of labelled/unlabelled nodes
-	TrIdx = sorted(np.take(latIdx, tr_i))
-	TstIdx = sorted(np.take(latIdx, tst_i))
+	if PROFILE is not None:
+		profiling.enable()
 
-	# get vertex coordinates
-	TrCoord = [vertices[i] for i in TrIdx]
-	TstCoord = [vertices[i] for i in TstIdx]
+	for method in METHODS:
+		if method not in interpolators.INTERPOLATORS:
+			parser.error('unknown method \'{}\', choose from: {}'.format(method, ', '.join(interpolators.INTERPOLATORS.keys())))
 
-	# get mapLAT signal values
-	TrVal = [mapLAT[i] for i in TrIdx]
-	TstVal = [mapLAT[i] for i in TstIdx]
+	if vars(args)['seed'] is None:
+		SEED				=		trials.newMasterSeed()
+	else:
+		SEED				=		int(vars(args)['seed'])
 
+	""" Preprocess the map (shared, cached) """
+	data = preprocess.loadMap(PATIENT_IDX, remove_anomalies)
 
-	""" MAGIC-LAT estimate """
-	start = timer()
-	latEst = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD)
-	stop = timer()
-	print(stop-start)
+	(nm, patient, id) = (data.nm, data.patient, data.id)
+	(vertices, faces) = (data.vertices, data.faces)
+	(n, M, numPtsIgnored) = (data.n, data.M, data.numPtsIgnored)
+	(latIdx, latVals, mapLAT) = (data.latIdx, data.latVals, data.mapLAT)
+	(MINLAT, MAXLAT) = (data.MINLAT, data.MAXLAT)
+	mapName = data.mapName
 
-	""" GPR estimate """
-	gpr.fit(TrCoord, TrVal)
-	latEstGPR = gpr.predict(vertices, return_std=False)
+	""" Create output directory for this script """
+	if not os.path.isdir(OUTDIR):
+		os.makedirs(OUTDIR)
+	outFile = os.path.join(OUTDIR, 'p' + patient + '_' + id + '.txt')
 
-	""" quLATi estimate """
-	latEstquLATi = quLATiHelper.quLATi(TrIdx, TrVal, vertices, model)
+	""" Create the interpolators (mesh-level setup done once per method) """
+	OPTIONS = {'magic': {'edgeThreshold': EDGE_THRESHOLD},
+		'magic-unweighted': {'edgeThreshold': EDGE_THRESHOLD},
+		'gpr': {'mode': vars(args)['gpr']},
+		'quLATi': {'hyper': vars(args)['qulati']}}
 
-	""" Error metrics """
+	interps = {method: interpolators.create(method, vertices, faces, **OPTIONS.get(method, {})) for method in METHODS}
 
-	magicNMSE[test] = metrics.calcNMSE(TstVal, latEst[TstIdx])
-	gprNMSE[test] = metrics.calcNMSE(TstVal, latEstGPR[TstIdx])
-	quLATiNMSE[test] = metrics.calcNMSE(TstVal, latEstquLATi[TstIdx])
+	def runTrial(test, seed):
+		""" One random train/test split and the estimate of every method; returns the metrics. """
+		rng = random.Random(seed)	# split stream of this trial
 
-	magicMAE[test] = metrics.calcMAE(TstVal, latEst[TstIdx])
-	gprMAE[test] = metrics.calcMAE(TstVal, latEstGPR[TstIdx])
-	quLATiMAE[test] = metrics.calcMAE(TstVal, latEstquLATi[TstIdx])
+		tr_i, tst_i = utils.sampleTrainTest(data.sampLst, M, NUM_TRAIN_SAMPS, rng)
 
-	magicDE[test] = metrics.deltaE(TstVal, latEst[TstIdx], MINLAT, MAXLAT)
-	gprDE[test] = metrics.deltaE(TstVal, latEstGPR[TstIdx], MINLAT, MAXLAT)
-	quLATiDE[test] = metrics.deltaE(TstVal, latEstquLATi[TstIdx], MINLAT, MAXLAT)
+		# get vertex indices of labelled/unlabelled nodes
+		TrIdx = sorted(np.take(latIdx, tr_i))
+		TstIdx = sorted(np.take(latIdx, tst_i))
 
-if verbose:
-	print('\n\tWriting to file...')
+		# get mapLAT signal values
+		TrVal = [mapLAT[i] for i in TrIdx]
+		TstVal = [mapLAT[i] for i in TstIdx]
 
-with open(outFile, 'w') as fid:
-	fid.write(nm + '\n\n')
-	fid.write('{:<20}{:g}\n'.format('n', n))
-	fid.write('{:<20}{:g}/{:g}\n'.format('m', NUM_TRAIN_SAMPS, M))
-	fid.write('{:<20}{:g}\n\n'.format('anomalous', numPtsIgnored))
-	fid.write('{:<20}{:g}\n'.format('repetitions', NUM_TEST_REPEATS))
 
-	fid.write('\n\n')
+		res = {}
 
-	fid.write('{:<10}{:<25}{:<25}{:<25}\n\n'.format('Metric', 'MAGIC-LAT', 'GPR', 'quLATi'))
+		""" Estimates """
+		ests = []
+		for method in METHODS:
+			np.random.seed(trials.streamSeed(SEED, mapName, method, NUM_TRAIN_SAMPS, test))	# optimizer restarts
+			latEst = interps[method].estimate(TrIdx, TrVal)
+			res[method + 'Time'] = interps[method].lastTime
+			ests.append(latEst[TstIdx])
 
-	magicStr = '{:.4f} +/- {:.4f}'.format(np.average(magicNMSE), np.std(magicNMSE))
-	gprStr = '{:.4f} +/- {:.4f}'.format(np.average(gprNMSE), np.std(gprNMSE))
-	quStr = '{:.4f} +/- {:.4f}'.format(np.average(quLATiNMSE), np.std(quLATiNMSE))
+		""" Error metrics """
 
-	fid.write('{:<10}{:<25}{:<25}{:<25}\n'.format('NMSE', magicStr, gprStr, quStr))
+		ev = metrics.evaluate(np.tile(TstVal, (len(METHODS), 1)), np.array(ests), ['nmse', 'mae', 'de2000'], MINLAT, MAXLAT)
 
-	magicStr = '{:.4f} +/- {:.4f}'.format(np.average(magicMAE), np.std(magicMAE))
-	gprStr = '{:.4f} +/- {:.4f}'.format(np.average(gprMAE), np.std(gprMAE))
-	quStr = '{:.4f} +/- {:.4f}'.format(np.average(quLATiMAE), np.std(quLATiMAE))
+		for (k, method) in enumerate(METHODS):
+			res[method + 'NMSE'] = ev['nmse'][k]
+			res[method + 'MAE'] = ev['mae'][k]
+			res[method + 'DE'] = ev['de2000'][k]
+
+		if profiling.enabled():
+			res['profile'] = profiling.drain()	# stage records, sent back from the worker
+
+		return res
+
+
+	""" Checkpoint store: one record per completed trial, plus the running aggregates """
+	ckptFile = os.path.join(OUTDIR, 'p{}_{}_m{:g}_r{:g}_ckpt.sqlite'.format(patient, id, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS))
+	store = CheckpointStore(ckptFile)
+
+	SEED = store.meta('seed', SEED)
+	if store.meta('seeding', trials.SEEDING if len(store) == 0 else 1) != trials.SEEDING:
+		parser.error('checkpoint ' + ckptFile + ' uses an older seed derivation, remove it to rerun')
+
+	# the checkpointed trials hold results for this configuration only
+	CONFIG = {'methods': METHODS, 'options': {method: OPTIONS.get(method, {}) for method in METHODS},
+		'anomaliesRemoved': remove_anomalies}
+	if store.meta('config', CONFIG if len(store) == 0 else None) != CONFIG:
+		parser.error('checkpoint ' + ckptFile + ' was written with other methods, modes or anomaly removal, rerun with the same options or remove it')
+	if len(store) > 0:
+		print('Resuming run with seed {:d}: {:g} of {:g} trials already completed.'.format(SEED, len(store), NUM_TEST_REPEATS))
+
+	acc = Accumulators.fromDict(store.meta('accumulators', {}))
 
-	fid.write('{:<10}{:<25}{:<25}{:<25}\n'.format('MAE', magicStr, gprStr, quStr))
+	METRICS = [('nmse', 'NMSE'), ('mae', 'MAE'), ('de2000', 'DE'), ('runtime', 'Time')]
+
+
+	def trialDone(job, res):
+		""" Aggregates a completed trial and checkpoints it with the aggregates. """
+		(test, seed) = job
+		profiling.extend(res.pop('profile', []))
+		for method in METHODS:
+			for (metric, key) in METRICS:
+				acc.add(method + '/' + metric, res[method + key])
+		store.put((test,), res, meta={'accumulators': acc.toDict()})
+
+		if verbose:
+			print('\ntest #{:g} of {:g} done.'.format(test + 1, NUM_TEST_REPEATS))
+			print(acc.progress([method + '/' + STOP_METRIC for method in METHODS]))
+
+
+	def converged():
+		""" Early-stopping rule: enough trials and a narrow enough interval for every method. """
+		for method in METHODS:
+			name = method + '/' + STOP_METRIC
+			if (name not in acc) or (acc[name].count < MIN_TEST_REPEATS) or (acc[name].halfWidth() > CI_TARGET):
+				return False
+		return True
+
+
+	# per-map state (sparse GPR and quLATi hyperparameters) is calibrated here, before
+	# the workers are forked, so every trial sees the same calibration
+	interpolators.calibrate(interps, data, NUM_TRAIN_SAMPS, SEED)
+
+	# split stream per (map, m, trial): independent of the stopping point and the workers
+	seeds = [trials.streamSeed(SEED, mapName, NUM_TRAIN_SAMPS, test) for test in range(NUM_TEST_REPEATS)]
+	todo = [(test, seeds[test]) for test in range(NUM_TEST_REPEATS) if (test,) not in store]
 
-	magicStr = '{:.4f} +/- {:.4f}'.format(np.average(magicDE), np.std(magicDE))
-	gprStr = '{:.4f} +/- {:.4f}'.format(np.average(gprDE), np.std(gprDE))
-	quStr = '{:.4f} +/- {:.4f}'.format(np.average(quLATiDE), np.std(quLATiDE))
+	# one pool for the run; with -c no further trials start once converged
+	trials.runJobs(runTrial, todo, NUM_WORKERS, callback=trialDone, stop=converged if CI_TARGET > 0 else None)
 
-	fid.write('{:<10}{:<25}{:<25}{:<25}\n'.format('DeltaE', magicStr, gprStr, quStr))
+	numTrials = len(store)
+	if numTrials < NUM_TEST_REPEATS:
+		print('\nConfidence interval target reached after {:g} of at most {:g} trials.'.format(numTrials, NUM_TEST_REPEATS))
 
-print('Success.\n')
-print('Results saved to ' + outFile + '\n')
\ No newline at end of file
+	""" Per-trial results to the results store (one chunk per run) """
+	rows = []
+	for test in range(NUM_TEST_REPEATS):
+		res = store.get((test,))
+		if res is None:		# not run (stopped early)
+			continue
+		for method in METHODS:
+			rows += results.records({'experiment': 'test_repeated', 'map': mapName, 'method': method,
+				'alpha': getattr(interps[method], 'alpha', np.nan), 'beta': getattr(interps[method], 'beta', np.nan), 'threshold': EDGE_THRESHOLD, 'anomalies': remove_anomalies,
+				'gpr': vars(args)['gpr'], 'qulati': vars(args)['qulati'], 'm': NUM_TRAIN_SAMPS, 'trial': test, 'seed': seeds[test], 'runtime': res[method + 'Time']},
+				{'nmse': res[method + 'NMSE'], 'mae': res[method + 'MAE'], 'de2000': res[method + 'DE']})
+
+	# one chunk per map and settings: a rerun replaces the previous rows
+	RUNNAME = 'test_repeated_{}_m{:g}_r{:g}_a{:d}_{}_q{}_g{}_s{:d}'.format(mapName, NUM_TRAIN_SAMPS, NUM_TEST_REPEATS,
+		remove_anomalies, '-'.join(METHODS), vars(args)['qulati'], vars(args)['gpr'], SEED)
+	results.ResultsStore().append(rows, name=RUNNAME)
+
+	if PROFILE is not None:
+		print('\n' + profiling.summary())
+		profiling.writeTrace(PROFILE)
+		results.ResultsStore().append(profiling.toRecords('test_repeated', mapName),
+			name=RUNNAME + '_profile')
+		print('\nStage profile written to ' + PROFILE)
+
+	if verbose:
+		print('\n\tWriting to file...')
+
+	with open(outFile, 'w') as fid:
+		fid.write(nm + '\n\n')
+		fid.write('{:<20}{:g}\n'.format('n', n))
+		fid.write('{:<20}{:g}/{:g}\n'.format('m', NUM_TRAIN_SAMPS, M))
+		fid.write('{:<20}{:g}\n\n'.format('anomalous', numPtsIgnored))
+		fid.write('{:<20}{:g}\n'.format('repetitions', numTrials))
+		if CI_TARGET > 0:
+			fid.write('{:<20}{} CI half-width < {:g} (min {:g}, max {:g})\n'.format('stopping', STOP_METRIC, CI_TARGET, MIN_TEST_REPEATS, NUM_TEST_REPEATS))
+		fid.write('{:<20}{:d}\n'.format('seed', SEED))
+		fid.write('{:<20}{}\n'.format('methods', ', '.join(METHODS)))
+		if 'quLATi' in METHODS:
+			fid.write('{:<20}{}\n'.format('quLATi HP', interps['quLATi'].hyper.mode))
+		if 'gpr' in METHODS:
+			fid.write('{:<20}{}\n'.format('GPR', vars(args)['gpr']))
+
+		fid.write('\n\n')
+
+		fid.write('{:<10}'.format('Metric') + ('{:<25}'*len(METHODS)).format(*[interps[method].label for method in METHODS]) + '\n\n')
+
+		for (name, metric) in [('NMSE', 'nmse'), ('MAE', 'mae'), ('DeltaE', 'de2000')]:
+			strs = ['{:.4f} +/- {:.4f}'.format(acc[method + '/' + metric].mean, acc[method + '/' + metric].std) for method in METHODS]
+			fid.write('{:<10}'.format(name) + ('{:<25}'*len(METHODS)).format(*strs) + '\n')
+
+	""" The run is complete: a new invocation starts a new run """
+	store.close()
+	os.remove(ckptFile)
+
+	print('Success.\n')
+	print('Results saved to ' + outFile + '\n')
+
+
+if __name__ == '__main__':
+	main()
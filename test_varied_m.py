@@ -5,17 +5,39 @@ Executes GPR, GPMI, and MAGIC-LAT across multiple input sizes and records the
 performance metric results.
 --------------------------------------------------------------------------------
 
-usage: test_varied_m.py [-h] -i IDX [-a ANOMALIES_REMOVED] -r REPEAT
+usage: test_varied_m.py [-h] -i IDX [-a ANOMALIES_REMOVED] -r REPEAT [-l SOLVER]
+                        [-q {full,restart1,freeze}] [-g {exact,sparse}] [-m METHODS] [-s SEED]
 
 Tests MAGIC-LAT, GPR, and quLATi performance across multiple input sizes.
 
 optional arguments:
   -h, --help            show this help message and exit
-  -i IDX, --idx IDX     Data index to process. Default: 11
+  -i IDX, --idx IDX     Data index or map ID (e.g. p037_9) to process. Default: 11
   -a ANOMALIES_REMOVED, --anomalies_removed ANOMALIES_REMOVED
                         Remove anomalous points (disable: 0, enable: 1). Default: 1
   -r REPEAT, --repeat REPEAT
                         Number of test repetitions. Default: 25
+  -l SOLVER, --solver SOLVER
+                        MAGIC-LAT solver backend. Default: inv
+  -q {full,restart1,freeze}, --qulati {full,restart1,freeze}
+                        quLATi hyperparameters: optimize every fit (full),
+                        one restart, keeping the calibrated values if better
+                        (restart1), or freeze them after calibration
+                        (freeze). Default: full
+  -g {exact,sparse}, --gpr {exact,sparse}
+                        GPR baseline: exact sklearn GPR, or sparse inducing
+                        point GPR with calibrated hyperparameters. Default: exact
+  -m METHODS, --methods METHODS
+                        Comma-separated interpolation methods to compare (see
+                        interpolators.INTERPOLATORS). Default: magic,gpr,quLATi
+  -s SEED, --seed SEED  Master random seed (split seeds derive from it). Default: random
+
+The split for (m, repeat t) is drawn from the random stream (map, m, t) of the
+master seed (trials.streamSeed), and each method's own randomness from (map,
+method, m, t), so a run is reproducible from its seed and its splits match
+those of test_repeated.py for the same seed and m.  Per-map state (sparse GPR
+and quLATi hyperparameters) is calibrated once on training sets of
+CALIBRATION_M samples from the seed's calibration streams.
 
 DATA INDICES:
 	Too large for my laptop:
@@ -47,21 +69,16 @@ import numpy as np
 import math
 import random
 
-# Gaussian process regression interpolation
-from sklearn.gaussian_process import GaussianProcessRegressor
-from sklearn.gaussian_process.kernels import RBF
-
-# functions to read the files
-from readMesh import readMesh
-from readLAT import readLAT
-
-
 import utils
 import metrics
-from const import DATADIR, DATAFILES
-from magicLAT import magicLAT
 
+import datasets
+import preprocess
 import quLATiHelper
+import gprHelper
+import interpolators
+import results
+import trials
 
 
 EDGE_THRESHOLD			=		50
@@ -70,187 +87,173 @@ OUTDIR				 	=		'test_varied_m_results'
 
 m						=		[25, 50, 75, 100, 125, 150, 175, 200, 225, 250]
 
-""" Parse the input for data index argument. """
-parser = argparse.ArgumentParser(
-    description='Tests MAGIC-LAT, GPR, and quLATi performance across multiple input sizes.')
-
-parser.add_argument('-i', '--idx', required=True, default='11',
-                    help='Data index to process. \
-                    Default: 11')
-
-parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
-                    help='Remove anomalous points (disable: 0, enable: 1). \
-                    Default: 1')
-
-parser.add_argument('-r', '--repeat', required=True, default=25,
-                    help='Number of test repetitions. \
-                    Default: 25')
-
-args = parser.parse_args()
-
-PATIENT_IDX				=		int(vars(args)['idx'])
-NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
-remove_anomalies		=		int(vars(args)['anomalies_removed'])
-
-""" Obtain file names, patient number, mesh id, etc. """
-(meshFile, latFile, ablFile) = DATAFILES[PATIENT_IDX]
-
-nm = meshFile[0:-5]
-patient = nm[7:10]
-id = latFile.split('_')[3]
-
-""" Create output directory for this script and subdir for this mesh. """
-if not os.path.isdir(OUTDIR):
-	os.makedirs(OUTDIR)
-
-""" Read the files """
-print('\nProcessing ' + nm + ' ...\n')
-[vertices, faces] = readMesh(os.path.join(DATADIR, meshFile))
-[OrigLatCoords, OrigLatVals] = readLAT(os.path.join(DATADIR, latFile))
-
-if ablFile != '':
-	ablFile = os.path.join(DATADIR, ablFile)
-else:
-	ablFile = None
-	print('No ablation file available for this mesh... continuing...\n')
-
-""" Pre-process the mesh and LAT samples. """
-n = len(vertices)
-
-mapIdx = [i for i in range(n)]
-mapCoord = [vertices[i] for i in mapIdx]
-
-# Map the LAT samples to nearest mesh vertices
-allLatIdx, allLatCoord, allLatVal = utils.mapSamps(mapIdx, mapCoord, OrigLatCoords, OrigLatVals)
-
-M = len(allLatIdx)
-
-# Identify and exclude anomalous LAT samples
-anomalous = np.zeros(M)
-if remove_anomalies:
-	anomIdx = []	
-	if PATIENT_IDX == 4:
-		anomIdx = [25, 112, 159, 218, 240, 242, 264]
-	elif PATIENT_IDX == 5:
-		anomIdx = [119, 150, 166, 179, 188, 191, 209, 238]
-	elif PATIENT_IDX == 6:
-		anomIdx = [11, 12, 59, 63, 91, 120, 156]
-	elif PATIENT_IDX ==7:
-		anomIdx = [79, 98, 137, 205]
-	elif PATIENT_IDX == 8:
-		anomIdx = [10, 11, 51, 56, 85, 105, 125, 143, 156, 158, 169, 181, 210, 269, 284, 329, 336, 357, 365, 369, 400, 405]
-	elif PATIENT_IDX == 9:
-		anomIdx = [0, 48, 255, 322]
-	else:
-		anomalous = utils.isAnomalous(allLatCoord, allLatVal)
-	anomalous[anomIdx] = 1
-else:
-	anomalous = [0 for i in range(M)]
+# training set size for the per-map calibration (as in test_repeated.py)
+CALIBRATION_M			=		100
 
-numPtsIgnored = np.sum(anomalous)
+def main(argv=None):
+	""" Parse the input for data index argument. """
+	parser = argparse.ArgumentParser(
+	    description='Tests MAGIC-LAT, GPR, and quLATi performance across multiple input sizes.')
 
-latIdx = [allLatIdx[i] for i in range(M) if anomalous[i] == 0]
-latCoords = [allLatCoord[i] for i in range(M) if anomalous[i] == 0]
-latVals = [allLatVal[i] for i in range(M) if anomalous[i] == 0]
+	parser.add_argument('-i', '--idx', required=True, default='11',
+	                    help='Data index or map ID (e.g. p037_9) to process. \
+	                    Default: 11')
 
-M = len(latIdx)
+	parser.add_argument('-a', '--anomalies_removed', required=False, default=1,
+	                    help='Remove anomalous points (disable: 0, enable: 1). \
+	                    Default: 1')
 
-# For colorbar ranges
-MINLAT = min(latVals)
-MAXLAT = max(latVals)
+	parser.add_argument('-r', '--repeat', required=True, default=25,
+	                    help='Number of test repetitions. \
+	                    Default: 25')
 
-# Create partially-sampled signal vector
-mapLAT = [0 for i in range(n)]
-for i in range(M):
-	mapLAT[latIdx[i]] = latVals[i]
+	parser.add_argument('-l', '--solver', required=False, default='inv',
+	                    help='MAGIC-LAT solver backend. \
+	                    Default: inv')
 
-""" Create GPR kernel and regressor """
-gp_kernel = RBF(length_scale=0.01) + RBF(length_scale=0.1) + RBF(length_scale=1)
-gpr = GaussianProcessRegressor(kernel=gp_kernel, normalize_y=True)
+	parser.add_argument('-q', '--qulati', required=False, default='full', choices=quLATiHelper.HYPER_MODES,
+	                    help='quLATi hyperparameters: optimize every fit (full), one restart, keeping the calibrated values if better (restart1), or freeze them after calibration (freeze). \
+	                    Default: full')
 
-"""
-Create the quLATi model
-"""
-model = quLATiHelper.quLATiModel(patient, vertices, faces)
+	parser.add_argument('-g', '--gpr', required=False, default='exact', choices=gprHelper.GPR_MODES,
+	                    help='GPR baseline: exact sklearn GPR, or sparse inducing point GPR with hyperparameters calibrated per map. \
+	                    Default: exact')
+
+	parser.add_argument('-m', '--methods', required=False, default='magic,gpr,quLATi',
+	                    help='Comma-separated interpolation methods to compare (see interpolators.INTERPOLATORS). \
+	                    Default: magic,gpr,quLATi')
+
+	parser.add_argument('-s', '--seed', required=False, default=None,
+	                    help='Master random seed (split seeds derive from it). \
+	                    Default: random')
+
+	args = parser.parse_args(argv)
+
+	PATIENT_IDX				=		datasets.index(vars(args)['idx'])
+	NUM_TEST_REPEATS		=		int(vars(args)['repeat'])
+	remove_anomalies		=		int(vars(args)['anomalies_removed'])
+	SOLVER					=		vars(args)['solver']
+	METHODS					=		vars(args)['methods'].split(',')
+
+	for method in METHODS:
+		if method not in interpolators.INTERPOLATORS:
+			parser.error('unknown method \'{}\', choose from: {}'.format(method, ', '.join(interpolators.INTERPOLATORS.keys())))
+
+	if vars(args)['seed'] is None:
+		SEED				=		trials.newMasterSeed()
+	else:
+		SEED				=		int(vars(args)['seed'])
 
-infoFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_info.txt')
-meanFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_mean.txt')
-stdFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_std.txt')
+	""" Preprocess the map (shared, cached) """
+	data = preprocess.loadMap(PATIENT_IDX, remove_anomalies)
 
-with open(infoFile, 'w') as fid:
-	fid.write('{:<30}{}\n'.format('file', nm))
-	fid.write('{:<30}{:g}\n'.format('n', n))
-	fid.write('{:<30}{:g}\n'.format('M', M))
-	fid.write('{:<30}{:g}\n'.format('ignored', np.sum(anomalous)))
+	(nm, patient, id) = (data.nm, data.patient, data.id)
+	(vertices, faces) = (data.vertices, data.faces)
+	(n, M, anomalous) = (data.n, data.M, data.anomalous)
+	(latIdx, mapLAT) = (data.latIdx, data.mapLAT)
+	(MINLAT, MAXLAT) = (data.MINLAT, data.MAXLAT)
 
-	fid.write('{:<30}{:g}\n'.format('EDGE_THRESHOLD', EDGE_THRESHOLD))
-	fid.write('{:<30}{:g}\n'.format('NUM_TEST_REPEATS', NUM_TEST_REPEATS))
+	""" Create output directory for this script """
+	if not os.path.isdir(OUTDIR):
+		os.makedirs(OUTDIR)
 
-with open(meanFile, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('m', 'MAGIC-LAT', 'GPR', 'quLATi'))
+	""" Create the interpolators (mesh-level setup done once per method) """
+	OPTIONS = {'magic': {'edgeThreshold': EDGE_THRESHOLD, 'solver': SOLVER},
+		'magic-unweighted': {'edgeThreshold': EDGE_THRESHOLD},
+		'gpr': {'mode': vars(args)['gpr']},
+		'quLATi': {'hyper': vars(args)['qulati']}}
 
-with open(stdFile, 'w') as fid:
-	fid.write('{:<20}{:<20}{:<20}{:<20}'.format('m', 'MAGIC-LAT', 'GPR', 'quLATi'))
+	interps = {method: interpolators.create(method, vertices, faces, **OPTIONS.get(method, {})) for method in METHODS}
+	interpolators.calibrate(interps, data, min(CALIBRATION_M, M), SEED)
 
-""" Random train/test split by non-uniform sampling distribution. """
-# list with values repeated proportionally to sampling probability
-sampLst = utils.getModifiedSampList(latVals)
+	infoFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_info.txt')
+	meanFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_mean.txt')
+	stdFile = os.path.join(OUTDIR, 'p' + patient + '_' + id.split('-')[0] + '_std.txt')
 
-for i in range(len(m)):
+	with open(infoFile, 'w') as fid:
+		fid.write('{:<30}{}\n'.format('file', nm))
+		fid.write('{:<30}{:g}\n'.format('n', n))
+		fid.write('{:<30}{:g}\n'.format('M', M))
+		fid.write('{:<30}{:g}\n'.format('ignored', np.sum(anomalous)))
 
-	numSamps = m[i]
+		fid.write('{:<30}{:g}\n'.format('EDGE_THRESHOLD', EDGE_THRESHOLD))
+		fid.write('{:<30}{:g}\n'.format('NUM_TEST_REPEATS', NUM_TEST_REPEATS))
+		fid.write('{:<30}{}\n'.format('SOLVER', SOLVER))
+		fid.write('{:<30}{}\n'.format('METHODS', ','.join(METHODS)))
+		fid.write('{:<30}{}\n'.format('QULATI_HP', vars(args)['qulati']))
+		fid.write('{:<30}{}\n'.format('GPR', vars(args)['gpr']))
+		fid.write('{:<30}{:d}\n'.format('SEED', SEED))
 
-	print('testing #{:g} of {:g} possible m values.'.format(i + 1, len(m)))
+	header = ('{:<20}'*(len(METHODS) + 1)).format('m', *[interps[method].label for method in METHODS])
 
-	magicDE = [0 for i in range(NUM_TEST_REPEATS)]
-	gprDE = [0 for i in range(NUM_TEST_REPEATS)]
-	quLATiDE = [0 for i in range(NUM_TEST_REPEATS)]
+	with open(meanFile, 'w') as fid:
+		fid.write(header)
 
-	for test in range(NUM_TEST_REPEATS):
-		
-		print('\ttest #{:g} of {:g}.'.format(test + 1, NUM_TEST_REPEATS))
+	with open(stdFile, 'w') as fid:
+		fid.write(header)
 
-		samps = sampLst
+	# DeltaE per method, m and repeat
+	DE = {method: np.zeros((len(m), NUM_TEST_REPEATS)) for method in METHODS}
 
-		tr_i = []
-		for i in range(numSamps):
-			elem = random.sample(samps, 1)[0]
-			tr_i.append(elem)
-			samps = [i for i in samps if i != elem]	# to prevent repeats
-		tst_i = [i for i in range(M) if i not in tr_i]
+	# per-trial rows for the results store
+	mapName = data.mapName
+	rows = []
+
+
+	def runSplit(i, test, tr_i, seed):
+		""" Estimates and metrics for one training set; seed is the split seed (recorded). """
+		tst_i = [j for j in range(M) if j not in tr_i]
 
 		# get vertex indices of labelled/unlabelled nodes
 		TrIdx = sorted(np.take(latIdx, tr_i))
 		TstIdx = sorted(np.take(latIdx, tst_i))
 
-		# get vertex coordinates
-		TrCoord = [vertices[i] for i in TrIdx]
-		TstCoord = [vertices[i] for i in TstIdx]
-
 		# get mapLAT signal values
-		TrVal = [mapLAT[i] for i in TrIdx]
-		TstVal = [mapLAT[i] for i in TstIdx]
+		TrVal = [mapLAT[j] for j in TrIdx]
+		TstVal = [mapLAT[j] for j in TstIdx]
+
+		for method in METHODS:
+			interp = interps[method]
+			np.random.seed(trials.streamSeed(SEED, mapName, method, m[i], test))	# optimizer restarts
+			latEst = interp.estimate(TrIdx, TrVal)
+
+			DE[method][i, test] = metrics.deltaE(TstVal, latEst[TstIdx], MINLAT, MAXLAT)
+
+			rows.extend(results.records({'experiment': 'test_varied_m', 'map': mapName, 'method': method,
+				'alpha': getattr(interp, 'alpha', np.nan), 'beta': getattr(interp, 'beta', np.nan), 'threshold': EDGE_THRESHOLD, 'anomalies': remove_anomalies,
+				'solver': SOLVER, 'gpr': vars(args)['gpr'], 'qulati': vars(args)['qulati'], 'm': m[i],
+				'trial': test, 'seed': seed, 'runtime': interp.lastTime}, {'de2000': DE[method][i, test]}))
+
+
+	for i in range(len(m)):
+
+		print('testing #{:g} of {:g} possible m values.'.format(i + 1, len(m)))
+
+		for test in range(NUM_TEST_REPEATS):
+
+			print('\ttest #{:g} of {:g}.'.format(test + 1, NUM_TEST_REPEATS))
+
+			seed = trials.streamSeed(SEED, mapName, m[i], test)
+			tr_i, _ = utils.sampleTrainTest(data.sampLst, M, m[i], random.Random(seed))
 
+			runSplit(i, test, tr_i, seed)
 
-		""" MAGIC-LAT estimate """
-		latEst = magicLAT(vertices, faces, TrIdx, TrCoord, TrVal, EDGE_THRESHOLD)
+	# one chunk per map and settings: a rerun replaces the previous rows
+	results.ResultsStore().append(rows, name='test_varied_m_{}_t{:g}_r{:g}_a{:d}_{}_{}_q{}_g{}'.format(mapName, EDGE_THRESHOLD,
+		NUM_TEST_REPEATS, remove_anomalies, SOLVER, '-'.join(METHODS), vars(args)['qulati'], vars(args)['gpr']))
 
-		""" GPR estimate """
-		gpr.fit(TrCoord, TrVal)
-		latEstGPR = gpr.predict(vertices, return_std=False)
+	for i in range(len(m)):
 
-		""" quLATi estimate """
-		latEstquLATi = quLATiHelper.quLATi(TrIdx, TrVal, vertices, model)
+		numSamps = m[i]
 
+		with open(meanFile, 'a') as fid:
+				fid.write('\n')
+				fid.write('{:<20}'.format(numSamps) + ('{:<20.6f}'*len(METHODS)).format(*[np.average(DE[method][i]) for method in METHODS]))
 
-		magicDE[test] = metrics.deltaE(TstVal, latEst[TstIdx], MINLAT, MAXLAT)
-		gprDE[test] = metrics.deltaE(TstVal, latEstGPR[TstIdx], MINLAT, MAXLAT)
-		quLATiDE[test] = metrics.deltaE(TstVal, latEstquLATi[TstIdx], MINLAT, MAXLAT)
+		with open(stdFile, 'a') as fid:
+				fid.write('\n')
+				fid.write('{:<20}'.format(numSamps) + ('{:<20.6f}'*len(METHODS)).format(*[np.std(DE[method][i]) for method in METHODS]))
 
-	with open(meanFile, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}'.format(numSamps, np.average(magicDE), np.average(gprDE), np.average(quLATiDE)))
 
-	with open(stdFile, 'a') as fid:
-			fid.write('\n')
-			fid.write('{:<20}{:<20.6f}{:<20.6f}{:<20.6f}'.format(numSamps, np.std(magicDE), np.std(gprDE), np.std(quLATiDE)))
\ No newline at end of file
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,159 @@
+"""
+--------------------------------------------------------------------------------
+Parallel execution of independent repeated trials.
+--------------------------------------------------------------------------------
+
+Description: Fans independent trials (random train/test splits) out to a
+process pool.  Mesh and model data loaded by the driver before the pool is
+created are shared read-only with the workers (copy-on-write fork), every
+trial receives a seed derived deterministically from one master seed, and the
+results are gathered in trial order, so aggregates are identical to a serial
+run with the same master seed.
+
+Usage:
+	def runTrial(test, seed):
+		...
+		return result
+
+	results = trials.runTrials(runTrial, NUM_TEST_REPEATS, seed, numWorkers)
+
+Random streams are identified by a key rather than by their position in a
+job list: streamSeed(masterSeed, map, m, trial) seeds the train/test split of
+one trial (shared by every method, so they are compared on the same split),
+and streamSeed(masterSeed, map, method, m, trial) any randomness of one method
+(e.g. optimizer restarts).  A stream therefore does not depend on which other
+trials are run, in which order, or by which worker.
+
+More general job graphs (e.g. a parameter grid x trials) use runJobs(), which
+also reports each result to a callback in the parent process as soon as it
+completes, e.g. to write it to a checkpoint store, and can stop starting jobs
+once a condition checked in the parent is met (e.g. early stopping).
+
+Requirements: queue, random, hashlib, multiprocessing, numpy
+
+File: trials.py
+--------------------------------------------------------------------------------
+"""
+
+import queue
+import random
+import hashlib
+import multiprocessing as mp
+
+import numpy as np
+
+
+# version of the seed derivation, stored with checkpoints (1: by trial position)
+SEEDING					=		2
+
+# job function inherited by the forked workers
+_jobFn = None
+
+
+def newMasterSeed():
+	""" Returns a fresh random master seed (to be recorded with the results). """
+	return int(np.random.SeedSequence().entropy % (2**32))
+
+
+def trialSeeds(masterSeed, numTrials):
+	""" Returns an independent 32-bit seed for each trial, derived from masterSeed. """
+	children = np.random.SeedSequence(masterSeed).spawn(numTrials)
+
+	return [int(c.generate_state(1)[0]) for c in children]
+
+
+def _keyWord(k):
+	""" 32-bit word for one key element (non-negative integers map to themselves). """
+	if isinstance(k, (int, np.integer)) and not isinstance(k, bool) and 0 <= k < 2**32:
+		return int(k)
+	return int.from_bytes(hashlib.sha1(repr(k).encode('utf-8')).digest()[0:4], 'little')
+
+
+def streamSeed(masterSeed, *key):
+	"""
+	Returns the 32-bit seed of the random stream identified by key (e.g. map,
+	method, m, trial), derived from masterSeed.  streamSeed(masterSeed, i)
+	equals trialSeeds(masterSeed, N)[i].
+	"""
+	seq = np.random.SeedSequence(masterSeed, spawn_key=tuple(_keyWord(k) for k in key))
+
+	return int(seq.generate_state(1)[0])
+
+
+def stream(masterSeed, *key):
+	""" Returns a random.Random seeded with streamSeed(masterSeed, *key). """
+	return random.Random(streamSeed(masterSeed, *key))
+
+
+def _runOne(args):
+	(i, job) = args
+	return (i, _jobFn(*job))
+
+
+def runJobs(jobFn, jobs, numWorkers=1, callback=None, stop=None):
+	"""
+	Runs jobFn(*job) for every argument tuple in jobs and returns the results
+	in job order.  callback(job, result), if given, is called in the parent
+	process as each job completes.  stop(), if given, is checked in the parent
+	before each job is started: once it returns True no further jobs start
+	(running ones complete and are reported), and the results of the jobs not
+	run are None.  With numWorkers > 1 the jobs run on one pool of forked
+	worker processes, one job per worker at a time, so the jobs run are always
+	the first ones in the list; where fork is unavailable they run serially.
+	"""
+	global _jobFn
+
+	jobs = list(jobs)
+	results = [None for i in range(len(jobs))]
+	stopped = (lambda: False) if stop is None else stop
+
+	if numWorkers > 1 and 'fork' not in mp.get_all_start_methods():
+		print('WARNING: process pool requires fork, running jobs serially')
+		numWorkers = 1
+
+	if numWorkers <= 1 or len(jobs) <= 1:
+		for i in range(len(jobs)):
+			if stopped():
+				break
+			results[i] = jobFn(*jobs[i])
+			if callback is not None:
+				callback(jobs[i], results[i])
+		return results
+
+	_jobFn = jobFn
+	try:
+		ctx = mp.get_context('fork')
+		numProcs = min(numWorkers, len(jobs))
+		done = queue.Queue()	# completed (i, result) pairs or worker exceptions
+		(nextJob, running) = (0, 0)
+		with ctx.Pool(processes=numProcs) as pool:
+			while True:
+				while (running < numProcs) and (nextJob < len(jobs)) and not stopped():
+					pool.apply_async(_runOne, ((nextJob, jobs[nextJob]),), callback=done.put, error_callback=done.put)
+					(nextJob, running) = (nextJob + 1, running + 1)
+				if running == 0:
+					break
+
+				out = done.get()
+				running -= 1
+				if isinstance(out, BaseException):
+					raise out
+
+				(i, res) = out
+				results[i] = res
+				if callback is not None:
+					callback(jobs[i], res)
+	finally:
+		_jobFn = None
+
+	return results
+
+
+def runTrials(trialFn, numTrials, masterSeed, numWorkers=1):
+	"""
+	Runs trialFn(test, seed) for test = 0..numTrials-1 and returns the list of
+	results in trial order.
+	"""
+	jobs = list(zip(range(numTrials), trialSeeds(masterSeed, numTrials)))
+
+	return runJobs(trialFn, jobs, numWorkers)
@@ -6,7 +6,10 @@ Utility functions for MAGIC-LAT.
 Description: Utility functions to compute graph edges from triangle mesh and
 corresponding adjacency matrix from the edges.
 
-Requirements: numpy
+The plotting functions import vedo when called, so the sample mapping and
+sampling helpers need numpy and scipy only.
+
+Requirements: numpy, scipy, vedo (plotting only)
 
 File: utils.py
 
@@ -17,14 +20,13 @@ Email: jennifer.hellar@rice.edu
 
 import numpy as np
 import math
+import random
 
 import os
-from vedo import *
 
 from scipy.spatial import cKDTree
 
-import matplotlib.pyplot as plt
-
+import datasets
 
 
 def mapSamps(IDX, COORD, coords, vals):
@@ -173,6 +175,26 @@ def getModifiedSampList(latVals):
 	return sampLst
 
 
+def sampleTrainTest(sampLst, M, numSamps, rng=random):
+	"""
+	Draws numSamps distinct training samples from sampLst (the list returned by
+	getModifiedSampList) and returns the training and test sample indices.
+
+	rng: random number generator (random.Random instance) to draw from, e.g.
+		seeded per trial for reproducibility.  Default: global random module.
+	"""
+	samps = sampLst
+
+	tr_i = []
+	for i in range(numSamps):
+		elem = rng.sample(samps, 1)[0]
+		tr_i.append(elem)
+		samps = [i for i in samps if i != elem]	# to prevent repeats
+	tst_i = [i for i in range(M) if i not in tr_i]
+
+	return tr_i, tst_i
+
+
 def plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEst, 
 	a, e, r, MINLAT, MAXLAT, outDir, title, filename, ablFile=None):
 	"""
@@ -180,6 +202,8 @@ def plotSaveEntire(mesh, latCoords, latVals, TrCoord, TrVal, latEst,
 	with subfigures for ground truth, training points, interpolation
 	w/ground truth, and interpolation w/ablations.
 	"""
+	# plotting package, imported on first use
+	from vedo import Mesh, Points, Plotter
 
 	# colormap = 'viridis_r'
 	colormap = 'gist_rainbow'
@@ -252,6 +276,8 @@ def plotSaveTwoColorMaps(mesh, latEst,
 	"""
 	Plots and saves the same interpolation result with two colormaps for comparison.
 	"""
+	# plotting package, imported on first use
+	from vedo import Mesh, Points, Plotter
 
 	vertices = mesh.points()
 	faces = mesh.faces()
@@ -283,6 +309,8 @@ def plotSaveIndividual(mesh, latCoords, latVals, TrCoord, TrVal, latEst, latEstG
 	Plots and saves individual figures for all interpolation results, anterior and posterior
 	perspectives, with ground truth and ablation points for comparison.
 	"""
+	# plotting package, imported on first use
+	from vedo import Mesh, Points, Plotter
 
 	vertices = mesh.points()
 	faces = mesh.faces()
@@ -430,25 +458,8 @@ def plotSaveIndividual(mesh, latCoords, latVals, TrCoord, TrVal, latEst, latEstG
 
 
 def getPerspective(patient):
-	if patient == '033':
-		elev = 0
-		azimuth = 90
-		roll = 0
-	elif patient == '034':
-		elev = 0
-		azimuth = 120
-		roll = -45
-	elif patient == '035':
-		elev = 0
-		azimuth = 0
-		roll = 0
-	elif (patient == '037'):
-		elev = 0
-		azimuth = 160
-		roll = 0
-	else:
+	""" Plot view (elevation, azimuth, roll) of a patient's maps (datasets.VIEWS). """
+	if patient not in datasets.VIEWS:
 		print('no specified plot view for this patient')
-		elev = 0
-		azimuth = 0
-		roll = 0
-	return elev, azimuth, roll
\ No newline at end of file
+	elev, azimuth, roll = datasets.VIEWS.get(patient, (0, 0, 0))
+	return elev, azimuth, roll